@@ -1,5 +1,6 @@
 import streamlit as st
 from firebase_config import get_firestore_client
+from firestore_metrics import begin_render, render_debug_panel
 import time
 
 st.set_page_config(
@@ -28,6 +29,7 @@ if 'patient_logged_in' not in st.session_state:
 
 # --- Firebase Connection ---
 db = get_firestore_client()
+begin_render("app")
 
 # --- UI ---
 st.title("🏥 MedTree")
@@ -82,3 +84,6 @@ with login_tab2:
                         st.session_state.patient_name = patient_data.get('Name', 'Patient')
                         st.success("Login Successful!")
                         st.switch_page("pages/2_Patient_Dashboard.py")
+
+# --- Firestore usage for this render (debug panel with ?debug=firestore) ---
+render_debug_panel()
@@ -18,6 +18,12 @@ except ImportError:
     print("Error: Could not import get_firestore_client from firebase_config.")
     print("Please ensure firebase_config.py is in the parent directory.")
     sys.exit(1)
+try:
+    from vitals_series import MEASURES, parse_value, record as record_vitals
+except ImportError as e:
+    # Vitals are still stored without the time series
+    print(f"Warning: vitals time series disabled, could not import vitals_series: {e}")
+    MEASURES, record_vitals = {}, None
 
 
 # --- Flask App Initialization ---
@@ -65,8 +71,20 @@ def add_personal_details(user_id, name, age, dob, phone_no, address):
         print(f"Error adding personal details for {user_id}: {e}")
         return None
 
-def add_vitals(user_id, blood_group, weight, medical_conditions, allergies):
-    """Adds or updates a user's vitals."""
+def add_vitals(user_id, blood_group, weight, medical_conditions, allergies, readings=None):
+    """
+    Adds or updates a user's vitals and appends the weight and any other `readings` ({measure: value})
+    to their time series. Readings without a number are left out of the series; a failure to append
+    them is logged and does not fail the vitals write.
+    """
+    series = {}
+    if record_vitals is not None:
+        for measure, value in {'weight_kg': weight, **(readings or {})}.items():
+            parsed = parse_value(value)
+            if parsed is not None:
+                series[measure] = parsed
+            elif value is not None:
+                print(f"Skipping unreadable {measure} value {value!r} for user: {user_id}")
     try:
         doc_ref = db.collection('vitals').document(user_id)
         doc_ref.set({
@@ -74,10 +92,15 @@ def add_vitals(user_id, blood_group, weight, medical_conditions, allergies):
             'medical_conditions': medical_conditions, 'allergies': allergies
         })
         print(f"Successfully added/updated vitals for user: {user_id}")
-        return doc_ref
     except Exception as e:
         print(f"Error adding vitals for {user_id}: {e}")
         return None
+    if series:
+        try:
+            record_vitals(db, user_id, series)
+        except Exception as e:
+            print(f"Error appending vitals readings for {user_id}: {e}")
+    return doc_ref
 
 def add_prescription(user_id, condition, medicine, duration, remarks, dosage):
     """Adds a new prescription to a user's subcollection."""
@@ -185,7 +208,8 @@ def analyze_patient_data():
                              personal.get("phone_no"), personal.get("address"))
 
         add_vitals(user_id, vitals.get("blood_group"), vitals.get("weight"),
-                   vitals.get("medical_conditions"), vitals.get("allergies"))
+                   vitals.get("medical_conditions"), vitals.get("allergies"),
+                   {measure: vitals[measure] for measure in MEASURES if vitals.get(measure) is not None})
 
         prescription_ref = add_prescription(user_id, prescription.get("condition"), prescription.get("medicine"),
                                             prescription.get("duration"), prescription.get("remarks"), prescription.get("dosage"))
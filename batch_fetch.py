@@ -0,0 +1,51 @@
+# batch_fetch.py
+"""
+Batched multi-document fetches built on `get_all`, with request-scoped memoization.
+
+Create one FetchScope per page render; repeated lookups of the same document within that render
+are served from the scope, and lookups of many documents cost one round trip per chunk.
+"""
+from query_executor import run_concurrently
+
+# Documents requested per get_all call; larger requests are split and fetched concurrently.
+GET_ALL_CHUNK_SIZE = 100
+
+
+def get_documents(db, collection, doc_ids):
+    """Returns {doc_id: dict or None} for the given IDs of one collection, using batched get_all calls."""
+    doc_ids = list(dict.fromkeys(i for i in doc_ids if i))
+    if not doc_ids:
+        return {}
+    chunks = [doc_ids[i:i + GET_ALL_CHUNK_SIZE] for i in range(0, len(doc_ids), GET_ALL_CHUNK_SIZE)]
+
+    def fetch(chunk):
+        refs = [db.collection(collection).document(doc_id) for doc_id in chunk]
+        return {snap.id: (snap.to_dict() if snap.exists else None) for snap in db.get_all(refs)}
+
+    found = {}
+    for chunk_result in run_concurrently({i: (lambda chunk=chunk: fetch(chunk)) for i, chunk in enumerate(chunks)}).values():
+        found.update(chunk_result)
+    return {doc_id: found.get(doc_id) for doc_id in doc_ids}
+
+
+class FetchScope:
+    """Memoizes document lookups for the lifetime of one page render."""
+
+    def __init__(self, db):
+        self.db = db
+        self._memo = {}
+
+    def get_many(self, collection, doc_ids):
+        """Returns {doc_id: dict or None}, fetching only IDs not already seen in this scope."""
+        doc_ids = [i for i in dict.fromkeys(doc_ids) if i]
+        missing = [i for i in doc_ids if (collection, i) not in self._memo]
+        for doc_id, data in get_documents(self.db, collection, missing).items():
+            self._memo[(collection, doc_id)] = data
+        return {doc_id: self._memo[(collection, doc_id)] for doc_id in doc_ids}
+
+    def get(self, collection, doc_id):
+        return self.get_many(collection, [doc_id]).get(doc_id)
+
+    def prime(self, collection, doc_id, data):
+        """Records a document the page already has, so later lookups do not refetch it."""
+        self._memo[(collection, doc_id)] = data
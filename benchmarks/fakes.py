@@ -0,0 +1,186 @@
+# benchmarks/fakes.py
+"""
+Local stand-ins for MedTree's external services, used by benchmarks/loadtest.py.
+
+    Firestore       sqlite_store.SQLiteClient on a scratch file, or the Firestore emulator
+    Storage         local_blobs.LocalBucket on a scratch directory
+    Azure OpenAI    MockChatServer, an HTTP server speaking the chat-completions API with configurable latency
+    Azure Speech    FakeSpeechRecognizer, the recognize_once_async() surface with configurable latency
+"""
+import importlib.util
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+EMULATOR_PROJECT = "medtree-loadtest"
+
+
+def _latency_seconds(rng, mean_ms, jitter_ms):
+    return max(0.0, rng.gauss(mean_ms, jitter_ms)) / 1000
+
+
+# --- Azure OpenAI ---
+class MockChatServer:
+    """
+    Serves POST .../chat/completions (Azure `/openai/deployments/<name>/...` and plain `/v1/...`)
+    on 127.0.0.1 after sleeping for a normally distributed latency. Use as a context manager.
+    """
+
+    def __init__(self, latency_ms=800, jitter_ms=200, seed=0):
+        self.latency_ms, self.jitter_ms = latency_ms, jitter_ms
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if not self.path.split("?")[0].endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with server._lock:
+                    server.requests += 1
+                    delay = _latency_seconds(server._rng, server.latency_ms, server.jitter_ms)
+                time.sleep(delay)
+                payload = json.dumps(server.completion(body)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    @staticmethod
+    def completion(body):
+        prompt = " ".join(str(m.get("content", "")) for m in body.get("messages", []))
+        if "questions" in prompt:
+            content = "1. Any previous reactions to anaesthesia?\n2. Current medications?\n3. Bleeding disorders in the family?"
+        else:
+            content = "- Current medications recorded\n- Family history reviewed\n- No acute concerns noted"
+        prompt_tokens = len(prompt.split())
+        return {
+            "id": "chatcmpl-loadtest", "object": "chat.completion", "created": int(time.time()), "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content.split()), "total_tokens": prompt_tokens + len(content.split())},
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-chat", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+# --- Azure Speech ---
+class FakeResultReason:
+    RecognizedSpeech = "RecognizedSpeech"
+    NoMatch = "NoMatch"
+
+
+class FakeRecognitionResult:
+    def __init__(self, text):
+        self.text = text
+        self.reason = FakeResultReason.RecognizedSpeech if text else FakeResultReason.NoMatch
+
+
+class _ResultFuture:
+    def __init__(self, fn):
+        self._fn = fn
+
+    def get(self):
+        return self._fn()
+
+
+class FakeSpeechRecognizer:
+    """Returns canned transcripts from recognize_once_async().get() after a simulated recognition latency."""
+
+    TRANSCRIPTS = (
+        "I slept better last night and felt calmer this morning.",
+        "Work was stressful today and I could not focus.",
+        "Went for a walk with my family, mood has been steady.",
+    )
+
+    def __init__(self, latency_ms=300, jitter_ms=100, seed=0):
+        self.latency_ms, self.jitter_ms = latency_ms, jitter_ms
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def recognize_once_async(self):
+        def recognize():
+            with self._lock:
+                delay = _latency_seconds(self._rng, self.latency_ms, self.jitter_ms)
+                text = self._rng.choice(self.TRANSCRIPTS)
+            time.sleep(delay)
+            return FakeRecognitionResult(text)
+        return _ResultFuture(recognize)
+
+
+# --- Firestore / Storage ---
+def local_store(store, workdir):
+    """Returns a raw client for the scratch store: "sqlite" (a file in workdir) or "emulator" (FIRESTORE_EMULATOR_HOST)."""
+    if store == "emulator":
+        if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+            raise RuntimeError("Set FIRESTORE_EMULATOR_HOST (e.g. 127.0.0.1:8080) to load-test against the Firestore emulator")
+        from google.cloud import firestore
+        return firestore.Client(project=EMULATOR_PROJECT)
+    from sqlite_store import SQLiteClient
+    return SQLiteClient(os.path.join(workdir, "loadtest.sqlite3"))
+
+
+def local_bucket(workdir):
+    from local_blobs import LocalBucket
+    return LocalBucket(os.path.join(workdir, "blobs"))
+
+
+# --- Backends ---
+def configure_environment(workdir, chat_url, store="sqlite"):
+    """Points the app's configuration at the stand-ins; call before importing pages or backends."""
+    if store == "sqlite":
+        os.environ["MEDTREE_STORAGE"] = "sqlite"
+        os.environ["MEDTREE_SQLITE_PATH"] = os.path.join(workdir, "loadtest.sqlite3")
+    os.environ["MEDTREE_BLOB_DIR"] = os.path.join(workdir, "blobs")
+    os.environ["MEDTREE_SEARCH_INDEX"] = os.path.join(workdir, "search.sqlite3")
+    os.environ["MEDTREE_UPLOAD_STATE"] = os.path.join(workdir, "uploads.json")
+    os.environ["AZURE_OPENAI_API_KEY"] = "loadtest"
+    os.environ["AZURE_OPENAI_ENDPOINT"] = chat_url
+    os.environ["AZURE_OPENAI_DEPLOYMENT_NAME"] = "loadtest"
+
+
+def load_flask_app(relative_path, module_name):
+    """Imports a backend script by path (the backends are not packages) and returns its Flask app."""
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(ROOT, relative_path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.app
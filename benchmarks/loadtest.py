@@ -0,0 +1,315 @@
+# benchmarks/loadtest.py
+"""
+End-to-end load test of MedTree's data paths and backends against local stand-ins.
+
+Usage:
+    python benchmarks/loadtest.py [--patients 2000] [--users 8] [--duration 60] [--scenarios doctor,patient,maternity]
+                                  [--llm-latency-ms 800] [--speech-latency-ms 300] [--store sqlite|emulator] [--json]
+
+Nothing external is contacted (see benchmarks/fakes.py): Firestore is a scratch SQLite store or the
+emulator, seeded with a synthetic population; Storage is a scratch directory; Azure OpenAI is a
+mock chat-completions server; Azure Speech is a fake recognizer.
+
+Each scenario runs --users virtual users concurrently, all scenarios at once, each user repeating
+its scripted session for --duration seconds:
+    doctor     login, open a patient (load_patient_view), family history, hereditary risk,
+               AI analysis through backend/query.py, add a prescription
+    patient    login, dashboard (records + first notes page), re-categorize records, voice note
+               (recognizer + save), scan upload (blob + record)
+    maternity  patient lookup, history flags, prediction through backend/maternity_risk/app.py,
+               save the assessment
+
+Reported per scenario: sessions, sessions/s, errors, session and per-step latency percentiles,
+and Firestore reads/writes per session.
+"""
+import argparse
+import contextvars
+import datetime
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from fakes import FakeResultReason, FakeSpeechRecognizer, MockChatServer, configure_environment, load_flask_app, local_bucket, local_store
+
+SCENARIOS = ("doctor", "patient", "maternity")
+PROCEDURES = ("Knee arthroscopy", "Cataract surgery", "Appendectomy", "Dental extraction", "Colonoscopy")
+
+
+def percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return round(ordered[index], 1)
+
+
+class Recorder:
+    """Thread-safe latency samples per (scenario, step), plus per-session totals and errors."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.steps = defaultdict(list)
+        self.sessions = defaultdict(list)
+        self.errors = defaultdict(list)
+        self.io = defaultdict(lambda: {"reads": 0, "writes": 0})
+
+    def add_step(self, scenario, step, ms):
+        with self._lock:
+            self.steps[(scenario, step)].append(ms)
+
+    def add_session(self, scenario, ms, metrics):
+        with self._lock:
+            self.sessions[scenario].append(ms)
+            self.io[scenario]["reads"] += metrics.total("reads")
+            self.io[scenario]["writes"] += metrics.total("writes")
+
+    def add_error(self, scenario, step, error):
+        with self._lock:
+            self.errors[scenario].append(f"{step}: {type(error).__name__}: {error}")
+
+    def report(self, elapsed):
+        report = {}
+        for scenario, sessions in self.sessions.items():
+            count = len(sessions)
+            report[scenario] = {
+                "sessions": count,
+                "sessions_per_sec": round(count / elapsed, 2),
+                "errors": len(self.errors[scenario]),
+                "session_ms": {"p50": percentile(sessions, 50), "p90": percentile(sessions, 90), "p99": percentile(sessions, 99)},
+                "reads_per_session": round(self.io[scenario]["reads"] / count, 1) if count else 0,
+                "writes_per_session": round(self.io[scenario]["writes"] / count, 1) if count else 0,
+                "steps": {step: {"count": len(samples), "p50": percentile(samples, 50), "p90": percentile(samples, 90),
+                                 "p99": percentile(samples, 99), "max": round(max(samples), 1)}
+                          for (s, step), samples in self.steps.items() if s == scenario},
+                "sample_errors": self.errors[scenario][:5],
+            }
+        return report
+
+
+class Session:
+    """One run of a scripted session: times each step and stops at the first failure."""
+
+    def __init__(self, recorder, scenario, rng):
+        self.recorder, self.scenario, self.rng = recorder, scenario, rng
+        self.failed = False
+
+    @contextmanager
+    def step(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.failed = True
+            self.recorder.add_error(self.scenario, name, e)
+            raise
+        self.recorder.add_step(self.scenario, name, (time.perf_counter() - started) * 1000)
+
+
+# --- Scenarios ---
+def doctor_session(ctx, s):
+    from family_history import get_family_history
+    from hereditary_risk import get_hereditary_risk
+    from patient_repository import add_record, load_patient_view
+    from condition_vocabulary import normalize
+
+    db = ctx["db"]
+    with s.step("login"):
+        assert db.collection("doctors").document(s.rng.choice(ctx["doctor_ids"])).get().exists
+    patient_id = s.rng.choice(ctx["patient_ids"])
+    with s.step("open_patient"):
+        view = load_patient_view(db, patient_id)
+    patient = view["patient"] or {}
+    with s.step("family_history"):
+        history = get_family_history(db, patient_id, patient.get("family_groups", []))
+    with s.step("hereditary_risk"):
+        scores = get_hereditary_risk(db, patient_id, patient.get("family_groups", []))
+    payload = {"patient_data": {
+        "patient_conditions": [a["description"] for a in view["allergies_and_conditions"] if a.get("category", "Green") in ("Green", "Yellow")],
+        "patient_medications": [p["medication_name"] for p in view["prescriptions"] if p.get("category", "Green") in ("Green", "Yellow")],
+        "family_history": {"conditions": history["conditions"], "kinship_weighted_prevalence": scores[:10]},
+    }, "procedure": s.rng.choice(PROCEDURES)}
+    with s.step("ai_analyze"):
+        response = ctx["query_app"].test_client().post("/api/medical/analyze", json=payload)
+        assert response.status_code == 200, response.get_json()
+    with s.step("add_prescription"):
+        add_record(db, "prescriptions", {"patient_id": patient_id, "medication_name": "Paracetamol", "condition": "Migraine", "condition_code": normalize("Migraine"),
+                                         "duration": "7 days", "timing": ["Morning"], "category": "Green", "timestamp": datetime.datetime.now()})
+
+
+def patient_session(ctx, s):
+    from google.cloud.firestore_v1.base_query import FieldFilter
+    from pagination import load_page
+    from patient_repository import add_record, load_patient_view, update_records
+
+    db = ctx["db"]
+    patient_id = s.rng.choice(ctx["patient_ids"])
+    with s.step("login"):
+        assert db.collection("patients").document(patient_id).get().exists
+    notes_query = db.collection("mental_health_notes").where(filter=FieldFilter("patient_id", "==", patient_id))
+    with s.step("dashboard"):
+        view = load_patient_view(db, patient_id, extra_queries={"notes": lambda: load_page(notes_query, "timestamp", 10)})
+    records = [(c, r["id"]) for c in ("prescriptions", "allergies_and_conditions", "scans") for r in view[c]]
+    if records:
+        with s.step("recategorize"):
+            picked = s.rng.sample(records, min(len(records), s.rng.randint(1, 3)))
+            update_records(db, patient_id, [(c, doc_id, {"category": s.rng.choice(("Green", "Yellow", "Red"))}) for c, doc_id in picked])
+    with s.step("voice_note"):
+        result = ctx["recognizer"].recognize_once_async().get()
+        assert result.reason == FakeResultReason.RecognizedSpeech
+        db.collection("mental_health_notes").add({"patient_id": patient_id, "note": result.text, "timestamp": datetime.datetime.now()})
+    with s.step("upload_scan"):
+        name = f"scan_{s.rng.randrange(10 ** 9):09d}.png"
+        blob = ctx["bucket"].blob(f"scans/{patient_id}/{name}")
+        blob.upload_from_file(io.BytesIO(ctx["scan_bytes"]), content_type="image/png")
+        blob.make_public()
+        add_record(db, "scans", {"patient_id": patient_id, "body_part": "Chest", "file_url": blob.public_url, "category": "Green", "timestamp": datetime.datetime.now()})
+
+
+def maternity_session(ctx, s):
+    from condition_vocabulary import maternity_history_flags
+    from patient_repository import get_collection_records, get_patient
+
+    db = ctx["db"]
+    patient_id = s.rng.choice(ctx["maternity_ids"] or ctx["patient_ids"])
+    with s.step("lookup"):
+        patient = get_patient(db, patient_id) or {}
+        conditions = [c.get("description", "") for c in get_collection_records(db, "allergies_and_conditions", patient_id)]
+    flags = maternity_history_flags(conditions)
+    try:
+        age = (datetime.datetime.now() - datetime.datetime.strptime(patient.get("DOB", "1990-01-01"), "%Y-%m-%d")).days // 365
+    except ValueError:
+        age = 25
+    assessment_data = {"age": age, "bmi": 22.0, "blood_pressure": 120, "hemoglobin": 12.0, "glucose": 90, "parity": 0,
+                       "education": "Graduate", "smoking": "No", "income": "Middle", **flags}
+    with s.step("predict"):
+        response = ctx["maternity_app"].test_client().post("/predict", json=assessment_data)
+        result = response.get_json()
+        assert "prediction" in result, result.get("error")
+    with s.step("save_assessment"):
+        db.collection("maternity_assessments").add({"patient_id": patient_id, "assessment_date": datetime.datetime.now(), "predictions": result["prediction"],
+                                                    "explanations": result.get("explanation_top_features", {}), "assessed_by": "Load Test", "assessment_data": assessment_data})
+
+
+SESSIONS = {"doctor": doctor_session, "patient": patient_session, "maternity": maternity_session}
+
+
+# --- Driver ---
+def virtual_user(ctx, recorder, scenario, user, deadline):
+    from firestore_metrics import begin_render
+    rng = random.Random(f"{ctx['seed']}:{scenario}:{user}")
+    while time.perf_counter() < deadline:
+        s = Session(recorder, scenario, rng)
+        started = time.perf_counter()
+        # Each session gets its own metrics context, like a page run
+        context = contextvars.copy_context()
+        metrics = context.run(begin_render, f"loadtest:{scenario}")
+        try:
+            context.run(SESSIONS[scenario], ctx, s)
+        except Exception as e:
+            if not s.failed:
+                recorder.add_error(scenario, "session", e)
+            continue
+        recorder.add_session(scenario, (time.perf_counter() - started) * 1000, metrics)
+
+
+def prepare(args, workdir):
+    """Seeds the scratch store and builds the shared context for the sessions."""
+    from firestore_metrics import InstrumentedClient
+    from synthetic_population import generate, write_store
+
+    raw_db = local_store(args.store, workdir)
+    if not list(raw_db.collection("patients").limit(1).stream()):
+        started = time.perf_counter()
+        count = write_store(generate(args.patients, seed=args.seed), raw_db)
+        print(f"Seeded {count:,} documents for {args.patients:,} patients in {time.perf_counter() - started:.1f}s")
+    patient_ids = [doc.id for doc in raw_db.collection("patients").select([]).stream()]
+    maternity_ids = sorted({doc.to_dict()["patient_id"] for doc in raw_db.collection("maternity_assessments").select(["patient_id"]).stream()})
+    ctx = {
+        "db": InstrumentedClient(raw_db),
+        "seed": args.seed,
+        "patient_ids": patient_ids,
+        "maternity_ids": maternity_ids,
+        "doctor_ids": [doc.id for doc in raw_db.collection("doctors").select([]).stream()],
+        "bucket": local_bucket(workdir),
+        "recognizer": FakeSpeechRecognizer(args.speech_latency_ms, args.speech_latency_ms / 3, seed=args.seed),
+        "scan_bytes": os.urandom(args.scan_kb * 1024),
+    }
+    if "doctor" in args.scenarios:
+        ctx["query_app"] = load_flask_app("backend/query.py", "loadtest_query_backend")
+    if "maternity" in args.scenarios:
+        ctx["maternity_app"] = load_flask_app("backend/maternity_risk/app.py", "loadtest_maternity_backend")
+    return ctx
+
+
+@contextmanager
+def scratch_directory(path=None):
+    if path:
+        os.makedirs(path, exist_ok=True)
+        yield path
+        return
+    with tempfile.TemporaryDirectory(prefix="medtree-loadtest-") as workdir:
+        yield workdir
+
+
+def print_report(report, elapsed, chat_requests):
+    print(f"\n{elapsed:.1f}s, {chat_requests} mock chat completions")
+    for scenario, r in report.items():
+        print(f"\n{scenario}: {r['sessions']} sessions ({r['sessions_per_sec']}/s), {r['errors']} errors, "
+              f"{r['reads_per_session']} reads + {r['writes_per_session']} writes per session")
+        print(f"  {'session':<18}{'':>8}{r['session_ms']['p50']:>10}{r['session_ms']['p90']:>10}{r['session_ms']['p99']:>10}")
+        print(f"  {'step':<18}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for step, stats in r["steps"].items():
+            print(f"  {step:<18}{stats['count']:>8}{stats['p50']:>10}{stats['p90']:>10}{stats['p99']:>10}{stats['max']:>10}")
+        for error in r["sample_errors"]:
+            print(f"  error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test MedTree's data paths and backends against local stand-ins.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated subset of {', '.join(SCENARIOS)}.")
+    parser.add_argument("--users", type=int, default=8, help="Concurrent virtual users per scenario.")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds each virtual user keeps starting sessions.")
+    parser.add_argument("--patients", type=int, default=2000, help="Synthetic population size for a fresh store.")
+    parser.add_argument("--seed", default=42)
+    parser.add_argument("--store", choices=["sqlite", "emulator"], default="sqlite")
+    parser.add_argument("--workdir", help="Scratch directory (kept, and reused if already seeded). Default: a temporary directory.")
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--llm-jitter-ms", type=float, default=200)
+    parser.add_argument("--speech-latency-ms", type=float, default=300)
+    parser.add_argument("--scan-kb", type=int, default=256, help="Size of each uploaded scan.")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args()
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    with scratch_directory(args.workdir) as workdir:
+        with MockChatServer(args.llm_latency_ms, args.llm_jitter_ms, seed=args.seed) as chat:
+            configure_environment(workdir, chat.url, args.store)
+            ctx = prepare(args, workdir)
+            recorder = Recorder()
+            started = time.perf_counter()
+            deadline = started + args.duration
+            with ThreadPoolExecutor(max_workers=args.users * len(args.scenarios), thread_name_prefix="vu") as executor:
+                futures = [executor.submit(virtual_user, ctx, recorder, scenario, user, deadline)
+                           for scenario in args.scenarios for user in range(args.users)]
+                for future in futures:
+                    future.result()
+            elapsed = time.perf_counter() - started
+            report = recorder.report(elapsed)
+            if args.json:
+                print(json.dumps({"elapsed_s": round(elapsed, 1), "chat_requests": chat.requests, "scenarios": report}, indent=2))
+            else:
+                print_report(report, elapsed, chat.requests)
+
+
+if __name__ == "__main__":
+    main()
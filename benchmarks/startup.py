@@ -0,0 +1,111 @@
+# benchmarks/startup.py
+"""
+Cold-start and first-render benchmark for app.py and each page.
+
+Usage:
+    python benchmarks/startup.py [--runs 5] [--patient-id PAT-...] [--json]
+
+Each script is measured in a fresh interpreter so module imports and client creation are cold:
+    streamlit_import_ms  importing streamlit itself
+    first_render_ms      first run through streamlit.testing's AppTest (imports, client setup, reads)
+    rerun_ms             median of the following reruns in the same process (shared clients, warm caches)
+    modules_loaded       modules imported by the first render
+
+Pages run with a logged-in session (patient pages as --patient-id). Firebase credentials are the
+app's own (FIREBASE_SERVICE_ACCOUNT_JSON or .streamlit/secrets.toml), so reads hit that project.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = ("app.py", "pages/1_Doctor_Dashboard.py", "pages/2_Patient_Dashboard.py", "pages/3_Mental_Health_Notes.py")
+
+
+def session_for(script, args):
+    if "Doctor" in script:
+        return {"doctor_logged_in": True, "doctor_name": "Benchmark"}
+    if script.startswith("pages/"):
+        return {"patient_logged_in": True, "patient_id": args.patient_id, "patient_name": "Benchmark"}
+    return {}
+
+
+def measure(script, args):
+    """Runs inside the child interpreter: returns the timings of one script."""
+    started = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    streamlit_import_ms = (time.perf_counter() - started) * 1000
+
+    at = AppTest.from_file(os.path.join(ROOT, script), default_timeout=args.timeout)
+    for key, value in session_for(script, args).items():
+        at.session_state[key] = value
+    modules_before = len(sys.modules)
+    started = time.perf_counter()
+    at.run()
+    first_render_ms = (time.perf_counter() - started) * 1000
+    modules_loaded = len(sys.modules) - modules_before
+
+    reruns = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        at.run()
+        reruns.append((time.perf_counter() - started) * 1000)
+    return {
+        "script": script,
+        "streamlit_import_ms": round(streamlit_import_ms, 1),
+        "first_render_ms": round(first_render_ms, 1),
+        "rerun_ms": round(statistics.median(reruns), 1) if reruns else None,
+        "modules_loaded": modules_loaded,
+        "exceptions": [e.value for e in at.exception],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold start and first render of each Streamlit script.")
+    parser.add_argument("--runs", type=int, default=5, help="Warm reruns per script after the first render.")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--patient-id", default=os.getenv("BENCHMARK_PATIENT_ID", "PAT-BENCH"))
+    parser.add_argument("--script", help=argparse.SUPPRESS)  # used by the per-script child process
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines.")
+    args = parser.parse_args()
+
+    if args.script:
+        os.chdir(ROOT)
+        sys.path.insert(0, ROOT)
+        print(json.dumps(measure(args.script, args)))
+        return
+
+    results = []
+    for script in SCRIPTS:
+        child = [sys.executable, os.path.abspath(__file__), "--script", script, "--runs", str(args.runs),
+                 "--timeout", str(args.timeout), "--patient-id", args.patient_id]
+        started = time.perf_counter()
+        completed = subprocess.run(child, capture_output=True, text=True, cwd=ROOT)
+        process_ms = round((time.perf_counter() - started) * 1000, 1)
+        try:
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+        except (IndexError, json.JSONDecodeError):
+            result = {"script": script, "error": completed.stderr.strip().splitlines()[-1:] or ["no output"]}
+        result["process_ms"] = process_ms
+        results.append(result)
+
+    if args.json:
+        for result in results:
+            print(json.dumps(result))
+        return
+    print(f"{'script':<34}{'streamlit':>11}{'first':>10}{'rerun':>10}{'process':>10}{'modules':>9}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['script']:<34}  error: {r['error'][0]}")
+            continue
+        print(f"{r['script']:<34}{r['streamlit_import_ms']:>9} ms{r['first_render_ms']:>7} ms{r['rerun_ms']:>7} ms{r['process_ms']:>7} ms{r['modules_loaded']:>9}")
+        for exception in r["exceptions"]:
+            print(f"    exception: {exception}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+# bulk_load.py
+"""
+Streaming bulk ingestion of NDJSON / CSV rows into the app's collections.
+
+Usage:
+    python bulk_load.py patients.ndjson [--checkpoint patients.ndjson.checkpoint] [--no-rebuild-snapshots]
+    python bulk_load.py prescriptions.csv --collection prescriptions [--id-column rx_id]
+
+Each input row becomes one document. Rows name their target with reserved keys (CSV columns or
+NDJSON fields), which are stripped from the stored data:
+    _collection   collection name (default: --collection)
+    _id           document ID (default: the --id-column value, else a stable ID derived from the
+                  input file and row number, so re-running a range never duplicates documents)
+    _path         full document path instead of the two above, e.g. family_groups/G1/members/PAT-1
+
+Rows are mapped onto the app's conventions as they stream: ISO strings in timestamp fields become
+datetimes, JSON arrays/objects in CSV cells are parsed, and conditions and prescriptions get a
+`condition_code` from the condition vocabulary when they lack one.
+
+Writes go through Firestore's BulkWriter (parallel in-flight batches, ramped rate limit, exponential
+retry of throttled or unavailable writes) or, with the SQLite backend, through batched commits on a
+thread pool. The number of rows processed is checkpointed every --checkpoint-every rows, and a
+restarted load resumes after the last checkpoint. Rows whose writes still fail after retrying are
+appended to a retry file (default: <source>.failed.ndjson) in this same input format, so they can
+be loaded again with `python bulk_load.py <source>.failed.ndjson`. Progress and docs/sec are
+printed as it runs.
+
+Bulk writes bypass `patient_snapshot`, so the snapshots of every patient the load touched are
+rebuilt when it finishes (or stops); --no-rebuild-snapshots skips this for loads followed by
+`python patient_snapshot.py --backfill`.
+"""
+import argparse
+import csv
+import datetime
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from condition_vocabulary import normalize
+
+TIMESTAMP_FIELDS = ("timestamp", "created_at", "added_at", "assessment_date", "date_issued", "date_recorded", "recorded_at", "updated_at")
+CONDITION_FIELDS = {"allergies_and_conditions": "description", "prescriptions": "condition"}
+RECORD_COLLECTIONS = ("prescriptions", "allergies_and_conditions", "scans")
+# gRPC status codes worth retrying: DEADLINE_EXCEEDED, RESOURCE_EXHAUSTED, ABORTED, INTERNAL, UNAVAILABLE
+RETRYABLE_CODES = {4, 8, 10, 13, 14}
+MAX_ATTEMPTS = 10
+BATCH_SIZE = 500
+
+
+# --- Input ---
+def read_rows(path, fmt=None):
+    """Yields dict rows from an NDJSON or CSV file without loading it into memory."""
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "ndjson")
+    with open(path, newline="" if fmt == "csv" else None, encoding="utf-8") as f:
+        if fmt == "csv":
+            for row in csv.DictReader(f):
+                yield {key: _parse_cell(value) for key, value in row.items() if value not in (None, "")}
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def _parse_cell(value):
+    if value[:1] in "[{":
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    return value
+
+
+def _parse_timestamp(value):
+    if isinstance(value, str):
+        try:
+            parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return value
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+# --- Mapping ---
+def document_path(row, row_number, source, default_collection=None, id_column=None):
+    """Returns the target document path for a row (reserved keys are removed from `row`)."""
+    path = row.pop("_path", None)
+    collection = row.pop("_collection", None) or default_collection
+    doc_id = row.pop("_id", None) or (row.get(id_column) if id_column else None)
+    if path:
+        return path
+    if not collection:
+        raise ValueError(f"Row {row_number} has no _collection or _path and no --collection was given")
+    if not doc_id:
+        doc_id = hashlib.sha1(f"{os.path.basename(source)}:{row_number}".encode()).hexdigest()[:20]
+    return f"{collection}/{doc_id}"
+
+
+def prepare(collection, data):
+    """Applies the app's field conventions to one row."""
+    for field in TIMESTAMP_FIELDS:
+        if field in data:
+            data[field] = _parse_timestamp(data[field])
+    source_field = CONDITION_FIELDS.get(collection)
+    if source_field and data.get(source_field) and "condition_code" not in data:
+        code = normalize(data[source_field])
+        if code:
+            data["condition_code"] = code
+    return data
+
+
+# --- Writers ---
+class FirestoreBulkLoader:
+    """Wraps Firestore's BulkWriter with throttling-aware exponential retry and outcome counters."""
+
+    def __init__(self, db, max_ops_per_second):
+        from google.cloud.firestore_v1.bulk_writer import BulkRetry, BulkWriterOptions
+        options = BulkWriterOptions(initial_ops_per_second=min(500, max_ops_per_second), max_ops_per_second=max_ops_per_second, retry=BulkRetry.exponential)
+        self.writer = db.bulk_writer(options=options)
+        self.db = db
+        self.written = 0
+        self.failed = []
+        self._lock = threading.Lock()
+        self.writer.on_write_result(self._on_result)
+        self.writer.on_write_error(self._on_error)
+
+    def _on_result(self, reference, result, writer):
+        with self._lock:
+            self.written += 1
+
+    def _on_error(self, failure, writer):
+        if failure.code in RETRYABLE_CODES and failure.attempts < MAX_ATTEMPTS:
+            return True
+        with self._lock:
+            self.failed.append((failure.operation.reference.path, failure.message))
+        return False
+
+    def set(self, path, data):
+        self.writer.set(self.db.document(path), data)
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        self.writer.close()
+
+
+class BatchedLoader:
+    """BulkLoader equivalent for clients without bulk_writer: 500-write batches committed on a thread pool."""
+
+    def __init__(self, db, workers=4):
+        self.db = db
+        self.written = 0
+        self.failed = []
+        self._pending = []
+        self._futures = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-load")
+
+    def _commit(self, ops):
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                batch = self.db.batch()
+                for path, data in ops:
+                    batch.set(self.db.document(path), data)
+                batch.commit()
+                with self._lock:
+                    self.written += len(ops)
+                return
+            except Exception as e:
+                if attempt == MAX_ATTEMPTS:
+                    with self._lock:
+                        self.failed.extend((path, str(e)) for path, _ in ops)
+                    return
+                time.sleep(min(2 ** attempt * 0.05, 5))
+
+    def set(self, path, data):
+        self._pending.append((path, data))
+        if len(self._pending) >= BATCH_SIZE:
+            self._futures.append(self._executor.submit(self._commit, self._pending))
+            self._pending = []
+
+    def flush(self):
+        if self._pending:
+            self._futures.append(self._executor.submit(self._commit, self._pending))
+            self._pending = []
+        for future in self._futures:
+            future.result()
+        self._futures = []
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown()
+
+
+# --- Checkpoint ---
+def load_checkpoint(path, source):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            state = json.load(f)
+        if state.get("source") == os.path.abspath(source):
+            return state.get("rows_done", 0)
+    return 0
+
+
+def save_checkpoint(path, source, rows_done, written):
+    if not path:
+        return
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"source": os.path.abspath(source), "rows_done": rows_done, "written": written, "saved_at": time.time()}, f)
+    os.replace(tmp, path)
+
+
+# --- Retry file ---
+def save_failed_rows(path, rows, failed):
+    """Appends the input rows of failed writes ({path: row}) to the retry file; returns how many."""
+    lines = [json.dumps(rows[doc_path], default=str) for doc_path, _ in failed if doc_path in rows]
+    if lines:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+    return len(lines)
+
+
+# --- Run ---
+def run(db, source, collection=None, id_column=None, fmt=None, checkpoint=None, checkpoint_every=5000,
+        max_ops_per_second=10000, workers=4, progress_every=5.0, rebuild_snapshots=True, retry_file=None):
+    """
+    Streams `source` into the store. Returns {"rows", "written", "failed", "seconds", "docs_per_sec", "retry_file"}.
+    Rows that fail are kept in `retry_file` (default: <source>.failed.ndjson) rather than being lost
+    behind the checkpoint.
+    """
+    from firestore_metrics import unwrap
+    client = unwrap(db)
+    loader = FirestoreBulkLoader(client, max_ops_per_second) if hasattr(client, "bulk_writer") else BatchedLoader(client, workers)
+    skip = load_checkpoint(checkpoint, source)
+    retry_file = retry_file or f"{source}.failed.ndjson"
+    if skip:
+        print(f"Resuming after row {skip}")
+    elif os.path.exists(retry_file):
+        os.remove(retry_file)
+
+    started = last_report = time.perf_counter()
+    last_written = 0
+    rows_done = skip
+    touched_patients = set()
+    in_flight = {}  # path -> input row, for the rows written since the last flush
+    failures_saved = retried = 0
+
+    def flush():
+        # Failed rows are saved before the checkpoint moves past them
+        nonlocal failures_saved, retried
+        loader.flush()
+        retried += save_failed_rows(retry_file, in_flight, loader.failed[failures_saved:])
+        failures_saved = len(loader.failed)
+        in_flight.clear()
+
+    try:
+        for row_number, row in enumerate(read_rows(source, fmt)):
+            if row_number < skip:
+                continue
+            path = document_path(row, row_number, source, collection, id_column)
+            in_flight[path] = dict(row, _path=path)
+            target_collection = path.split("/")[-2]
+            loader.set(path, prepare(target_collection, row))
+            if target_collection == "patients":
+                touched_patients.add(path.split("/")[-1])
+            elif target_collection in RECORD_COLLECTIONS and row.get("patient_id"):
+                touched_patients.add(row["patient_id"])
+            rows_done = row_number + 1
+
+            if rows_done % checkpoint_every == 0:
+                flush()
+                save_checkpoint(checkpoint, source, rows_done, loader.written)
+            now = time.perf_counter()
+            if now - last_report >= progress_every:
+                rate = (loader.written - last_written) / (now - last_report)
+                print(f"rows {rows_done:,}  written {loader.written:,}  failed {len(loader.failed):,}  {rate:,.0f} docs/s  (avg {loader.written / (now - started):,.0f} docs/s)")
+                last_report, last_written = now, loader.written
+    finally:
+        flush()
+        loader.close()
+        save_checkpoint(checkpoint, source, rows_done, loader.written)
+        if rebuild_snapshots and touched_patients:
+            # Bulk writes bypass patient_snapshot, so rebuild the snapshots of every patient touched,
+            # also when the load stops early, since a resumed load only sees the rows after the checkpoint
+            import patient_snapshot
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                rebuilt = sum(executor.map(lambda pid: patient_snapshot.rebuild(db, pid), sorted(touched_patients)))
+            print(f"Rebuilt {rebuilt} patient snapshots")
+
+    elapsed = time.perf_counter() - started
+    summary = {"rows": rows_done - skip, "written": loader.written, "failed": len(loader.failed), "seconds": round(elapsed, 1),
+               "docs_per_sec": round(loader.written / elapsed, 1) if elapsed else 0.0, "retry_file": retry_file if retried else None}
+    print(f"Loaded {summary['written']:,} documents from {summary['rows']:,} rows in {summary['seconds']}s ({summary['docs_per_sec']:,} docs/s), {summary['failed']} failed")
+    for path, message in loader.failed[:20]:
+        print(f"  failed {path}: {message}", file=sys.stderr)
+    if retried:
+        print(f"{retried:,} failed rows saved to {retry_file}; load them again with: python bulk_load.py {retry_file}", file=sys.stderr)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream NDJSON/CSV rows into the app's collections.")
+    parser.add_argument("source", help="Input file (.ndjson / .jsonl / .csv).")
+    parser.add_argument("--format", choices=["ndjson", "csv"], help="Input format (default: from the file extension).")
+    parser.add_argument("--collection", help="Collection for rows without _collection/_path.")
+    parser.add_argument("--id-column", help="Field to use as document ID when a row has no _id.")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <source>.checkpoint).")
+    parser.add_argument("--checkpoint-every", type=int, default=5000, help="Rows between flush + checkpoint.")
+    parser.add_argument("--max-ops", type=int, default=10000, help="BulkWriter max writes per second.")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel batch commits (SQLite backend) and snapshot rebuilds.")
+    parser.add_argument("--retry-file", help="File that collects rows whose writes failed (default: <source>.failed.ndjson).")
+    parser.add_argument("--no-rebuild-snapshots", dest="rebuild_snapshots", action="store_false",
+                        help="Skip rebuilding the snapshots of touched patients afterwards.")
+    args = parser.parse_args()
+
+    from firebase_config import get_firestore_client
+    run(get_firestore_client(), args.source, collection=args.collection, id_column=args.id_column, fmt=args.format,
+        checkpoint=args.checkpoint or f"{args.source}.checkpoint", checkpoint_every=args.checkpoint_every,
+        max_ops_per_second=args.max_ops, workers=args.workers, rebuild_snapshots=args.rebuild_snapshots,
+        retry_file=args.retry_file)
@@ -0,0 +1,288 @@
+# condition_vocabulary.py
+"""
+Canonical condition vocabulary with a precomputed normalization index.
+
+Free-text condition descriptions are mapped to canonical (ICD-10 style) codes through, in order:
+an exact synonym/abbreviation table, a token trie that finds known phrases inside longer text,
+and a character-trigram index for misspellings. Negated mentions ("no history of GDM") and
+mentions attributed to relatives ("mother had preeclampsia") are not coded. Results are memoized,
+so repeated lookups are dictionary hits.
+
+Backfill existing records:
+    python condition_vocabulary.py --backfill [--dry-run]
+"""
+import argparse
+import re
+from collections import defaultdict
+from functools import lru_cache
+
+# --- Vocabulary ---
+# code: (canonical label, [synonyms and abbreviations])
+VOCABULARY = {
+    'E11': ("Type 2 diabetes", ["type 2 diabetes", "type ii diabetes", "t2dm", "t2d", "dm2", "diabetes mellitus type 2", "diabetes type 2", "diabetes type ii", "type 2 diabetes mellitus", "type 2 dm", "diabetes", "diabetes mellitus", "dm", "high blood sugar", "adult onset diabetes"]),
+    'E10': ("Type 1 diabetes", ["type 1 diabetes", "type i diabetes", "diabetes type 1", "diabetes type i", "diabetes mellitus type 1", "type 1 diabetes mellitus", "type 1 dm", "t1dm", "t1d", "dm1", "juvenile diabetes", "insulin dependent diabetes", "iddm"]),
+    'O24.4': ("Gestational diabetes", ["gestational diabetes", "gdm", "gestational diabetes mellitus", "pregnancy diabetes", "diabetes in pregnancy"]),
+    'R73.03': ("Prediabetes", ["prediabetes", "pre diabetes", "impaired glucose tolerance", "igt", "impaired fasting glucose"]),
+    'I10': ("Hypertension", ["hypertension", "htn", "high blood pressure", "high bp", "elevated blood pressure", "essential hypertension"]),
+    'O14': ("Preeclampsia", ["preeclampsia", "pre eclampsia", "toxemia of pregnancy", "pregnancy induced hypertension", "pih", "eclampsia", "hellp syndrome"]),
+    'O60': ("Preterm labor", ["preterm labor", "preterm labour", "premature labor", "premature birth", "preterm birth", "preterm delivery", "ptl", "premature delivery"]),
+    'D64.9': ("Anemia", ["anemia", "anaemia", "low hemoglobin", "low haemoglobin", "low hb"]),
+    'D50': ("Iron deficiency anemia", ["iron deficiency anemia", "iron deficiency anaemia", "ida", "iron deficiency"]),
+    'D57': ("Sickle cell disease", ["sickle cell disease", "sickle cell anemia", "scd", "sickle cell"]),
+    'D56': ("Thalassemia", ["thalassemia", "thalassaemia", "beta thalassemia", "alpha thalassemia"]),
+    'J45': ("Asthma", ["asthma", "bronchial asthma", "reactive airway disease"]),
+    'J44': ("COPD", ["copd", "chronic obstructive pulmonary disease", "emphysema", "chronic bronchitis"]),
+    'E66': ("Obesity", ["obesity", "obese", "overweight", "morbid obesity"]),
+    'E78': ("Hyperlipidemia", ["hyperlipidemia", "high cholesterol", "hypercholesterolemia", "dyslipidemia", "high ldl"]),
+    'E03.9': ("Hypothyroidism", ["hypothyroidism", "underactive thyroid", "low thyroid", "hashimoto", "hashimotos thyroiditis"]),
+    'E05': ("Hyperthyroidism", ["hyperthyroidism", "overactive thyroid", "graves disease", "graves"]),
+    'I25': ("Coronary artery disease", ["coronary artery disease", "cad", "ischemic heart disease", "ihd", "heart disease", "angina"]),
+    'I21': ("Myocardial infarction", ["myocardial infarction", "mi", "heart attack"]),
+    'I64': ("Stroke", ["stroke", "cva", "cerebrovascular accident", "brain stroke"]),
+    'I50': ("Heart failure", ["heart failure", "chf", "congestive heart failure"]),
+    'N18': ("Chronic kidney disease", ["chronic kidney disease", "ckd", "renal failure", "kidney disease"]),
+    'K76.0': ("Fatty liver disease", ["fatty liver", "nafld", "fatty liver disease", "hepatic steatosis"]),
+    'G40': ("Epilepsy", ["epilepsy", "seizure disorder", "seizures", "fits"]),
+    'G43': ("Migraine", ["migraine", "migraines", "migraine headache"]),
+    'F32': ("Depression", ["depression", "major depressive disorder", "mdd", "depressive disorder"]),
+    'F41': ("Anxiety disorder", ["anxiety", "anxiety disorder", "gad", "generalized anxiety disorder", "panic disorder"]),
+    'F31': ("Bipolar disorder", ["bipolar disorder", "bipolar", "manic depression"]),
+    'F20': ("Schizophrenia", ["schizophrenia"]),
+    'G30': ("Alzheimer's disease", ["alzheimers", "alzheimers disease", "alzheimer disease", "dementia"]),
+    'G20': ("Parkinson's disease", ["parkinsons", "parkinsons disease", "parkinson disease"]),
+    'C50': ("Breast cancer", ["breast cancer", "breast carcinoma", "carcinoma of breast"]),
+    'C18': ("Colorectal cancer", ["colorectal cancer", "colon cancer", "bowel cancer", "rectal cancer"]),
+    'C61': ("Prostate cancer", ["prostate cancer", "carcinoma of prostate"]),
+    'C56': ("Ovarian cancer", ["ovarian cancer"]),
+    'M06': ("Rheumatoid arthritis", ["rheumatoid arthritis", "ra"]),
+    'M19': ("Osteoarthritis", ["osteoarthritis", "oa", "arthritis", "degenerative joint disease"]),
+    'M81': ("Osteoporosis", ["osteoporosis"]),
+    'E28.2': ("Polycystic ovary syndrome", ["polycystic ovary syndrome", "pcos", "pcod", "polycystic ovaries"]),
+    'K90.0': ("Celiac disease", ["celiac disease", "coeliac disease", "celiac", "coeliac", "gluten intolerance"]),
+    'L20': ("Atopic dermatitis", ["atopic dermatitis", "eczema"]),
+    'L40': ("Psoriasis", ["psoriasis"]),
+    'E84': ("Cystic fibrosis", ["cystic fibrosis", "cf"]),
+    'D66': ("Hemophilia", ["hemophilia", "haemophilia"]),
+    'J30.1': ("Pollen allergy", ["pollen allergy", "hay fever", "hayfever", "allergic rhinitis", "pollen", "seasonal allergies"]),
+    'Z91.010': ("Peanut allergy", ["peanut allergy", "peanuts", "peanut", "nut allergy"]),
+    'Z88.0': ("Penicillin allergy", ["penicillin allergy", "allergic to penicillin", "penicillin", "amoxicillin allergy"]),
+    'Z88.2': ("Sulfonamide allergy", ["sulfa allergy", "sulfonamide allergy", "sulpha allergy", "sulfa drugs"]),
+    'Z91.012': ("Egg allergy", ["egg allergy", "eggs"]),
+    'Z91.011': ("Milk allergy", ["milk allergy", "dairy allergy", "lactose intolerance"]),
+    'Z91.013': ("Seafood allergy", ["seafood allergy", "shellfish allergy", "fish allergy", "shellfish"]),
+    'Z91.030': ("Bee sting allergy", ["bee sting allergy", "bee allergy", "insect sting allergy"]),
+    'Z91.048': ("Latex allergy", ["latex allergy", "allergic to latex", "latex sensitivity"]),
+    'T78.40': ("Dust allergy", ["dust allergy", "dust mite allergy", "allergic to dust", "dust mites"]),
+}
+
+# Maternity model features derived from a patient's coded conditions
+MATERNITY_HISTORY_FLAGS = {
+    'history_gdm': {'O24.4'},
+    'history_preeclampsia': {'O14'},
+    'history_anemia': {'D64.9', 'D50', 'D57', 'D56'},
+    'history_preterm': {'O60'},
+}
+
+FUZZY_THRESHOLD = 0.6
+# A negation cue drops the mentions after it in its clause ("no history of GDM", "denies PIH");
+# a relative or family-history cue drops the whole clause ("mother had preeclampsia").
+NEGATION_CUES = {'no', 'not', 'denies', 'denied', 'deny', 'negative', 'without', 'never', 'nil', 'absent', 'excluded'}
+RELATIVE_CUES = {
+    'family', 'fh', 'fhx', 'mother', 'father', 'mom', 'mum', 'dad', 'parent', 'parents', 'sister', 'brother',
+    'sibling', 'siblings', 'grandmother', 'grandfather', 'grandparent', 'grandma', 'grandpa', 'aunt', 'uncle',
+    'cousin', 'son', 'daughter', 'husband', 'wife', 'relative', 'relatives',
+}
+CLAUSE_BREAK = re.compile(r"[.,;\n]|\bbut\b|\bhowever\b", re.IGNORECASE)
+STOPWORDS = {'of', 'the', 'a', 'an', 'and', 'with', 'history', 'hx', 'h', 'o', 'known', 'case', 'k', 'c', 'chronic', 'mild', 'severe', 'since', 'on', 'in', 'to', 'has', 'have', 'had', 'diagnosed'}
+
+
+def _tokens(text):
+    return re.sub(r"[^a-z0-9 ]", " ", (text or '').lower().replace("'", "")).split()
+
+
+def normalize_text(text):
+    """Lowercases, strips punctuation and collapses whitespace."""
+    return " ".join(_tokens(text))
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# --- Index ---
+class ConditionIndex:
+    """Exact table + token trie + trigram index over the vocabulary, built once at import."""
+
+    def __init__(self, vocabulary):
+        self.labels = {code: label for code, (label, _) in vocabulary.items()}
+        self.exact = {}
+        self.trie = {}
+        self.terms = []
+        self.trigram_index = defaultdict(list)
+        for code, (label, synonyms) in vocabulary.items():
+            for term in [label] + synonyms:
+                key = normalize_text(term)
+                if not key or key in self.exact:
+                    continue
+                self.exact[key] = code
+                node = self.trie
+                for token in key.split():
+                    node = node.setdefault(token, {})
+                node[None] = code
+                term_id = len(self.terms)
+                self.terms.append((key, code, _trigrams(key)))
+                for gram in self.terms[term_id][2]:
+                    self.trigram_index[gram].append(term_id)
+
+    def find_phrases(self, tokens):
+        """Returns codes of the longest known phrases found anywhere in the token list."""
+        codes, i = [], 0
+        while i < len(tokens):
+            node, match, match_end = self.trie, None, i
+            for j in range(i, len(tokens)):
+                node = node.get(tokens[j])
+                if node is None:
+                    break
+                if None in node:
+                    match, match_end = node[None], j + 1
+            if match:
+                codes.append(match)
+                i = match_end
+            else:
+                i += 1
+        return codes
+
+    def fuzzy(self, key):
+        """Best vocabulary term by trigram Dice similarity, if above the threshold."""
+        grams = _trigrams(key)
+        overlap = defaultdict(int)
+        for gram in grams:
+            for term_id in self.trigram_index.get(gram, ()):
+                overlap[term_id] += 1
+        best_code, best_score = None, 0.0
+        for term_id, shared in overlap.items():
+            # Only compare terms of similar length so a generic word cannot match part of a longer phrase
+            if abs(len(self.terms[term_id][0]) - len(key)) > max(2, 0.3 * len(key)):
+                continue
+            score = 2 * shared / (len(grams) + len(self.terms[term_id][2]))
+            if score > best_score:
+                best_code, best_score = self.terms[term_id][1], score
+        return best_code if best_score >= FUZZY_THRESHOLD else None
+
+    def prefix_search(self, prefix, limit=10):
+        """Returns canonical (code, label) pairs whose terms start with `prefix` (for autocomplete)."""
+        prefix = normalize_text(prefix)
+        seen = []
+        for key, code, _ in self.terms:
+            if key.startswith(prefix) and code not in seen:
+                seen.append(code)
+                if len(seen) >= limit:
+                    break
+        return [(code, self.labels[code]) for code in seen]
+
+
+INDEX = ConditionIndex(VOCABULARY)
+
+
+# --- Public API ---
+def _affirmed_clauses(text):
+    """Yields the token lists of each clause, without negated mentions or clauses about relatives."""
+    for clause in CLAUSE_BREAK.split(text or ''):
+        tokens = _tokens(clause)
+        if any(t in RELATIVE_CUES for t in tokens):
+            continue
+        cue = next((i for i, t in enumerate(tokens) if t in NEGATION_CUES), len(tokens))
+        tokens = [t for t in tokens[:cue] if t not in STOPWORDS]
+        if tokens:
+            yield tokens
+
+
+@lru_cache(maxsize=65536)
+def normalize_all(text):
+    """Returns every canonical code the patient is described as having, as a tuple."""
+    key = normalize_text(text)
+    if not key:
+        return ()
+    if key in INDEX.exact:
+        return (INDEX.exact[key],)
+    clauses = list(_affirmed_clauses(text))
+    codes = [code for tokens in clauses for code in INDEX.find_phrases(tokens)]
+    if codes:
+        return tuple(dict.fromkeys(codes))
+    if not clauses:
+        return ()
+    fuzzy = INDEX.fuzzy(" ".join(t for tokens in clauses for t in tokens))
+    return (fuzzy,) if fuzzy else ()
+
+
+def normalize(text):
+    """Maps a free-text condition to its canonical code, or None if it is not recognized."""
+    codes = normalize_all(text)
+    return codes[0] if codes else None
+
+
+def canonical_label(text, code=None):
+    """Returns the canonical label for a description (or its stored code), falling back to the original text."""
+    code = code or normalize(text)
+    return INDEX.labels.get(code, (text or '').strip())
+
+
+def maternity_history_flags(descriptions):
+    """Derives the maternity model's Yes/No history features from condition descriptions."""
+    codes = {code for text in descriptions for code in normalize_all(text)}
+    return {flag: "Yes" if codes & flag_codes else "No" for flag, flag_codes in MATERNITY_HISTORY_FLAGS.items()}
+
+
+# --- Backfill ---
+BACKFILL_FIELDS = {"allergies_and_conditions": "description", "prescriptions": "condition"}
+BACKFILL_WORKERS = 8
+
+
+def backfill(db, dry_run=False, workers=BACKFILL_WORKERS):
+    """
+    Writes `condition_code` onto every existing condition and prescription whose code is missing or
+    stale. Updates go through `patient_repository.update_records` one patient at a time, so snapshot
+    summaries, `updated_at`, the caches and dependent hereditary scores stay consistent.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from patient_repository import update_records
+
+    updates = defaultdict(list)  # patient_id -> [(collection, doc_id, fields), ...]
+    totals = {}
+    for collection, field in BACKFILL_FIELDS.items():
+        scanned = updated = 0
+        for doc in db.collection(collection).select(["patient_id", field, "condition_code"]).stream():
+            scanned += 1
+            data = doc.to_dict()
+            code = normalize(data.get(field))
+            if data.get("condition_code") == code:
+                continue
+            updated += 1
+            updates[data.get("patient_id")].append((collection, doc.id, {"condition_code": code}))
+        totals[collection] = (scanned, updated)
+        print(f"{collection}: scanned {scanned}, {'would update' if dry_run else 'updating'} {updated}")
+    orphans = updates.pop(None, [])
+    if orphans:
+        print(f"Skipped {len(orphans)} records without a patient_id")
+    if not dry_run and updates:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda item: update_records(db, *item), updates.items()))
+        print(f"Updated records of {len(updates)} patients")
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Condition vocabulary normalization tools.")
+    parser.add_argument("--backfill", action="store_true", help="Write condition_code onto existing records.")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS, help="Patients updated in parallel.")
+    parser.add_argument("text", nargs="*", help="Descriptions to normalize.")
+    args = parser.parse_args()
+
+    if args.backfill:
+        from firebase_config import get_firestore_client
+        backfill(get_firestore_client(), dry_run=args.dry_run, workers=args.workers)
+    for text in args.text:
+        code = normalize(text)
+        print(f"{text!r} -> {code} ({canonical_label(text, code)})")
@@ -3,20 +3,28 @@ from firebase_admin import credentials
 from firebase_admin import firestore
 import datetime
 
+from datastore import configured_backend, sqlite_path
+from vitals_series import record as record_vitals
 
-try:
-    # Initialize the app with a service account, granting admin privileges
-    cred = credentials.Certificate("serviceAccountKey.json")
-    firebase_admin.initialize_app(cred)
-    print("Firebase App initialized successfully.")
-    
-except Exception as e:
-    print(f"Error initializing Firebase App: {e}")
-    exit()
+
+if configured_backend() == "sqlite":
+    # Local SQLite document store (MEDTREE_STORAGE=sqlite); same API as the Firestore client
+    from sqlite_store import SQLiteClient
+    db = SQLiteClient(sqlite_path())
+else:
+    try:
+        # Initialize the app with a service account, granting admin privileges
+        cred = credentials.Certificate("serviceAccountKey.json")
+        firebase_admin.initialize_app(cred)
+        print("Firebase App initialized successfully.")
+        
+    except Exception as e:
+        print(f"Error initializing Firebase App: {e}")
+        exit()
 
 
-# Get a client instance for Firestore
-db = firestore.client()
+    # Get a client instance for Firestore
+    db = firestore.client()
 
 # --- Database Functions ---
 
@@ -44,7 +52,7 @@ def add_personal_details(user_id, name, age, dob, phone_no, address):
 def add_vitals(user_id, blood_group, weight, medical_conditions, allergies):
     """
     Adds or updates a user's vitals in the 'vitals' collection.
-    The document ID is the same as the user_id.
+    The document ID is the same as the user_id; the weight reading is appended to `vitals_series`.
     """
     try:
         doc_ref = db.collection('vitals').document(user_id)
@@ -54,6 +62,8 @@ def add_vitals(user_id, blood_group, weight, medical_conditions, allergies):
             'medical_conditions': medical_conditions, # This can be a list of strings
             'allergies': allergies # This can be a list of strings
         })
+        # Measurements are also appended to the time series, so history is kept
+        record_vitals(db, user_id, {'weight_kg': weight})
         print(f"Successfully added vitals for user: {user_id}")
         return doc_ref
     except Exception as e:
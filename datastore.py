@@ -0,0 +1,79 @@
+# datastore.py
+"""
+Storage backend selection.
+
+    MEDTREE_STORAGE=firestore   (default) Cloud Firestore and Firebase Storage
+    MEDTREE_STORAGE=sqlite      local SQLite document store (`sqlite_store`) and a local blob
+                                directory (`local_blobs`), for offline runs and load tests
+
+The backend can also be set in .streamlit/secrets.toml under [storage] as `backend`, `sqlite_path`
+and `blob_dir`; environment variables take precedence. `firebase_config.get_firestore_client()`
+and `get_storage_bucket()` return the configured implementation, so pages and backends do not
+change. With either backend, the local full-text index (`search_index`) is stored at
+MEDTREE_SEARCH_INDEX (secret `search_index`) and open resumable upload sessions (`scan_uploads`)
+at MEDTREE_UPLOAD_STATE (secret `upload_state`).
+"""
+import functools
+import os
+
+from google.cloud import firestore
+
+BACKEND_ENV = "MEDTREE_STORAGE"
+SQLITE_PATH_ENV = "MEDTREE_SQLITE_PATH"
+BLOB_DIR_ENV = "MEDTREE_BLOB_DIR"
+SEARCH_INDEX_ENV = "MEDTREE_SEARCH_INDEX"
+UPLOAD_STATE_ENV = "MEDTREE_UPLOAD_STATE"
+DEFAULT_SQLITE_PATH = "medtree_local.sqlite3"
+DEFAULT_BLOB_DIR = "local_blobs"
+DEFAULT_SEARCH_INDEX = "medtree_search.sqlite3"
+DEFAULT_UPLOAD_STATE = "medtree_uploads.json"
+BACKENDS = ("firestore", "sqlite")
+
+
+def _setting(env_var, secret_key, default):
+    value = os.getenv(env_var)
+    if value:
+        return value
+    try:
+        import streamlit as st
+        return st.secrets["storage"][secret_key]
+    except Exception:
+        return default
+
+
+def configured_backend():
+    backend = _setting(BACKEND_ENV, "backend", "firestore").lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown storage backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+    return backend
+
+
+def sqlite_path():
+    return _setting(SQLITE_PATH_ENV, "sqlite_path", DEFAULT_SQLITE_PATH)
+
+
+def blob_dir():
+    return _setting(BLOB_DIR_ENV, "blob_dir", DEFAULT_BLOB_DIR)
+
+
+def search_index_path():
+    return _setting(SEARCH_INDEX_ENV, "search_index", DEFAULT_SEARCH_INDEX)
+
+
+def upload_state_path():
+    return _setting(UPLOAD_STATE_ENV, "upload_state", DEFAULT_UPLOAD_STATE)
+
+
+def transactional(fn):
+    """
+    Backend-neutral replacement for `@firestore.transactional`: fn(transaction, *args) is retried
+    by the Firestore SDK on contention, or run under the SQLite store's write lock.
+    """
+    firestore_fn = firestore.transactional(fn)
+
+    @functools.wraps(fn)
+    def call(transaction, *args, **kwargs):
+        if getattr(transaction, "is_local", False):
+            return transaction.run_local(lambda: fn(transaction, *args, **kwargs))
+        return firestore_fn(transaction, *args, **kwargs)
+    return call
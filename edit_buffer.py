@@ -0,0 +1,63 @@
+# edit_buffer.py
+"""
+Buffers record field edits (e.g. category changes) made in a page and commits them together.
+
+Edits are kept in `st.session_state`, shown optimistically by overlaying them on the records the
+page already has, and written as one batched update either when the user saves or on the first
+rerun after the edits have been idle for `debounce_seconds`.
+"""
+import time
+
+import streamlit as st
+
+from patient_repository import update_records
+
+DEBOUNCE_SECONDS = 5
+
+
+class EditBuffer:
+    """Pending {(collection, doc_id): fields} edits for one patient."""
+
+    def __init__(self, patient_id, debounce_seconds=DEBOUNCE_SECONDS):
+        self.patient_id = patient_id
+        self.debounce_seconds = debounce_seconds
+        self.pending = {}
+        self.last_edit = None
+
+    def stage(self, collection, doc_id, fields):
+        self.pending.setdefault((collection, doc_id), {}).update(fields)
+        self.last_edit = time.monotonic()
+
+    def discard(self, collection, doc_id):
+        self.pending.pop((collection, doc_id), None)
+
+    def __len__(self):
+        return len(self.pending)
+
+    def overlay(self, collection, records):
+        """Returns `records` with pending edits applied, without mutating the shared originals."""
+        if not self.pending:
+            return records
+        return [{**record, **self.pending[(collection, record["id"])]} if (collection, record["id"]) in self.pending else record for record in records]
+
+    @property
+    def due(self):
+        return bool(self.pending) and time.monotonic() - self.last_edit >= self.debounce_seconds
+
+    def commit(self, db):
+        """Writes all pending edits in batched updates. Returns the number of records written."""
+        if not self.pending:
+            return 0
+        updates = [(collection, doc_id, fields) for (collection, doc_id), fields in self.pending.items()]
+        update_records(db, self.patient_id, updates)
+        self.pending = {}
+        self.last_edit = None
+        return len(updates)
+
+
+def get_edit_buffer(key, patient_id, debounce_seconds=DEBOUNCE_SECONDS):
+    """Returns the session's buffer stored under `key`, replacing it if it belongs to another patient."""
+    buffer = st.session_state.get(key)
+    if buffer is None or buffer.patient_id != patient_id:
+        buffer = st.session_state[key] = EditBuffer(patient_id, debounce_seconds)
+    return buffer
@@ -0,0 +1,103 @@
+# family_history.py
+import time
+
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from condition_vocabulary import canonical_label
+from query_executor import run_concurrently
+
+# Firestore caps the number of values allowed in a single 'in' filter.
+IN_QUERY_LIMIT = 30
+# Only these categories may leave the patient's record for family analysis.
+SHAREABLE_CATEGORIES = ('Green', 'Yellow')
+
+
+def _chunks(items, size):
+    """Splits a list into consecutive chunks of at most `size` items."""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _stream_member_ids(db, group_id):
+    """Returns the member IDs of one family group."""
+    return [member.id for member in db.collection("family_groups").document(group_id).collection("members").stream()]
+
+
+def _stream_condition_chunk(db, patient_ids):
+    """
+    Returns {patient_id: [shareable conditions]} for a chunk of patients, plus the number of documents read.
+    Conditions are reported by canonical label so spelling variants deduplicate.
+    """
+    query = db.collection("allergies_and_conditions").where(filter=FieldFilter("patient_id", "in", patient_ids))
+    by_patient = {pid: [] for pid in patient_ids}
+    reads = 0
+    for doc in query.stream():
+        reads += 1
+        d = doc.to_dict()
+        if d.get('category', 'Green') in SHAREABLE_CATEGORIES and d.get('description'):
+            by_patient.setdefault(d.get('patient_id'), []).append(canonical_label(d['description'], d.get('condition_code')))
+    return by_patient, reads
+
+
+def fetch_conditions_by_patient(db, patient_ids):
+    """
+    Fetches shareable conditions for many patients with chunked 'in' queries run concurrently.
+    Returns ({patient_id: [descriptions]}, documents_read, queries_issued).
+    """
+    chunks = _chunks(sorted(set(patient_ids)), IN_QUERY_LIMIT)
+    if not chunks:
+        return {}, 0, 0
+    results = run_concurrently({i: (lambda chunk=chunk: _stream_condition_chunk(db, chunk)) for i, chunk in enumerate(chunks)})
+    by_patient = {}
+    for chunk_result, _ in results.values():
+        by_patient.update(chunk_result)
+    return by_patient, sum(reads for _, reads in results.values()), len(chunks)
+
+
+def collect_relative_ids(db, group_ids, patient_id=None):
+    """
+    Streams the members of every group concurrently and returns the set of relative IDs,
+    excluding the patient themself, together with the number of documents read.
+    """
+    group_ids = list(dict.fromkeys(group_ids or []))
+    if not group_ids:
+        return set(), 0
+    member_lists = list(run_concurrently({gid: (lambda gid=gid: _stream_member_ids(db, gid)) for gid in group_ids}).values())
+    relative_ids = {mid for members in member_lists for mid in members}
+    reads = sum(len(members) for members in member_lists)
+    relative_ids.discard(patient_id)
+    return relative_ids, reads
+
+
+def get_family_history(db, patient_id, group_ids):
+    """
+    Builds the anonymized family condition set for a patient.
+
+    Relative IDs are gathered from all of the patient's groups, then their conditions are
+    fetched with chunked 'in' queries executed concurrently instead of one query per relative.
+    Returns {"conditions": [...], "stats": {...}} where stats carries read counts and timings.
+    """
+    started = time.perf_counter()
+    group_ids = list(dict.fromkeys(group_ids or []))
+    stats = {"groups": len(group_ids), "relatives": 0, "member_reads": 0, "condition_reads": 0, "queries": 0, "members_ms": 0.0, "conditions_ms": 0.0, "total_ms": 0.0}
+    if not group_ids:
+        return {"conditions": [], "stats": stats}
+
+    relative_ids, member_reads = collect_relative_ids(db, group_ids, patient_id)
+    members_done = time.perf_counter()
+
+    by_patient, condition_reads, condition_queries = fetch_conditions_by_patient(db, relative_ids)
+    finished = time.perf_counter()
+
+    # Deduplicate across relatives; no patient identifiers are kept in the result
+    conditions = sorted({desc for descriptions in by_patient.values() for desc in descriptions})
+
+    stats.update({
+        "relatives": len(relative_ids),
+        "member_reads": member_reads,
+        "condition_reads": condition_reads,
+        "queries": len(group_ids) + condition_queries,
+        "members_ms": round((members_done - started) * 1000, 1),
+        "conditions_ms": round((finished - members_done) * 1000, 1),
+        "total_ms": round((finished - started) * 1000, 1),
+    })
+    return {"conditions": conditions, "stats": stats}
@@ -0,0 +1,356 @@
+# family_tree.py
+import re
+import threading
+import time
+from collections import defaultdict, deque
+
+# --- Relationship Vocabulary ---
+# A blood relationship is stored as (up, down): the number of generations to climb from a
+# person to the nearest common ancestor, then to descend to the relative. A father is (1, 0),
+# a sister (1, 1), a first cousin (2, 2). The inverse of (up, down) is (down, up).
+BASE_RELATIONSHIPS = {
+    'self': (0, 0), 'me': (0, 0),
+    'father': (1, 0), 'mother': (1, 0), 'parent': (1, 0), 'dad': (1, 0), 'mom': (1, 0), 'mum': (1, 0),
+    'son': (0, 1), 'daughter': (0, 1), 'child': (0, 1),
+    'brother': (1, 1), 'sister': (1, 1), 'sibling': (1, 1),
+    'grandfather': (2, 0), 'grandmother': (2, 0), 'grandparent': (2, 0), 'grandpa': (2, 0), 'grandma': (2, 0), 'granny': (2, 0),
+    'grandson': (0, 2), 'granddaughter': (0, 2), 'grandchild': (0, 2),
+    'uncle': (2, 1), 'aunt': (2, 1), 'auntie': (2, 1),
+    'nephew': (1, 2), 'niece': (1, 2),
+    'cousin': (2, 2),
+}
+SPOUSE_TERMS = {'husband', 'wife', 'spouse', 'partner'}
+GRAND_TERMS = {'grandaunt', 'granduncle', 'grandniece', 'grandnephew'}
+# Relationships that do not imply shared ancestry are kept out of the blood graph.
+NON_GENETIC_TERMS = {'step', 'in law', 'foster', 'adopted', 'adoptive', 'friend', 'godfather', 'godmother', 'guardian'}
+ORDINALS = {'first': 1, '1st': 1, 'second': 2, '2nd': 2, 'third': 3, '3rd': 3}
+IGNORED_WORDS = {'my', 'paternal', 'maternal', 'biological', 'birth', 'full', 'elder', 'older', 'younger', 'big', 'little'}
+
+DEFAULT_MAX_DEGREE = 3
+DEFAULT_MAX_HOPS = 4
+TREE_TTL_SECONDS = 600
+
+
+class Kinship:
+    """A computed blood relationship between two patients."""
+    __slots__ = ('up', 'down', 'half', 'hops')
+
+    def __init__(self, up, down, half=False, hops=0):
+        self.up, self.down, self.half, self.hops = up, down, half, hops
+
+    @property
+    def degree(self):
+        """Degree of relationship: 1 for parents/children/siblings, 2 for grandparents/aunts, 3 for cousins."""
+        if self.up and self.down:
+            return self.up + self.down - 1 + (1 if self.half else 0)
+        return self.up + self.down
+
+    @property
+    def coefficient(self):
+        """Expected fraction of shared genes (coefficient of relationship)."""
+        return 0.5 ** self.degree
+
+    @property
+    def label(self):
+        return describe_relationship(self.up, self.down, self.half)
+
+    def to_dict(self):
+        return {"relationship": self.label, "degree": self.degree, "up": self.up, "down": self.down}
+
+    def __repr__(self):
+        return f"Kinship({self.label}, degree={self.degree})"
+
+
+def _relationship_term(word):
+    """Returns the vocabulary term a word names ('sisters' -> 'sister'), or None for modifiers."""
+    for candidate in (word, word.rstrip('s')):
+        if candidate in BASE_RELATIONSHIPS or candidate in SPOUSE_TERMS or candidate in GRAND_TERMS:
+            return candidate
+    return None
+
+
+def _parse_term(words):
+    """Parses one relationship term and its modifiers ("great grandmother", "half sister") to (up, down, half)."""
+    half = 'half' in words
+    greats = sum(1 for w in words if w in ('great', 'grt'))
+    ordinal = next((ORDINALS[w] for w in words if w in ORDINALS), 1)
+    term = _relationship_term(words[-1])
+    if term in ('grandaunt', 'granduncle'):
+        up, down = 3, 1
+    elif term in ('grandniece', 'grandnephew'):
+        up, down = 1, 3
+    else:
+        up, down = BASE_RELATIONSHIPS[term]
+    if term == 'cousin':
+        up = down = ordinal + 1
+    if greats:
+        if down == 0 and up >= 1:
+            up += greats if up >= 2 else greats + 1
+        elif up == 0 and down >= 1:
+            down += greats if down >= 2 else greats + 1
+        elif down == 1:
+            up += greats
+        elif up == 1:
+            down += greats
+    return up, down, half and up > 0 and down > 0
+
+
+def parse_relationship(text):
+    """
+    Maps free-text relationship input to ('blood', up, down, half), ('spouse',), ('other',) for
+    relationships known to carry no genetic link (in-laws, step relatives, a sibling's spouse), or
+    None if it is unrecognized. Possessive chains are composed: "mother's sister" is an aunt.
+    """
+    words = re.sub(r"[^a-z0-9 ]", " ", (text or '').lower().replace("-", " ").replace("'s", "")).split()
+    phrase = " ".join(words)
+    if not words:
+        return None
+    if any(term in phrase for term in NON_GENETIC_TERMS):
+        return ('other',)
+    words = [w for w in words if w not in IGNORED_WORDS]
+    # "grand aunt" / "grand nephew" are written as two words
+    merged = []
+    for w in words:
+        if merged and merged[-1] == 'grand':
+            merged[-1] = 'grand' + w
+        else:
+            merged.append(w)
+    # Each relationship term ends a segment that holds its modifiers: "great grandmother", "half sister"
+    segments, pending = [], []
+    for w in merged:
+        pending.append(w)
+        if _relationship_term(w):
+            segments.append(pending)
+            pending = []
+    if not segments:
+        return None
+    if any(_relationship_term(segment[-1]) in SPOUSE_TERMS for segment in segments):
+        return ('spouse',) if len(segments) == 1 else ('other',)
+    relationship = _parse_term(segments[0])
+    for segment in segments[1:]:
+        relationship = compose(relationship, _parse_term(segment))
+        if relationship is None:
+            # e.g. "son's mother": a parent of one's child is a partner, not a blood relative
+            return ('other',)
+    return ('blood',) + relationship
+
+
+def compose(first, second):
+    """
+    Composes A->B and B->C relationships into A->C (both given as (up, down, half)), or returns
+    None when the path climbs after descending. A child's parent may be A's partner rather than A,
+    and a sibling's parent may not be A's parent, so such paths imply no blood relationship.
+    """
+    u1, d1, h1 = first
+    u2, d2, h2 = second
+    if d1 and u2:
+        return None
+    up, down = u1 + u2, d1 + d2
+    return up, down, (h1 or h2) and up > 0 and down > 0
+
+
+def describe_relationship(up, down, half=False):
+    """Returns a readable label for an (up, down) relationship."""
+    prefix = "half-" if half else ""
+    if up == 0 and down == 0:
+        return "self"
+    if down == 0:
+        return {1: "parent", 2: "grandparent"}.get(up, "great-" * (up - 2) + "grandparent")
+    if up == 0:
+        return {1: "child", 2: "grandchild"}.get(down, "great-" * (down - 2) + "grandchild")
+    if up == 1 and down == 1:
+        return prefix + "sibling"
+    if down == 1:
+        return prefix + ("aunt/uncle" if up == 2 else "great-" * (up - 3) + "grand-aunt/uncle")
+    if up == 1:
+        return prefix + ("niece/nephew" if down == 2 else "great-" * (down - 3) + "grand-niece/nephew")
+    nth = min(up, down) - 1
+    removed = abs(up - down)
+    ordinal = {1: "first", 2: "second", 3: "third"}.get(nth, f"{nth}th")
+    return prefix + f"{ordinal} cousin" + (f" {removed}x removed" if removed else "")
+
+
+# --- Graph Engine ---
+class FamilyTree:
+    """
+    In-memory kinship graph built from `family_groups/{id}/members` documents.
+
+    Neighborhood queries are cached per (patient, max_degree, max_hops) and invalidated
+    incrementally: adding a member only drops cached traversals that touched either endpoint.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._edges = defaultdict(dict)  # person -> {relative: (up, down, half)}
+        self._spouses = defaultdict(set)
+        self._non_genetic = set()  # members recorded as in-laws, step or foster relatives
+        self._group_members = defaultdict(set)
+        self._groups_of = defaultdict(set)
+        self._cache = {}
+        self._cache_touched = {}  # cache key -> nodes visited while computing it
+        self._touched_index = defaultdict(set)  # node -> cache keys that visited it
+        self.built_at = time.time()
+
+    # --- Construction ---
+    @classmethod
+    def from_firestore(cls, db):
+        """Builds the tree from every family group's members subcollection in one collection-group query."""
+        tree = cls()
+        for member in db.collection_group("members").stream():
+            group_ref = member.reference.parent.parent
+            data = member.to_dict() or {}
+            tree._add_member(group_ref.id if group_ref else None, member.id, data.get('relationship'), data.get('relative_to_id'))
+        return tree
+
+    def _add_member(self, group_id, member_id, relationship, relative_to_id):
+        """Adds a member and returns the set of nodes whose neighborhoods may have changed."""
+        changed = {member_id}
+        if group_id:
+            self._group_members[group_id].add(member_id)
+            self._groups_of[member_id].add(group_id)
+        if not relative_to_id or relative_to_id == member_id:
+            return changed
+        parsed = parse_relationship(relationship)
+        if parsed is None:
+            return changed
+        if parsed[0] == 'other':
+            self._non_genetic.add(member_id)
+            return changed
+        changed.add(relative_to_id)
+        if parsed[0] == 'spouse':
+            self._spouses[relative_to_id].add(member_id)
+            self._spouses[member_id].add(relative_to_id)
+            return changed
+        _, up, down, half = parsed
+        # The member IS <relationship> OF relative_to_id, so the edge runs relative -> member
+        self._edges[relative_to_id][member_id] = (up, down, half)
+        self._edges[member_id][relative_to_id] = (down, up, half)
+        return changed
+
+    def add_member(self, group_id, member_id, relationship, relative_to_id):
+        """Records a newly added group member and invalidates only the affected cached neighborhoods."""
+        with self._lock:
+            changed = self._add_member(group_id, member_id, relationship, relative_to_id)
+            self.invalidate(changed)
+
+    def invalidate(self, nodes):
+        """Drops cached traversals that visited any of the given nodes."""
+        with self._lock:
+            for node in nodes:
+                for key in list(self._touched_index.pop(node, ())):
+                    for other in self._cache_touched.pop(key, ()):
+                        if other != node:
+                            self._touched_index[other].discard(key)
+                    self._cache.pop(key, None)
+
+    # --- Queries ---
+    def relatives(self, patient_id, max_degree=DEFAULT_MAX_DEGREE, max_hops=DEFAULT_MAX_HOPS):
+        """Returns {relative_id: Kinship} for blood relatives up to `max_degree`, reached within `max_hops` edges."""
+        key = (patient_id, max_degree, max_hops)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                return cached
+            result, touched = self._traverse(patient_id, max_degree, max_hops)
+            self._cache[key] = result
+            self._cache_touched[key] = touched
+            for node in touched:
+                self._touched_index[node].add(key)
+            return result
+
+    def _traverse(self, patient_id, max_degree, max_hops):
+        """Breadth-first traversal over (node, up, down, half) states, bounded by hop count."""
+        best = {}
+        touched = {patient_id}
+        start = (patient_id, 0, 0, False)
+        seen = {start}
+        queue = deque([(start, 0)])
+        while queue:
+            (node, up, down, half), hops = queue.popleft()
+            if hops >= max_hops:
+                continue
+            for neighbor, edge in self._edges.get(node, {}).items():
+                touched.add(neighbor)
+                composed = compose((up, down, half), edge)
+                if composed is None:
+                    continue
+                n_up, n_down, n_half = composed
+                # A degree-0 state away from the patient ("self" edges) says nothing about kinship
+                if neighbor == patient_id or (n_up, n_down) == (0, 0):
+                    continue
+                state = (neighbor, n_up, n_down, n_half)
+                if state in seen:
+                    continue
+                seen.add(state)
+                kin = Kinship(n_up, n_down, n_half, hops + 1)
+                if kin.degree > max_degree:
+                    continue
+                queue.append((state, hops + 1))
+                current = best.get(neighbor)
+                if current is None or (kin.degree, kin.hops) < (current.degree, current.hops):
+                    best[neighbor] = kin
+        return best, touched
+
+    def relationship(self, patient_id, relative_id, max_degree=DEFAULT_MAX_DEGREE, max_hops=DEFAULT_MAX_HOPS):
+        """Returns the Kinship between two patients, or None if they are not related within the bounds."""
+        return self.relatives(patient_id, max_degree, max_hops).get(relative_id)
+
+    def relatives_by_generation(self, patient_id, max_degree=DEFAULT_MAX_DEGREE, max_hops=DEFAULT_MAX_HOPS):
+        """Groups relatives by generation offset (+1 parents, +2 grandparents, 0 siblings/cousins, -1 children)."""
+        generations = defaultdict(list)
+        for rel_id, kin in self.relatives(patient_id, max_degree, max_hops).items():
+            generations[kin.up - kin.down].append(rel_id)
+        return dict(generations)
+
+    def parent_child_pairs(self):
+        """Returns (parent_id, child_id) for every direct parent/child edge in the tree."""
+        with self._lock:
+            pairs = [(a, b) for a, neighbors in self._edges.items() for b, edge in neighbors.items() if edge[:2] == (0, 1)]
+        return pairs
+
+    def spouses(self, patient_id):
+        with self._lock:
+            return set(self._spouses.get(patient_id, ()))
+
+    def has_known_relationship(self, patient_id):
+        """True if the member's relationship was recognized: a blood edge, a spouse or a non-genetic tie."""
+        with self._lock:
+            return patient_id in self._edges or patient_id in self._spouses or patient_id in self._non_genetic
+
+    def group_members(self, group_id):
+        with self._lock:
+            return set(self._group_members.get(group_id, ()))
+
+    def groups_of(self, patient_id):
+        with self._lock:
+            return set(self._groups_of.get(patient_id, ()))
+
+    def patient_ids(self):
+        """Returns every patient that appears in the tree."""
+        with self._lock:
+            return set(self._groups_of) | set(self._edges)
+
+    def __len__(self):
+        return len(self.patient_ids())
+
+
+# --- Process-wide Instance ---
+_tree = None
+_tree_lock = threading.Lock()
+
+
+def get_family_tree(db, max_age=TREE_TTL_SECONDS):
+    """Returns the shared FamilyTree, building it on first use and rebuilding it after `max_age` seconds."""
+    global _tree
+    with _tree_lock:
+        if _tree is None or time.time() - _tree.built_at > max_age:
+            _tree = FamilyTree.from_firestore(db)
+        return _tree
+
+
+def record_member_added(group_id, member_id, relationship, relative_to_id):
+    """Applies an "Add Member" write to the shared tree, if it has been built in this process."""
+    with _tree_lock:
+        tree = _tree
+    if tree is not None:
+        tree.add_member(group_id, member_id, relationship, relative_to_id)
@@ -4,6 +4,10 @@ import firebase_admin
 from firebase_admin import credentials, firestore, storage
 import json
 import os
+import threading
+
+import datastore
+from firestore_metrics import InstrumentedClient
 
 
 def init_firebase():
@@ -29,12 +33,40 @@ def init_firebase():
             'storageBucket': f'{project_id}.appspot.com'
         })
 
-def get_firestore_client():
-    """Returns a Firestore client instance."""
+# Clients are created once per process and shared by every session and rerun
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _shared(name, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+def _create_firestore_client():
+    if datastore.configured_backend() == "sqlite":
+        from sqlite_store import SQLiteClient
+        return SQLiteClient(datastore.sqlite_path())
     init_firebase()
     return firestore.client()
 
-def get_storage_bucket():
-    """Returns a Firebase Storage bucket instance."""
+def _create_storage_bucket():
+    if datastore.configured_backend() == "sqlite":
+        from local_blobs import LocalBucket
+        return LocalBucket(datastore.blob_dir())
     init_firebase()
-    return storage.bucket()
\ No newline at end of file
+    return storage.bucket()
+
+def get_firestore_client():
+    """
+    Returns the process-wide document store client (Firestore, or SQLite when configured in
+    `datastore`), whose reads and writes are counted per page render.
+    """
+    return _shared("firestore", lambda: InstrumentedClient(_create_firestore_client()))
+
+def get_storage_bucket():
+    """Returns the process-wide Firebase Storage bucket (or local blob directory) instance."""
+    return _shared("storage", _create_storage_bucket)
\ No newline at end of file
@@ -0,0 +1,369 @@
+# firestore_metrics.py
+"""
+Per-render accounting of Firestore reads, writes and round trips.
+
+`get_firestore_client()` returns the client wrapped in an InstrumentedClient. Every document read,
+write and query round trip made through it is attributed, per collection and with wall-clock
+timings, to the RenderMetrics of the current page run (a ContextVar set by `begin_render`, which
+`query_executor` carries into its worker threads). `finish_render` writes one JSON log line per
+run to the `medtree.firestore` logger, and `render_debug_panel` shows the same numbers in the page
+when the panel is enabled (`?debug=firestore` or FIRESTORE_DEBUG_PANEL=1).
+
+Counting follows Firestore billing: a query costs at least one read even when it matches nothing,
+a `count()` aggregation is counted as one read, and batch or transaction writes are counted per
+document. Reads made by snapshot listeners happen outside any render and go to a process-wide
+"background" bucket.
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+from google.cloud.firestore_v1.base_aggregation import BaseAggregationQuery
+from google.cloud.firestore_v1.base_collection import BaseCollectionReference
+from google.cloud.firestore_v1.base_document import BaseDocumentReference
+from google.cloud.firestore_v1.base_query import BaseQuery
+
+# Single-document gets from one collection in one render at or above this count are flagged as a likely N+1.
+N_PLUS_ONE_THRESHOLD = 10
+DEBUG_ENV_VAR = "FIRESTORE_DEBUG_PANEL"
+
+logger = logging.getLogger("medtree.firestore")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+# --- Metrics ---
+class RenderMetrics:
+    """Reads, writes, round trips and time per collection for one page run."""
+
+    def __init__(self, page):
+        self.page = page
+        self.started = time.perf_counter()
+        self.collections = {}
+        self._lock = threading.Lock()
+
+    def record(self, collection, reads=0, writes=0, round_trips=1, ms=0.0, single_get=False):
+        with self._lock:
+            stats = self.collections.setdefault(collection, {"reads": 0, "writes": 0, "round_trips": 0, "single_gets": 0, "ms": 0.0})
+            stats["reads"] += reads
+            stats["writes"] += writes
+            stats["round_trips"] += round_trips
+            stats["single_gets"] += int(single_get)
+            stats["ms"] += ms
+
+    def total(self, key):
+        with self._lock:
+            return sum(stats[key] for stats in self.collections.values())
+
+    @property
+    def suspected_n_plus_one(self):
+        with self._lock:
+            return sorted(c for c, stats in self.collections.items() if stats["single_gets"] >= N_PLUS_ONE_THRESHOLD)
+
+    def to_dict(self):
+        with self._lock:
+            collections = {c: {**stats, "ms": round(stats["ms"], 1)} for c, stats in sorted(self.collections.items())}
+        return {
+            "page": self.page,
+            "reads": sum(s["reads"] for s in collections.values()),
+            "writes": sum(s["writes"] for s in collections.values()),
+            "round_trips": sum(s["round_trips"] for s in collections.values()),
+            "firestore_ms": round(sum(s["ms"] for s in collections.values()), 1),
+            "render_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "collections": collections,
+            "suspected_n_plus_one": self.suspected_n_plus_one,
+        }
+
+
+_current = contextvars.ContextVar("firestore_render_metrics", default=None)
+_background = RenderMetrics("background")
+
+
+def current_metrics():
+    return _current.get() or _background
+
+
+def begin_render(page):
+    """Starts counting for a page run. Call once near the top of the page script."""
+    metrics = RenderMetrics(page)
+    _current.set(metrics)
+    return metrics
+
+
+def finish_render():
+    """Logs the current run's metrics as one JSON line and returns them (None if no run was started)."""
+    metrics = _current.get()
+    if metrics is None:
+        return None
+    summary = metrics.to_dict()
+    log = logger.warning if summary["suspected_n_plus_one"] else logger.info
+    log(json.dumps({"event": "firestore_render", **summary}, default=str))
+    return metrics
+
+
+def debug_panel_enabled():
+    if os.getenv(DEBUG_ENV_VAR) == "1":
+        return True
+    try:
+        import streamlit as st
+        return st.query_params.get("debug") == "firestore"
+    except Exception:
+        return False
+
+
+def render_debug_panel():
+    """Finishes the run and, if enabled, shows its Firestore usage at the bottom of the page."""
+    metrics = finish_render()
+    if metrics is None or not debug_panel_enabled():
+        return
+    import pandas as pd
+    import streamlit as st
+    summary = metrics.to_dict()
+    with st.expander(f"🔧 Firestore: {summary['reads']} reads, {summary['writes']} writes, {summary['round_trips']} round trips, {summary['firestore_ms']} ms"):
+        st.dataframe(pd.DataFrame.from_dict(summary["collections"], orient="index"), use_container_width=True)
+        if summary["suspected_n_plus_one"]:
+            st.warning(f"Possible N+1 pattern (≥{N_PLUS_ONE_THRESHOLD} single-document gets): {', '.join(summary['suspected_n_plus_one'])}")
+        st.caption(f"Render took {summary['render_ms']} ms. Fragment reruns add to the totals of the last full run.")
+
+
+# --- Client proxies ---
+# SDK types the proxies recognise; other client implementations (e.g. sqlite_store) register theirs.
+_types = {
+    "query": (BaseQuery,),
+    "collection": (BaseCollectionReference,),
+    "document": (BaseDocumentReference,),
+    "aggregation": (BaseAggregationQuery,),
+}
+
+
+def register_types(query=(), collection=(), document=(), aggregation=()):
+    """Makes the proxies count reads and writes made through another client's reference and query types."""
+    for kind, extra in (("query", query), ("collection", collection), ("document", document), ("aggregation", aggregation)):
+        _types[kind] = _types[kind] + tuple(extra)
+
+
+def _collection_of(obj):
+    """Returns the collection ID a reference or query reads from."""
+    if isinstance(obj, _types["aggregation"]):
+        obj = obj._nested_query
+    if isinstance(obj, _types["document"]):
+        return obj.parent.id
+    if isinstance(obj, _types["collection"]):
+        return obj.id
+    if isinstance(obj, _types["query"]):
+        return obj._parent.id
+    return "unknown"
+
+
+def _unwrap(value):
+    return value._target if isinstance(value, _Proxy) else value
+
+
+def unwrap(client):
+    """Returns the client behind an InstrumentedClient, for bulk APIs the proxies do not count (e.g. bulk_writer)."""
+    return _unwrap(client)
+
+
+def _unwrap_all(args, kwargs):
+    args = tuple(_unwrap(a) for a in args)
+    kwargs = {k: _unwrap(v) for k, v in kwargs.items()}
+    return args, kwargs
+
+
+def _wrap(value):
+    if isinstance(value, _types["aggregation"]):
+        return _AggregationProxy(value)
+    if isinstance(value, _types["query"] + _types["collection"]):
+        return _QueryProxy(value)
+    if isinstance(value, _types["document"]):
+        return _DocumentProxy(value)
+    return value
+
+
+def _timed_call(fn, args, kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - started) * 1000
+
+
+class _Proxy:
+    """Forwards to the wrapped SDK object, unwrapping proxy arguments and wrapping returned references."""
+
+    def __init__(self, target):
+        object.__setattr__(self, "_target", target)
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            args, kwargs = _unwrap_all(args, kwargs)
+            return _wrap(attr(*args, **kwargs))
+        return call
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+    def __eq__(self, other):
+        return self._target == _unwrap(other)
+
+    def __hash__(self):
+        return hash(self._target)
+
+    def __repr__(self):
+        return f"Instrumented({self._target!r})"
+
+
+def _stream_counted(collection, iterator, started):
+    count = 0
+    try:
+        for item in iterator:
+            count += 1
+            yield item
+    finally:
+        current_metrics().record(collection, reads=max(count, 1), ms=(time.perf_counter() - started) * 1000)
+
+
+class _QueryProxy(_Proxy):
+    def stream(self, *args, **kwargs):
+        args, kwargs = _unwrap_all(args, kwargs)
+        started = time.perf_counter()
+        return _stream_counted(_collection_of(self._target), self._target.stream(*args, **kwargs), started)
+
+    def get(self, *args, **kwargs):
+        return list(self.stream(*args, **kwargs))
+
+    def add(self, *args, **kwargs):
+        args, kwargs = _unwrap_all(args, kwargs)
+        (update_time, ref), ms = _timed_call(self._target.add, args, kwargs)
+        current_metrics().record(_collection_of(self._target), writes=1, ms=ms)
+        return update_time, _wrap(ref)
+
+
+class _AggregationProxy(_Proxy):
+    def get(self, *args, **kwargs):
+        args, kwargs = _unwrap_all(args, kwargs)
+        result, ms = _timed_call(self._target.get, args, kwargs)
+        current_metrics().record(_collection_of(self._target), reads=1, ms=ms)
+        return result
+
+
+class _DocumentProxy(_Proxy):
+    def get(self, *args, **kwargs):
+        args, kwargs = _unwrap_all(args, kwargs)
+        result, ms = _timed_call(self._target.get, args, kwargs)
+        current_metrics().record(_collection_of(self._target), reads=1, ms=ms, single_get=True)
+        return result
+
+    def _write(self, method, args, kwargs):
+        args, kwargs = _unwrap_all(args, kwargs)
+        result, ms = _timed_call(getattr(self._target, method), args, kwargs)
+        current_metrics().record(_collection_of(self._target), writes=1, ms=ms)
+        return result
+
+    def set(self, *args, **kwargs):
+        return self._write("set", args, kwargs)
+
+    def update(self, *args, **kwargs):
+        return self._write("update", args, kwargs)
+
+    def create(self, *args, **kwargs):
+        return self._write("create", args, kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._write("delete", args, kwargs)
+
+
+class _BatchProxy(_Proxy):
+    """Counts staged writes per collection and records them, as one round trip, on commit."""
+
+    def __init__(self, target):
+        super().__init__(target)
+        object.__setattr__(self, "_staged", {})
+
+    def _stage(self, method, reference, args, kwargs):
+        collection = _collection_of(_unwrap(reference))
+        self._staged[collection] = self._staged.get(collection, 0) + 1
+        args, kwargs = _unwrap_all(args, kwargs)
+        return getattr(self._target, method)(_unwrap(reference), *args, **kwargs)
+
+    def set(self, reference, *args, **kwargs):
+        return self._stage("set", reference, args, kwargs)
+
+    def update(self, reference, *args, **kwargs):
+        return self._stage("update", reference, args, kwargs)
+
+    def create(self, reference, *args, **kwargs):
+        return self._stage("create", reference, args, kwargs)
+
+    def delete(self, reference, *args, **kwargs):
+        return self._stage("delete", reference, args, kwargs)
+
+    def commit(self, *args, **kwargs):
+        result, ms = _timed_call(self._target.commit, args, kwargs)
+        metrics = current_metrics()
+        for i, (collection, writes) in enumerate(self._staged.items()):
+            metrics.record(collection, writes=writes, round_trips=int(i == 0), ms=ms if i == 0 else 0.0)
+        self._staged.clear()
+        return result
+
+
+class _TransactionProxy(_BatchProxy):
+    """Also counts transactional reads; staged writes are recorded when they are staged."""
+
+    def _stage(self, method, reference, args, kwargs):
+        current_metrics().record(_collection_of(_unwrap(reference)), writes=1, round_trips=0)
+        args, kwargs = _unwrap_all(args, kwargs)
+        return getattr(self._target, method)(_unwrap(reference), *args, **kwargs)
+
+    def get(self, ref_or_query, *args, **kwargs):
+        target = _unwrap(ref_or_query)
+        args, kwargs = _unwrap_all(args, kwargs)
+        started = time.perf_counter()
+        result = self._target.get(target, *args, **kwargs)
+        if isinstance(target, _types["document"]):
+            current_metrics().record(_collection_of(target), reads=1, ms=(time.perf_counter() - started) * 1000, single_get=True)
+            return result
+        return _stream_counted(_collection_of(target), result, started)
+
+    def get_all(self, references, *args, **kwargs):
+        references = [_unwrap(r) for r in references]
+        return _get_all_counted(self._target.get_all, references, args, kwargs)
+
+
+def _get_all_counted(get_all, references, args, kwargs):
+    args, kwargs = _unwrap_all(args, kwargs)
+    started = time.perf_counter()
+    snapshots = list(get_all(references, *args, **kwargs))
+    ms = (time.perf_counter() - started) * 1000
+    by_collection = {}
+    for ref in references:
+        collection = _collection_of(ref)
+        by_collection[collection] = by_collection.get(collection, 0) + 1
+    metrics = current_metrics()
+    for i, (collection, reads) in enumerate(by_collection.items()):
+        metrics.record(collection, reads=reads, round_trips=int(i == 0), ms=ms if i == 0 else 0.0)
+    return iter(snapshots)
+
+
+class InstrumentedClient(_Proxy):
+    """Firestore client whose reads and writes are counted in the current render's metrics."""
+
+    def get_all(self, references, *args, **kwargs):
+        return _get_all_counted(self._target.get_all, [_unwrap(r) for r in references], args, kwargs)
+
+    def batch(self):
+        return _BatchProxy(self._target.batch())
+
+    def transaction(self, *args, **kwargs):
+        return _TransactionProxy(self._target.transaction(*args, **kwargs))
@@ -0,0 +1,207 @@
+# hereditary_cooccurrence.py
+"""
+Offline job: mines which conditions cluster within families and across generations.
+
+Usage:
+    python hereditary_cooccurrence.py [--output analytics/hereditary_cooccurrence.npz] [--min-support 3] [--include-red]
+
+Exports `allergies_and_conditions` and family-group membership from Firestore, builds sparse
+patient x condition and family x condition matrices, and writes co-occurrence and familial
+enrichment statistics to a single compressed .npz file that the dashboards load with `load_results`.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from condition_vocabulary import canonical_label
+from family_tree import FamilyTree
+
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "analytics", "hereditary_cooccurrence.npz")
+SHAREABLE_CATEGORIES = ('Green', 'Yellow')
+
+
+# --- Export ---
+def export_conditions(db, include_red=False):
+    """Streams condition documents and returns [(patient_id, description)] (only the fields the job needs are read)."""
+    rows = []
+    for doc in db.collection("allergies_and_conditions").select(["patient_id", "description", "condition_code", "category"]).stream():
+        d = doc.to_dict()
+        if not d.get('patient_id') or not d.get('description'):
+            continue
+        if include_red or d.get('category', 'Green') in SHAREABLE_CATEGORIES:
+            rows.append((d['patient_id'], canonical_label(d['description'], d.get('condition_code')).lower()))
+    return rows
+
+
+class _Index:
+    """Assigns consecutive integer ids to string keys."""
+
+    def __init__(self):
+        self.ids = {}
+        self.keys = []
+
+    def __call__(self, key):
+        idx = self.ids.get(key)
+        if idx is None:
+            idx = self.ids[key] = len(self.keys)
+            self.keys.append(key)
+        return idx
+
+    def __len__(self):
+        return len(self.keys)
+
+
+# --- Matrix Construction ---
+def build_matrices(condition_rows, tree):
+    """
+    Returns (patients, conditions, families, X, G, A):
+    X patient x condition indicator, G patient x family membership, A parent x child adjacency.
+    """
+    patients, conditions, families = _Index(), _Index(), _Index()
+    # Relatives without any recorded condition still count towards the baselines
+    for patient_id in sorted(tree.patient_ids()):
+        patients(patient_id)
+    x_rows, x_cols = [], []
+    for patient_id, description in condition_rows:
+        x_rows.append(patients(patient_id))
+        x_cols.append(conditions(description))
+
+    g_rows, g_cols = [], []
+    for patient_id in list(patients.keys):
+        for group_id in tree.groups_of(patient_id):
+            g_rows.append(patients(patient_id))
+            g_cols.append(families(group_id))
+
+    a_rows, a_cols = [], []
+    for parent_id, child_id in tree.parent_child_pairs():
+        if parent_id in patients.ids and child_id in patients.ids:
+            a_rows.append(patients.ids[parent_id])
+            a_cols.append(patients.ids[child_id])
+
+    import scipy.sparse as sp  # only the offline job needs scipy; the dashboards just call load_results
+
+    n, m, f = len(patients), len(conditions), len(families)
+    X = sp.csr_matrix((np.ones(len(x_rows), dtype=np.float32), (x_rows, x_cols)), shape=(n, m))
+    X.data[:] = 1.0  # duplicate (patient, condition) rows collapse to a single indicator
+    G = sp.csr_matrix((np.ones(len(g_rows), dtype=np.float32), (g_rows, g_cols)), shape=(n, f))
+    A = sp.csr_matrix((np.ones(len(a_rows), dtype=np.float32), (a_rows, a_cols)), shape=(n, n))
+    A.data[:] = 1.0
+    return patients.keys, conditions.keys, families.keys, X, G, A
+
+
+# --- Statistics ---
+def cooccurrence(X, min_support):
+    """Condition pairs occurring in the same patient: counts and lift = P(a,b) / (P(a) P(b))."""
+    import scipy.sparse as sp
+
+    n = max(X.shape[0], 1)
+    C = sp.triu(X.T @ X, k=1).tocoo()
+    prevalence = np.asarray(X.sum(axis=0)).ravel()
+    keep = C.data >= min_support
+    rows, cols, counts = C.row[keep], C.col[keep], C.data[keep]
+    lift = counts * n / (prevalence[rows] * prevalence[cols])
+    return prevalence, rows, cols, counts, lift
+
+
+def familial_enrichment(X, G):
+    """
+    Per condition, the number of affected pairs within the same family relative to the number
+    expected if the condition were spread independently of family membership.
+    """
+    F = (G.T @ X).tocsc()                    # family x condition affected counts
+    sizes = np.asarray(G.sum(axis=0)).ravel()  # members per family
+    observed = np.asarray(F.multiply(F - F.sign()).sum(axis=0)).ravel() / 2
+    members = max(G.shape[0], 1)
+    p = np.asarray(X.sum(axis=0)).ravel() / members
+    expected = (sizes * (sizes - 1) / 2).sum() * p ** 2
+    families_affected = np.asarray((F > 0).sum(axis=0)).ravel()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        enrichment = np.where(expected > 0, observed / expected, 0.0)
+    return families_affected, observed, enrichment
+
+
+def cross_generation(X, A, min_support):
+    """Condition a in a parent paired with condition b in their child, with enrichment over independence."""
+    T = (X.T @ A @ X).tocoo()  # T[a, b] = parent/child pairs with a in the parent and b in the child
+    pairs = max(A.nnz, 1)
+    parent_side = X.T @ np.asarray(A.sum(axis=1)).ravel()  # pairs whose parent has a
+    child_side = X.T @ np.asarray(A.sum(axis=0)).ravel()   # pairs whose child has b
+    keep = T.data >= min_support
+    rows, cols, counts = T.row[keep], T.col[keep], T.data[keep]
+    expected = parent_side[rows] * child_side[cols] / pairs
+    enrichment = np.where(expected > 0, counts / np.maximum(expected, 1e-12), 0.0)
+    return rows, cols, counts, enrichment
+
+
+def run(db, output=DEFAULT_OUTPUT, min_support=3, include_red=False):
+    """Runs the full job and writes the results file. Returns the output path."""
+    started = time.perf_counter()
+    condition_rows = export_conditions(db, include_red=include_red)
+    tree = FamilyTree.from_firestore(db)
+    print(f"Exported {len(condition_rows)} condition records in {time.perf_counter() - started:.1f}s")
+
+    patients, conditions, families, X, G, A = build_matrices(condition_rows, tree)
+    prevalence, co_rows, co_cols, co_counts, co_lift = cooccurrence(X, min_support)
+    families_affected, within_pairs, enrichment = familial_enrichment(X, G)
+    gen_rows, gen_cols, gen_counts, gen_enrichment = cross_generation(X, A, min_support)
+
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    np.savez_compressed(
+        output,
+        conditions=np.array(conditions, dtype=str),
+        prevalence=prevalence.astype(np.int32),
+        families_affected=families_affected.astype(np.int32),
+        within_family_pairs=within_pairs.astype(np.float32),
+        familial_enrichment=enrichment.astype(np.float32),
+        cooccurrence=np.stack([co_rows, co_cols]).astype(np.int32),
+        cooccurrence_count=co_counts.astype(np.int32),
+        cooccurrence_lift=co_lift.astype(np.float32),
+        cross_generation=np.stack([gen_rows, gen_cols]).astype(np.int32),
+        cross_generation_count=gen_counts.astype(np.int32),
+        cross_generation_enrichment=gen_enrichment.astype(np.float32),
+        totals=np.array([len(patients), len(families), A.nnz], dtype=np.int64),
+    )
+    print(f"Wrote {output}: {len(patients)} patients, {len(conditions)} conditions, {len(families)} families, "
+          f"{A.nnz} parent/child pairs in {time.perf_counter() - started:.1f}s")
+    return output
+
+
+# --- Loading (used by the dashboards) ---
+def load_results(path=DEFAULT_OUTPUT):
+    """Loads a results file into plain arrays, or returns None if the job has not been run."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        return {key: data[key] for key in data.files}
+
+
+def cross_generation_associations(results, condition, limit=5):
+    """Returns the conditions most enriched in children of parents with `condition` (and vice versa)."""
+    if results is None:
+        return []
+    names = list(results["conditions"])
+    key = canonical_label(condition).lower()
+    if key not in names:
+        return []
+    idx = names.index(key)
+    rows, cols = results["cross_generation"]
+    found = []
+    for mask, other, direction in ((rows == idx, cols, "in children"), (cols == idx, rows, "in parents")):
+        for j in np.flatnonzero(mask):
+            found.append({"condition": str(names[other[j]]), "direction": direction,
+                          "pairs": int(results["cross_generation_count"][j]),
+                          "enrichment": round(float(results["cross_generation_enrichment"][j]), 2)})
+    return sorted(found, key=lambda r: -r["enrichment"])[:limit]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mine hereditary condition co-occurrence across the patient base.")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--min-support", type=int, default=3, help="Minimum pair count kept in the output.")
+    parser.add_argument("--include-red", action="store_true", help="Include records patients marked as critical (Red).")
+    args = parser.parse_args()
+
+    from firebase_config import get_firestore_client
+    run(get_firestore_client(), args.output, args.min_support, args.include_red)
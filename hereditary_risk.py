@@ -0,0 +1,115 @@
+# hereditary_risk.py
+import threading
+
+import numpy as np
+
+from family_history import fetch_conditions_by_patient
+from family_tree import get_family_tree
+from ttl_cache import TTLCache
+
+# Group co-members whose relationship could not be parsed are weighted like third-degree relatives.
+# Members whose recorded relationship places them outside the blood relatives (spouses, in-laws,
+# relatives beyond DEFAULT_MAX_DEGREE) get no weight.
+UNSPECIFIED_RELATIVE_WEIGHT = 0.125
+# Results from other processes' writes are picked up after this many seconds at the latest.
+CACHE_TTL_SECONDS = 900
+MAX_CACHED_PATIENTS = 4096
+
+_lock = threading.Lock()
+_condition_versions = {}   # patient_id -> version, bumped whenever their conditions change
+_relative_conditions = TTLCache(ttl=CACHE_TTL_SECONDS, max_entries=MAX_CACHED_PATIENTS)  # patient_id -> (version, [descriptions])
+_score_cache = TTLCache(ttl=CACHE_TTL_SECONDS, max_entries=MAX_CACHED_PATIENTS)  # patient_id -> ({relative_id: (weight, version)}, scores)
+
+
+def mark_conditions_changed(patient_id):
+    """Call after any write to a patient's allergies_and_conditions so dependent scores are recomputed."""
+    with _lock:
+        _condition_versions[patient_id] = _condition_versions.get(patient_id, 0) + 1
+
+
+def _relative_weights(db, patient_id, group_ids):
+    """Returns {relative_id: (kinship weight, degree or None)} from the family tree and group membership."""
+    tree = get_family_tree(db)
+    weights = {rid: (kin.coefficient, kin.degree) for rid, kin in tree.relatives(patient_id).items()}
+    for group_id in group_ids or []:
+        for rid in tree.group_members(group_id):
+            if rid != patient_id and rid not in weights and not tree.has_known_relationship(rid):
+                weights.setdefault(rid, (UNSPECIFIED_RELATIVE_WEIGHT, None))
+    return weights
+
+
+def _load_relative_conditions(db, versions):
+    """
+    Returns {relative_id: [descriptions]} for {relative_id: condition version}, only fetching
+    relatives with no cached conditions at that version. A fetch that overlaps a change to the
+    relative's conditions is returned but not cached, so the next call fetches again.
+    """
+    conditions, stale = {}, []
+    for rid, version in versions.items():
+        cached = _relative_conditions.get(rid)
+        if cached is not None and cached[0] == version:
+            conditions[rid] = cached[1]
+        else:
+            stale.append(rid)
+    if stale:
+        fetched, _, _ = fetch_conditions_by_patient(db, stale)
+        with _lock:
+            for rid in stale:
+                conditions[rid] = fetched.get(rid, [])
+                if _condition_versions.get(rid, 0) == versions[rid]:
+                    _relative_conditions.set(rid, (versions[rid], conditions[rid]))
+    return conditions
+
+
+def score_conditions(weights, conditions_by_relative):
+    """
+    Computes kinship-weighted family prevalence for every condition seen among the relatives.
+
+    weights: {relative_id: (weight, degree)}; conditions_by_relative: {relative_id: [descriptions]}.
+    The score of a condition is sum(weight of affected relatives) / sum(all weights), computed as
+    a single matrix-vector product over a relatives x conditions indicator matrix.
+    """
+    relative_ids = list(weights)
+    vocabulary = sorted({c for rid in relative_ids for c in conditions_by_relative.get(rid, [])})
+    if not relative_ids or not vocabulary:
+        return []
+    column = {c: j for j, c in enumerate(vocabulary)}
+    indicator = np.zeros((len(relative_ids), len(vocabulary)), dtype=np.float32)
+    for i, rid in enumerate(relative_ids):
+        cols = [column[c] for c in set(conditions_by_relative.get(rid, []))]
+        indicator[i, cols] = 1.0
+
+    w = np.array([weights[rid][0] for rid in relative_ids], dtype=np.float32)
+    degrees = np.array([weights[rid][1] or 99 for rid in relative_ids], dtype=np.int32)
+    scores = (w @ indicator) / w.sum()
+    affected = indicator.sum(axis=0).astype(int)
+    # Closest affected relative per condition: mask unaffected relatives with a large degree
+    closest = np.where(indicator > 0, degrees[:, None], 99).min(axis=0)
+
+    order = np.argsort(-scores, kind="stable")
+    return [{
+        "condition": vocabulary[j],
+        "score": round(float(scores[j]), 4),
+        "relatives_affected": int(affected[j]),
+        "closest_degree": int(closest[j]) if closest[j] != 99 else None,
+    } for j in order]
+
+
+def get_hereditary_risk(db, patient_id, group_ids):
+    """
+    Returns the kinship-weighted condition scores for a patient, most prevalent first.
+
+    Cached per patient; the cache is reused as long as the set of relatives, their weights and
+    each relative's condition version are unchanged.
+    """
+    weights = _relative_weights(db, patient_id, group_ids)
+    with _lock:
+        versions = {rid: _condition_versions.get(rid, 0) for rid in weights}
+    fingerprint = {rid: (w, versions[rid]) for rid, (w, _) in weights.items()}
+    cached = _score_cache.get(patient_id)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+
+    scores = score_conditions(weights, _load_relative_conditions(db, versions))
+    _score_cache.set(patient_id, (fingerprint, scores))
+    return scores
@@ -0,0 +1,116 @@
+# local_blobs.py
+"""
+Directory-backed stand-in for the Firebase Storage bucket, used with the SQLite backend.
+
+Implements the calls the app makes on `bucket.blob(name)`: upload_from_file, upload_from_string,
+download_as_bytes, exists, delete, make_public, public_url (a file:// URL) and
+create_resumable_upload_session. Resumable sessions are a partial file under `.uploads/` whose
+file:// URL is the session URL; `committed_bytes` and `put_chunk` play the part of the GCS
+status query and chunk PUT, and the completed file is moved into place.
+"""
+import json
+import os
+import pathlib
+import shutil
+import urllib.parse
+import urllib.request
+import uuid
+
+UPLOADS_DIR = ".uploads"
+
+
+class LocalBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.content_type = None
+
+    @property
+    def _path(self):
+        path = (self.bucket.root / self.name).resolve()
+        if self.bucket.root not in path.parents:
+            raise ValueError(f"Blob name escapes the bucket directory: {self.name}")
+        return path
+
+    @property
+    def public_url(self):
+        return self._path.as_uri()
+
+    def upload_from_file(self, file_obj, content_type=None, **kwargs):
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self._path, "wb") as out:
+            shutil.copyfileobj(file_obj, out)
+        self.content_type = content_type
+
+    def upload_from_string(self, data, content_type=None, **kwargs):
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._path.write_bytes(data.encode() if isinstance(data, str) else data)
+        self.content_type = content_type
+
+    def download_as_bytes(self, **kwargs):
+        return self._path.read_bytes()
+
+    def exists(self, **kwargs):
+        return self._path.exists()
+
+    def delete(self, **kwargs):
+        self._path.unlink()
+
+    def make_public(self, **kwargs):
+        pass
+
+    def create_resumable_upload_session(self, content_type=None, size=None, **kwargs):
+        uploads = self.bucket.root / UPLOADS_DIR
+        uploads.mkdir(parents=True, exist_ok=True)
+        part = uploads / f"{uuid.uuid4().hex}.part"
+        part.touch()
+        part.with_suffix(".json").write_text(json.dumps({"name": self.name, "size": size, "content_type": content_type}))
+        return part.as_uri()
+
+
+class LocalBucket:
+    def __init__(self, root):
+        self.root = pathlib.Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.name = os.path.basename(self.root)
+
+    def blob(self, name):
+        return LocalBlob(self, name)
+
+    def get_blob(self, name):
+        blob = self.blob(name)
+        return blob if blob.exists() else None
+
+
+# --- Resumable sessions ---
+def _session_files(session_url):
+    part = pathlib.Path(urllib.request.url2pathname(urllib.parse.urlparse(session_url).path))
+    return part, part.with_suffix(".json")
+
+
+def committed_bytes(session_url):
+    """Returns how many bytes of the session are stored, or None if the session does not exist."""
+    part, meta = _session_files(session_url)
+    if not meta.exists():
+        return None
+    session = json.loads(meta.read_text())
+    if session.get("done"):
+        return session["size"]
+    return part.stat().st_size if part.exists() else None
+
+
+def put_chunk(session_url, data, start, total):
+    """Writes `data` at offset `start`; the chunk that reaches `total` bytes completes the upload. Returns the committed size."""
+    part, meta = _session_files(session_url)
+    session = json.loads(meta.read_text())
+    with open(part, "r+b") as out:
+        out.seek(start)
+        out.write(data)
+        out.truncate()
+    committed = start + len(data)
+    if committed >= total:
+        blob = LocalBucket(part.parent.parent).blob(session["name"])
+        blob._path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(part, blob._path)
+        meta.write_text(json.dumps({**session, "size": committed, "done": True}))
+    return committed
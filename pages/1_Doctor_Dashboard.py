@@ -1,13 +1,26 @@
 # pages/1_Doctor_Dashboard.py
 import streamlit as st
 from firebase_config import get_firestore_client, get_storage_bucket
+from firestore_metrics import begin_render, render_debug_panel
+from family_history import get_family_history
+from family_tree import get_family_tree
+from hereditary_risk import get_hereditary_risk
+from hereditary_cooccurrence import load_results, cross_generation_associations
+from condition_vocabulary import normalize, maternity_history_flags
+from patient_repository import get_patient, get_patients, load_patient_view, get_collection_records, add_record, set_patient
+from query_executor import format_timings
+from scan_uploads import blob_reference, start_scan_upload
+from scan_previews import scan_image, schedule as schedule_previews
+from search_index import search_patients
+from snapshot_sync import unwatch_patient, watch_patient
+from vitals_series import MEASURES, chart_series, latest as latest_vitals, maternity_features, record as record_vitals
 import pandas as pd
 from datetime import datetime
 import uuid
 import time
 import requests # Import requests to make API calls
 import json
-from datetime import date, datetime
+from datetime import date, datetime, timedelta, timezone
 
 # --- Helper function for colored dots ---
 def get_dot(category):
@@ -16,197 +29,243 @@ def get_dot(category):
     elif category == 'Yellow': return "🟡"
     else: return "🟢"
 
-# --- Page Configuration and Authentication ---
-st.set_page_config(
-    page_title="Doctor Dashboard",
-    page_icon="🩺",
-    layout="wide",
-    initial_sidebar_state="collapsed"
-)
+@st.cache_data(ttl=3600)
+def get_population_patterns():
+    """Loads the offline hereditary co-occurrence results once per hour."""
+    return load_results()
 
-st.markdown("""
-<style>
-    .css-1d391kg {display: none}
-    .css-1rs6os {display: none}
-    .css-17eq0hr {display: none}
-    [data-testid="stSidebar"] {display: none}
-    [data-testid="collapsedControl"] {display: none}
-    .css-1lcbmhc {margin-left: 0rem}
-    .css-1outpf7 {margin-left: 0rem}
-    section[data-testid="stSidebar"] {display: none !important}
-</style>
-""", unsafe_allow_html=True)
 
-if not st.session_state.get('doctor_logged_in'):
-    st.error("You must be logged in to view this page.")
-    st.stop()
+def scan_thumbnail(url):
+    """Returns thumbnail bytes from the local preview cache, or None if the scan has none (yet)."""
+    if not url: return None
+    try: return scan_image(bucket, url)
+    except Exception: return None
 
-st.title(f"🩺 Welcome, {st.session_state.get('doctor_name', 'Doctor')}!")
-st.sidebar.button("Logout", on_click=lambda: st.switch_page("app.py"))
 
-# --- Firebase Connection ---
-db = get_firestore_client()
-bucket = get_storage_bucket()
+# --- Dashboard sections ---
+# Each section is a fragment: interacting with it reruns only that section and its own reads.
 
-# --- Main Page Layout ---
-tab1, tab2, tab3 = st.tabs(["View/Manage Patient", "Create New Patient", "Maternity Risk Assessment"])
+@st.fragment
+def patient_records_section(patient_id):
+    view_red_data = st.toggle("🔴 Show Critical (Red) Records", help="Turn on to view records marked as critical.", key="view_red_data")
 
-# --- TAB 1: View/Manage Patient ---
-with tab1:
-    st.header("Patient Record Search")
-    with st.form("search_patient_form"):
-        search_patient_id = st.text_input("Enter Patient ID to Search")
-        search_submitted = st.form_submit_button("Search")
+    # --- Data Fetching and Filtering ---
+    patient_view = load_patient_view(db, patient_id)
+    patient_data = patient_view["patient"]
+    all_prescriptions = patient_view["prescriptions"]
+    all_allergies = patient_view["allergies_and_conditions"]
+    all_scans = patient_view["scans"]
 
-    if search_submitted and search_patient_id:
-        st.session_state.searched_patient_id = search_patient_id
-        st.session_state.access_granted = False
+    if view_red_data:
+        prescriptions, allergies, scans = all_prescriptions, all_allergies, all_scans
+    else:
+        prescriptions = [p for p in all_prescriptions if p.get('category', 'Green') in ['Green', 'Yellow']]
+        allergies = [a for a in all_allergies if a.get('category', 'Green') in ['Green', 'Yellow']]
+        scans = [s for s in all_scans if s.get('category', 'Green') in ['Green', 'Yellow']]
 
-    if 'searched_patient_id' in st.session_state:
-        patient_id = st.session_state.searched_patient_id
-        patient_doc = db.collection("patients").document(patient_id).get()
+    # --- Display Patient Data ---
+    st.write(f"**DOB:** {patient_data.get('DOB', 'N/A')} | **Blood Group:** {patient_data.get('BloodGroup', 'N/A')}")
+    col1, col2 = st.columns(2)
+    with col1:
+        with st.expander("🤧 Health History", expanded=True):
+            if allergies:
+                for allergy in allergies: st.info(f"{get_dot(allergy.get('category'))} {allergy['description']}")
+            else: st.write("No conditions to display.")
+    with col2:
+        with st.expander("📷 Medical Scans", expanded=True):
+            if scans:
+                for scan in scans:
+                    thumbnail = scan_thumbnail(scan.get('thumbnail_url'))
+                    text_col = st
+                    if thumbnail:
+                        thumb_col, text_col = st.columns([1, 3]); thumb_col.image(thumbnail)
+                    preview_link = f" | [Preview]({scan['preview_url']})" if scan.get('preview_url') else ""
+                    text_col.markdown(f"{get_dot(scan.get('category'))} **{scan['body_part']}**: [View Scan]({scan['file_url']}){preview_link}")
+            else: st.write("No scans to display.")
+    with st.expander("💊 Prescriptions", expanded=True):
+        if prescriptions:
+            df_data = [{"Category": get_dot(p.get('category')), "Medication": p['medication_name'], "Condition": p['condition'], "Duration": p['duration']} for p in prescriptions]
+            st.dataframe(pd.DataFrame(df_data), use_container_width=True)
+        else: st.write("No prescriptions to display.")
+    st.caption(f"Records loaded in {format_timings(patient_view)}")
 
-        if not patient_doc.exists:
-            st.error(f"No patient found with ID: {patient_id}.")
-        else:
-            patient_data = patient_doc.to_dict()
-            st.subheader(f"Records for Patient: {patient_data.get('Name', 'N/A')} (ID: {patient_id})")
+# The search index leaves out notes, Red records and confidential patients' records; results show
+# only which kind of record matched
+SEARCH_MATCH_LABELS = {"patients": "name", "allergies_and_conditions": "condition", "prescriptions": "medication"}
 
-            is_confidential = patient_data.get('confidential', False)
-            if is_confidential and not st.session_state.get('access_granted', False):
-                st.warning("🔒 This patient's records are marked as confidential.")
-                if st.button("Request Access to Confidential Data"):
-                    with st.spinner("Requesting..."): time.sleep(1)
-                    st.success("✅ OTP sent to patient for verification."); time.sleep(1)
-                    st.session_state.access_granted = True; st.rerun()
+VITALS_RANGES = {30: "Last 30 days", 365: "Last year", 1825: "Last 5 years"}
+ROLLUP_LABELS = {"day": "daily", "week": "weekly"}
+
+@st.fragment
+def vitals_section(patient_id):
+    st.subheader("📈 Vitals & Labs")
+    latest_values = latest_vitals(db, patient_id)
+    if latest_values:
+        metric_cols = st.columns(min(len(latest_values), 5))
+        for i, (measure, reading) in enumerate(sorted(latest_values.items())):
+            label, unit = MEASURES[measure]
+            metric_cols[i % len(metric_cols)].metric(label, f"{reading['value']:g} {unit}", help=f"Recorded {reading['at']:%Y-%m-%d %H:%M}")
+        chart_col, range_col = st.columns([3, 1])
+        with range_col:
+            measure = st.selectbox("Measure", sorted(latest_values), format_func=lambda m: MEASURES[m][0], key="vitals_measure")
+            days = st.selectbox("Range", list(VITALS_RANGES), format_func=VITALS_RANGES.get, key="vitals_range")
+        # Long ranges are drawn from the precomputed daily / weekly rollups, not raw readings
+        resolution, rows = chart_series(db, patient_id, measure, datetime.now(timezone.utc) - timedelta(days=days))
+        with chart_col:
+            if rows:
+                df = pd.DataFrame(rows)
+                st.line_chart(df.set_index("at")[["value"]] if resolution == "raw" else df.set_index("bucket")[["mean", "min", "max"]])
+                st.caption(f"{MEASURES[measure][0]} ({MEASURES[measure][1]}), {'individual readings' if resolution == 'raw' else f'{ROLLUP_LABELS[resolution]} mean, min and max'}")
             else:
-                if is_confidential: st.success("🔓 Access to confidential records granted.")
+                st.write("No readings in this range.")
+    else:
+        st.write("No vitals recorded yet.")
+    with st.form("record_vitals_form", clear_on_submit=True):
+        form_cols = st.columns(3)
+        values = {m: form_cols[i % 3].number_input(f"{label} ({unit})", value=None, min_value=0.0, key=f"vital_{m}") for i, (m, (label, unit)) in enumerate(MEASURES.items())}
+        if st.form_submit_button("Record Vitals"):
+            if record_vitals(db, patient_id, {m: v for m, v in values.items() if v is not None}):
+                st.rerun(scope="fragment")
+            else:
+                st.warning("Enter at least one value.")
 
-                view_red_data = st.toggle("🔴 Show Critical (Red) Records", help="Turn on to view records marked as critical.")
-
-                # --- Data Fetching and Filtering ---
-                all_prescriptions = [doc.to_dict() for doc in db.collection("prescriptions").where("patient_id", "==", patient_id).stream()]
-                all_allergies = [doc.to_dict() for doc in db.collection("allergies_and_conditions").where("patient_id", "==", patient_id).stream()]
-                all_scans = [doc.to_dict() for doc in db.collection("scans").where("patient_id", "==", patient_id).stream()]
-
-                if view_red_data:
-                    prescriptions, allergies, scans = all_prescriptions, all_allergies, all_scans
-                else:
-                    prescriptions = [p for p in all_prescriptions if p.get('category', 'Green') in ['Green', 'Yellow']]
-                    allergies = [a for a in all_allergies if a.get('category', 'Green') in ['Green', 'Yellow']]
-                    scans = [s for s in all_scans if s.get('category', 'Green') in ['Green', 'Yellow']]
-
-                # --- Display Patient Data ---
-                st.write(f"**DOB:** {patient_data.get('DOB', 'N/A')} | **Blood Group:** {patient_data.get('BloodGroup', 'N/A')}")
-                col1, col2 = st.columns(2)
-                with col1:
-                    with st.expander("🤧 Health History", expanded=True):
-                        if allergies:
-                            for allergy in allergies: st.info(f"{get_dot(allergy.get('category'))} {allergy['description']}")
-                        else: st.write("No conditions to display.")
-                with col2:
-                    with st.expander("📷 Medical Scans", expanded=True):
-                        if scans:
-                            for scan in scans: st.markdown(f"{get_dot(scan.get('category'))} **{scan['body_part']}**: [View Scan]({scan['file_url']})")
-                        else: st.write("No scans to display.")
-                with st.expander("💊 Prescriptions", expanded=True):
-                    if prescriptions:
-                        df_data = [{"Category": get_dot(p.get('category')), "Medication": p['medication_name'], "Condition": p['condition'], "Duration": p['duration']} for p in prescriptions]
-                        st.dataframe(pd.DataFrame(df_data), use_container_width=True)
-                    else: st.write("No prescriptions to display.")
-                st.divider()
+@st.fragment
+def ai_assistant_section(patient_id):
+    st.subheader("🤖 AI Clinical Assistant")
 
-                # --- AI Clinical Assistant Section ---
-                st.subheader("🤖 AI Clinical Assistant")
-
-                # Fetch and process family data
-                with st.spinner("Analyzing family health history..."):
-                    my_group_ids = patient_data.get('family_groups', [])
-                    all_relatives_ids = set()
-                    if my_group_ids:
-                        for group_id in my_group_ids:
-                            members_ref = db.collection("family_groups").document(group_id).collection("members").stream()
-                            for member in members_ref:
-                                all_relatives_ids.add(member.id)
-                    all_relatives_ids.discard(patient_id) # Remove current patient
-
-                    family_conditions = []
-                    for rel_id in all_relatives_ids:
-                        conds = db.collection("allergies_and_conditions").where("patient_id", "==", rel_id).stream()
-                        for cond in conds:
-                            c_data = cond.to_dict()
-                            if c_data.get('category', 'Green') in ['Green', 'Yellow']:
-                                family_conditions.append(c_data['description'])
-                    
-                    # Consolidate and anonymize family history
-                    anon_family_history = {"conditions": list(set(family_conditions))}
-
-                # Prepare data for the AI model
-                gy_allergies = [a['description'] for a in all_allergies if a.get('category', 'Green') in ['Green', 'Yellow']]
-                gy_prescriptions = [p['medication_name'] for p in all_prescriptions if p.get('category', 'Green') in ['Green', 'Yellow']]
-                
-                patient_context_for_ai = {
-                    "patient_conditions": gy_allergies,
-                    "patient_medications": gy_prescriptions,
-                    "family_history": anon_family_history,
-                }
+    patient_data = get_patient(db, patient_id)
+    all_prescriptions = get_collection_records(db, "prescriptions", patient_id)
+    all_allergies = get_collection_records(db, "allergies_and_conditions", patient_id)
+
+    # Fetch and process family data
+    with st.spinner("Analyzing family health history..."):
+        family_history = get_family_history(db, patient_id, patient_data.get('family_groups', []))
+        history_stats = family_history["stats"]
+
+        hereditary_scores = get_hereditary_risk(db, patient_id, patient_data.get('family_groups', []))
+
+        # Consolidate and anonymize family history
+        anon_family_history = {
+            "conditions": family_history["conditions"],
+            "kinship_weighted_prevalence": [{"condition": r["condition"], "score": r["score"], "closest_degree": r["closest_degree"]} for r in hereditary_scores[:10]],
+        }
 
-                with st.expander("View Data Sent to AI"):
-                    st.json(patient_context_for_ai)
+    # Prepare data for the AI model
+    gy_allergies = [a['description'] for a in all_allergies if a.get('category', 'Green') in ['Green', 'Yellow']]
+    gy_prescriptions = [p['medication_name'] for p in all_prescriptions if p.get('category', 'Green') in ['Green', 'Yellow']]
 
-                procedure = st.text_input("Enter a medical procedure or context for analysis", key="ai_procedure")
+    patient_context_for_ai = {
+        "patient_conditions": gy_allergies,
+        "patient_medications": gy_prescriptions,
+        "family_history": anon_family_history,
+    }
 
-                if st.button("Analyze with AI", key="ai_analyze_button"):
-                    if not procedure:
-                        st.warning("Please enter a procedure to analyze.")
+    with st.expander("🌳 Family Tree"):
+        tree_relatives = get_family_tree(db).relatives(patient_id)
+        if tree_relatives:
+            relative_names = get_patients(db, tree_relatives)
+            tree_rows = [{"Relative": (relative_names.get(rid) or {}).get('Name', rid), "Patient ID": rid, "Relationship": kin.label.title(), "Degree": kin.degree} for rid, kin in sorted(tree_relatives.items(), key=lambda item: (item[1].degree, item[0]))]
+            st.dataframe(pd.DataFrame(tree_rows), use_container_width=True, hide_index=True)
+        else:
+            st.write("No blood relatives found in this patient's family groups.")
+        if hereditary_scores:
+            st.markdown("**Kinship-weighted family prevalence**")
+            st.dataframe(pd.DataFrame(hereditary_scores).rename(columns={"condition": "Condition", "score": "Score", "relatives_affected": "Relatives Affected", "closest_degree": "Closest Degree"}), use_container_width=True, hide_index=True)
+        population_patterns = get_population_patterns()
+        # Built from Green/Yellow conditions only, like the AI context, so this section does not depend on the Red toggle
+        pattern_rows = [{"Patient Condition": description, **assoc} for description in gy_allergies for assoc in cross_generation_associations(population_patterns, description, limit=3)]
+        if pattern_rows:
+            st.markdown("**Cross-generation patterns in the patient base**")
+            st.dataframe(pd.DataFrame(pattern_rows), use_container_width=True, hide_index=True)
+
+    with st.expander("View Data Sent to AI"):
+        st.json(patient_context_for_ai)
+        st.caption(f"Family history: {history_stats['relatives']} relatives across {history_stats['groups']} groups, "
+                   f"{history_stats['member_reads'] + history_stats['condition_reads']} reads in {history_stats['queries']} queries, "
+                   f"{history_stats['total_ms']} ms")
+
+    procedure = st.text_input("Enter a medical procedure or context for analysis", key="ai_procedure")
+
+    if st.button("Analyze with AI", key="ai_analyze_button"):
+        if not procedure:
+            st.warning("Please enter a procedure to analyze.")
+        else:
+            api_url = "http://127.0.0.1:5001/api/medical/analyze"
+            payload = {"patient_data": patient_context_for_ai, "procedure": procedure}
+            with st.spinner("AI is analyzing the data..."):
+                try:
+                    response = requests.post(api_url, json=payload, timeout=60)
+                    if response.status_code == 200:
+                        result = response.json()
+                        st.info("**AI Patient Summary:**")
+                        st.markdown(result.get("patient_statement"))
+                        st.success("**AI Generated Questions for Doctor:**")
+                        st.markdown(result.get("doctor_response"))
                     else:
-                        api_url = "http://127.0.0.1:5001/api/medical/analyze"
-                        payload = {"patient_data": patient_context_for_ai, "procedure": procedure}
-                        with st.spinner("AI is analyzing the data..."):
-                            try:
-                                response = requests.post(api_url, json=payload, timeout=60)
-                                if response.status_code == 200:
-                                    result = response.json()
-                                    st.info("**AI Patient Summary:**")
-                                    st.markdown(result.get("patient_statement"))
-                                    st.success("**AI Generated Questions for Doctor:**")
-                                    st.markdown(result.get("doctor_response"))
-                                else:
-                                    st.error(f"Error from AI service: {response.status_code} - {response.text}")
-                            except requests.exceptions.RequestException as e:
-                                st.error(f"Could not connect to the AI analysis service. Is the backend running? Error: {e}")
-                
-                st.divider()
-              
-                st.subheader("Add New Records")
-                form_col1, form_col2, form_col3 = st.columns(3)
-                with form_col1:
-                    with st.form("add_allergy_form", clear_on_submit=True):
-                        new_allergy = st.text_input("Add Health Condition")
-                        if st.form_submit_button("Add"):
-                            if new_allergy:
-                                db.collection("allergies_and_conditions").add({"patient_id": patient_id, "description": new_allergy, "category": "Green", "timestamp": datetime.now()})
-                                st.success("Allergy added!"); st.rerun()
-                with form_col2:
-                    with st.form("add_prescription_form", clear_on_submit=True):
-                        med_name = st.text_input("Medication Name")
-                        condition = st.text_input("Condition")
-                        if st.form_submit_button("Add"):
-                            if med_name and condition:
-                                db.collection("prescriptions").add({"patient_id": patient_id, "medication_name": med_name, "condition": condition, "duration": "N/A", "timing": [], "category": "Green", "timestamp": datetime.now()})
-                                st.success("Prescription added!"); st.rerun()
-                with form_col3:
-                     with st.form("upload_scan_form", clear_on_submit=True):
-                        scan_file = st.file_uploader("Upload Scan", type=['png', 'jpg', 'pdf'])
-                        body_part = st.text_input("Body Part Scanned")
-                        if st.form_submit_button("Upload"):
-                            if scan_file and body_part:
-                                blob = bucket.blob(f"scans/{patient_id}/{scan_file.name}"); blob.upload_from_file(scan_file, content_type=scan_file.type); blob.make_public()
-                                db.collection("scans").add({"patient_id": patient_id, "body_part": body_part, "file_url": blob.public_url, "category": "Green", "timestamp": datetime.now()})
-                                st.success("Scan uploaded!"); st.rerun()
+                        st.error(f"Error from AI service: {response.status_code} - {response.text}")
+                except requests.exceptions.RequestException as e:
+                    st.error(f"Could not connect to the AI analysis service. Is the backend running? Error: {e}")
 
-# --- TAB 2: Create New Patient ---
-with tab2:
+@st.fragment
+def add_records_section(patient_id):
+    st.subheader("Add New Records")
+    form_col1, form_col2, form_col3 = st.columns(3)
+    with form_col1:
+        with st.form("add_allergy_form", clear_on_submit=True):
+            new_allergy = st.text_input("Add Health Condition")
+            if st.form_submit_button("Add"):
+                if new_allergy:
+                    add_record(db, "allergies_and_conditions", {"patient_id": patient_id, "description": new_allergy, "condition_code": normalize(new_allergy), "category": "Green", "timestamp": datetime.now()})
+                    st.success("Allergy added!"); st.rerun()  # full rerun so the record tables and AI context pick it up
+    with form_col2:
+        with st.form("add_prescription_form", clear_on_submit=True):
+            med_name = st.text_input("Medication Name")
+            condition = st.text_input("Condition")
+            if st.form_submit_button("Add"):
+                if med_name and condition:
+                    add_record(db, "prescriptions", {"patient_id": patient_id, "medication_name": med_name, "condition": condition, "condition_code": normalize(condition), "duration": "N/A", "timing": [], "category": "Green", "timestamp": datetime.now()})
+                    st.success("Prescription added!"); st.rerun()
+    with form_col3:
+         with st.form("upload_scan_form", clear_on_submit=True):
+            scan_file = st.file_uploader("Upload Scan", type=['png', 'jpg', 'pdf'])
+            body_part = st.text_input("Body Part Scanned")
+            if st.form_submit_button("Upload"):
+                if scan_file and body_part:
+                    # Hashed and streamed in chunks on a worker thread (content already stored is not sent again);
+                    # the scan record is added when the file is in place
+                    job = start_scan_upload(db, bucket, scan_file, scan_file.size, scan_file.type,
+                                            on_complete=lambda job, body_part=body_part: add_scan_record(patient_id, body_part, job))
+                    st.session_state.scan_upload_jobs = st.session_state.get("scan_upload_jobs", []) + [(scan_file.name, job)]
+                    st.rerun()  # full rerun so the progress fragment starts polling
+
+def add_scan_record(patient_id, body_part, job):
+    """Adds the scan record and its reference to the content blob in one batch, then queues its previews."""
+    scan_ref = add_record(db, "scans", {"patient_id": patient_id, "body_part": body_part, "file_url": job.blob.public_url, "blob_digest": job.sha256, "size": job.size, "category": "Green", "timestamp": datetime.now()},
+                          merges=[blob_reference(db, job.sha256)])
+    schedule_previews(db, bucket, scan_ref.id, patient_id, job.blob_name, job.sha256)
+
+@st.fragment(run_every=1)
+def scan_upload_progress():
+    """Polls the running scan uploads; only rendered while there are any."""
+    jobs = st.session_state.get("scan_upload_jobs", [])
+    for name, job in jobs:
+        if job.status == "failed":
+            error_col, dismiss_col = st.columns([5, 1])
+            error_col.error(f"Upload of {name} failed: {job.error}. Upload the same file again to resume where it stopped.")
+            if dismiss_col.button("Dismiss", key=f"dismiss_upload_{id(job)}"):
+                st.session_state.scan_upload_jobs = [(n, j) for n, j in jobs if j is not job]
+                st.rerun()
+        elif job.status in ("queued", "hashing"):
+            st.progress(0.0, text=f"Checking {name}...")
+        else:
+            resumed = f", resumed at {job.resumed_from / job.size:.0%}" if job.resumed_from else ""
+            st.progress(job.progress, text=f"Uploading {name}: {job.uploaded / 1e6:.1f} of {job.size / 1e6:.1f} MB{resumed}")
+    if any(job.status == "done" for _, job in jobs):
+        st.session_state.scan_upload_jobs = [(name, job) for name, job in jobs if job.status != "done"]
+        st.rerun()  # full rerun so the record tables show the new scan
+
+@st.fragment
+def create_patient_section():
     st.header("Create a New Patient Record")
     with st.form("new_patient_form", clear_on_submit=True):
         p_name = st.text_input("Full Name")
@@ -216,7 +275,7 @@ with tab2:
         p_blood_group = st.selectbox("Blood Group", ["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"])
         p_ethnicity = st.text_input("Ethnicity")
         p_password = st.text_input("Set Patient Password", type="password")
-        
+
         if st.form_submit_button("Create Patient"):
             if all([p_name, p_dob, p_phone, p_password]):
                 patient_id = f"PAT-{str(uuid.uuid4())[:8].upper()}"
@@ -231,33 +290,32 @@ with tab2:
                     "confidential": False,
                     "family_groups": []
                 }
-                db.collection("patients").document(patient_id).set(patient_data)
+                set_patient(db, patient_id, patient_data)
                 st.success(f"✅ Patient created: {p_name}")
                 st.info("Provide these credentials to the patient:")
                 st.code(f"Patient ID: {patient_id}\nPassword: {p_password}")
             else:
                 st.error("Please fill in all required details.")
 
-# --- TAB 3: Maternity Risk Assessment ---
-with tab3:
+@st.fragment
+def maternity_risk_section():
     st.header("🤱 Maternity Risk Assessment")
     st.write("Enter a patient ID to automatically assess pregnancy-related risks based on their stored medical data.")
-    
+
     # Simple patient ID input form
     with st.form("maternity_patient_search"):
         risk_patient_id = st.text_input("Enter Patient ID for Risk Assessment", placeholder="PAT-12345678")
         assess_risk = st.form_submit_button("🔍 Assess Maternity Risk", use_container_width=True)
-    
+
     if assess_risk and risk_patient_id:
         # Fetch patient data from Firebase
-        patient_doc = db.collection("patients").document(risk_patient_id).get()
-        
-        if not patient_doc.exists:
+        patient_data = get_patient(db, risk_patient_id)
+
+        if patient_data is None:
             st.error(f"❌ No patient found with ID: {risk_patient_id}")
         else:
-            patient_data = patient_doc.to_dict()
             st.success(f"✅ Patient found: {patient_data.get('Name', 'N/A')}")
-            
+
             # Display patient basic info
             col_info1, col_info2 = st.columns(2)
             with col_info1:
@@ -266,54 +324,62 @@ with tab3:
             with col_info2:
                 st.write(f"**Gender:** {patient_data.get('Gender', 'N/A')}")
                 st.write(f"**Blood Group:** {patient_data.get('BloodGroup', 'N/A')}")
-            
+
             # Calculate age from DOB
             try:
                 dob = datetime.strptime(patient_data.get('DOB', '1990-01-01'), '%Y-%m-%d')
                 age = (datetime.now() - dob).days // 365
             except:
                 age = 25  # default age
-            
-            # For this simplified version, we'll use default/estimated values
-            # In a real implementation, you'd have additional patient data stored
+
+            # History flags are derived from the patient's recorded conditions via the condition vocabulary
+            risk_conditions = [c.get('description', '') for c in get_collection_records(db, "allergies_and_conditions", risk_patient_id)]
+            history_flags = maternity_history_flags(risk_conditions)
+
+            # BMI, blood pressure, hemoglobin and glucose come from the latest recorded vitals (one cached read)
+            recent_vitals = maternity_features(db, risk_patient_id)
             assessment_data = {
                 "age": age,
-                "bmi": 22.0,  # Default - would need to be stored in patient data
-                "blood_pressure": 120,  # Default - would come from recent vitals
-                "hemoglobin": 12.0,  # Default - would come from recent lab results
-                "glucose": 90,  # Default - would come from recent lab results
+                "bmi": recent_vitals.get("bmi", 22.0),
+                "blood_pressure": recent_vitals.get("blood_pressure", 120),
+                "hemoglobin": recent_vitals.get("hemoglobin", 12.0),
+                "glucose": recent_vitals.get("glucose", 90),
                 "parity": 0,  # Default - would be stored in patient obstetric history
                 "education": "Graduate",  # Default - could be stored in patient demographics
                 "smoking": "No",  # Default - would be stored in patient social history
                 "income": "Middle",  # Default - could be stored in patient demographics
-                "history_anemia": "No",  # Would check patient's allergy/condition records
-                "history_gdm": "No",  # Would check patient's medical history
-                "history_preeclampsia": "No",  # Would check patient's medical history
-                "history_preterm": "No"  # Would check patient's obstetric history
+                "history_anemia": history_flags["history_anemia"],
+                "history_gdm": history_flags["history_gdm"],
+                "history_preeclampsia": history_flags["history_preeclampsia"],
+                "history_preterm": history_flags["history_preterm"]
             }
-            
-            st.info("ℹ️ Using default values for missing medical data. In production, this would pull from comprehensive patient records including vitals, lab results, and medical history.")
-            
+
+            defaulted = [feature.replace("_", " ") for feature in ("bmi", "blood_pressure", "hemoglobin", "glucose") if feature not in recent_vitals]
+            if defaulted:
+                st.info(f"ℹ️ No recorded vitals for: {', '.join(defaulted)}. Using default values for these and for obstetric and social history.")
+            else:
+                st.info("ℹ️ Vitals taken from the latest recorded values. Obstetric and social history use default values.")
+
             # Make API call to maternity risk model
             api_url = "http://127.0.0.1:5000/predict"
-            
+
             with st.spinner("Analyzing maternity risks..."):
                 try:
                     response = requests.post(api_url, json=assessment_data, timeout=30)
-                    
+
                     if response.status_code == 200:
                         result = response.json()
                         predictions = result.get("prediction", {})
                         explanations = result.get("explanation_top_features", {})
-                        
+
                         st.success("✅ Risk Assessment Complete!")
-                        
+
                         # Display results in a structured format
                         st.subheader("📊 Risk Assessment Results")
-                        
+
                         # Create columns for different risk types
                         risk_col1, risk_col2 = st.columns(2)
-                        
+
                         with risk_col1:
                             # Gestational Diabetes Risk
                             gdm_risk = predictions.get("risk_gdm", 0)
@@ -321,22 +387,22 @@ with tab3:
                                 st.error("🔴 **High Risk: Gestational Diabetes**")
                             else:
                                 st.success("🟢 **Low Risk: Gestational Diabetes**")
-                            
+
                             if "risk_gdm" in explanations:
                                 st.write(f"*{explanations['risk_gdm']}*")
-                            
+
                             st.divider()
-                            
+
                             # Anemia Risk
                             anemia_risk = predictions.get("risk_anemia", 0)
                             if anemia_risk == 1:
                                 st.error("🔴 **High Risk: Anemia**")
                             else:
                                 st.success("🟢 **Low Risk: Anemia**")
-                            
+
                             if "risk_anemia" in explanations:
                                 st.write(f"*{explanations['risk_anemia']}*")
-                        
+
                         with risk_col2:
                             # Preeclampsia Risk
                             preeclampsia_risk = predictions.get("risk_preeclampsia", 0)
@@ -344,60 +410,60 @@ with tab3:
                                 st.error("🔴 **High Risk: Preeclampsia**")
                             else:
                                 st.success("🟢 **Low Risk: Preeclampsia**")
-                            
+
                             if "risk_preeclampsia" in explanations:
                                 st.write(f"*{explanations['risk_preeclampsia']}*")
-                            
+
                             st.divider()
-                            
+
                             # Preterm Labor Risk
                             preterm_risk = predictions.get("risk_preterm_labor", 0)
                             if preterm_risk == 1:
                                 st.error("🔴 **High Risk: Preterm Labor**")
                             else:
                                 st.success("🟢 **Low Risk: Preterm Labor**")
-                            
+
                             if "risk_preterm_labor" in explanations:
                                 st.write(f"*{explanations['risk_preterm_labor']}*")
-                        
+
                         st.divider()
-                        
+
                         # Summary and Recommendations
                         st.subheader("📝 Clinical Summary & Recommendations")
-                        
+
                         high_risks = [risk.replace("risk_", "").replace("_", " ").title() 
                                     for risk, value in predictions.items() if value == 1]
-                        
+
                         if high_risks:
                             st.warning(f"**High-risk conditions identified:** {', '.join(high_risks)}")
                             st.write("**Recommended Actions:**")
-                            
+
                             recommendations = []
                             if gdm_risk == 1:
                                 recommendations.append("• Monitor glucose levels regularly")
                                 recommendations.append("• Consider dietary counseling")
                                 recommendations.append("• Schedule more frequent prenatal visits")
-                            
+
                             if preeclampsia_risk == 1:
                                 recommendations.append("• Monitor blood pressure closely")
                                 recommendations.append("• Watch for signs of preeclampsia (headaches, vision changes)")
                                 recommendations.append("• Consider low-dose aspirin prophylaxis")
-                            
+
                             if anemia_risk == 1:
                                 recommendations.append("• Iron supplementation")
                                 recommendations.append("• Dietary modifications to include iron-rich foods")
                                 recommendations.append("• Monitor hemoglobin levels")
-                            
+
                             if preterm_risk == 1:
                                 recommendations.append("• Monitor for signs of preterm labor")
                                 recommendations.append("• Consider cervical length monitoring")
                                 recommendations.append("• Educate patient on warning signs")
-                            
+
                             for rec in recommendations:
                                 st.write(rec)
                         else:
                             st.success("**Low risk for all assessed conditions.** Continue with routine prenatal care.")
-                        
+
                         # Option to save assessment
                         if st.button("💾 Save Assessment to Patient Record"):
                             # Save assessment results to Firebase
@@ -411,32 +477,152 @@ with tab3:
                             }
                             db.collection("maternity_assessments").add(assessment_record)
                             st.success("Assessment saved to patient record!")
-                    
+
                     else:
                         st.error(f"❌ Error from risk assessment service: {response.status_code}")
                         if response.text:
                             st.code(response.text)
-                            
+
                 except requests.exceptions.ConnectionError:
                     st.error("❌ Could not connect to the maternity risk assessment service. Please ensure the Flask backend is running on http://127.0.0.1:5000")
                 except requests.exceptions.Timeout:
                     st.error("❌ Request timed out. The assessment service may be overloaded.")
                 except Exception as e:
                     st.error(f"❌ An unexpected error occurred: {str(e)}")
-    
+
     # Additional information section
     with st.expander("ℹ️ About Maternity Risk Assessment"):
         st.write("""
         This AI-powered tool automatically assesses pregnancy-related risks using patient data from their medical records.
         Simply enter a patient ID to get an instant risk assessment covering:
-        
+
         - **Gestational Diabetes Mellitus (GDM)**: High blood sugar during pregnancy
         - **Preeclampsia**: High blood pressure and organ damage during pregnancy  
         - **Anemia**: Low red blood cell count or hemoglobin levels
         - **Preterm Labor**: Labor that begins before 37 weeks of pregnancy
-        
-        **Note:** Currently uses default values for missing medical data. In a full implementation, 
-        this would pull comprehensive data including recent vitals, lab results, and complete medical history.
-        
+
+        **Note:** BMI, blood pressure, hemoglobin and glucose come from the patient's latest recorded vitals;
+        default values are used where none are recorded, and for obstetric and social history.
+
         **Important:** This tool assists clinical decision-making and should not replace professional medical judgment.
-        """)
\ No newline at end of file
+        """)
+
+# --- Page Configuration and Authentication ---
+st.set_page_config(
+    page_title="Doctor Dashboard",
+    page_icon="🩺",
+    layout="wide",
+    initial_sidebar_state="collapsed"
+)
+
+st.markdown("""
+<style>
+    .css-1d391kg {display: none}
+    .css-1rs6os {display: none}
+    .css-17eq0hr {display: none}
+    [data-testid="stSidebar"] {display: none}
+    [data-testid="collapsedControl"] {display: none}
+    .css-1lcbmhc {margin-left: 0rem}
+    .css-1outpf7 {margin-left: 0rem}
+    section[data-testid="stSidebar"] {display: none !important}
+</style>
+""", unsafe_allow_html=True)
+
+if not st.session_state.get('doctor_logged_in'):
+    st.error("You must be logged in to view this page.")
+    st.stop()
+
+st.title(f"🩺 Welcome, {st.session_state.get('doctor_name', 'Doctor')}!")
+
+
+def logout():
+    # Release this session's record listeners before leaving the page
+    unwatch_patient()
+    st.switch_page("app.py")
+
+
+st.sidebar.button("Logout", on_click=logout)
+
+# --- Firebase Connection ---
+db = get_firestore_client()
+begin_render("doctor_dashboard")
+bucket = get_storage_bucket()
+
+# --- Main Page Layout ---
+tab1, tab2, tab3 = st.tabs(["View/Manage Patient", "Create New Patient", "Maternity Risk Assessment"])
+
+# --- TAB 1: View/Manage Patient ---
+with tab1:
+    st.header("Patient Record Search")
+    with st.form("search_patient_form"):
+        search_query = st.text_input("Search by Patient ID, name, condition or medication")
+        search_submitted = st.form_submit_button("Search")
+
+    if search_submitted and search_query:
+        # Names, conditions and medications come from the local full-text index; anything it
+        # does not match is looked up as a Patient ID
+        st.session_state.patient_search_results = search_patients(search_query)
+        if not st.session_state.patient_search_results:
+            unwatch_patient()
+            st.session_state.searched_patient_id = search_query.strip()
+            st.session_state.access_granted = False
+
+    if st.session_state.get("patient_search_results"):
+        st.caption(f"{len(st.session_state.patient_search_results)} matching patient(s)")
+        for match in st.session_state.patient_search_results:
+            matched_on = ", ".join(dict.fromkeys(SEARCH_MATCH_LABELS[hit["collection"]] for hit in match["matches"]))
+            result_cols = st.columns([5, 1])
+            result_cols[0].markdown(f"**{match['name']}** ({match['patient_id']}), matched on {matched_on}")
+            if result_cols[1].button("Open", key=f"open_{match['patient_id']}"):
+                unwatch_patient()
+                st.session_state.searched_patient_id = match["patient_id"]
+                st.session_state.access_granted = False
+                st.session_state.patient_search_results = None
+                st.rerun()
+
+    if 'searched_patient_id' in st.session_state:
+        patient_id = st.session_state.searched_patient_id
+        watch_patient(db, patient_id)
+        # Patient document and record collections are fetched together, concurrently where not cached
+        patient_view = load_patient_view(db, patient_id)
+        patient_data = patient_view["patient"]
+
+        if patient_data is None:
+            st.error(f"No patient found with ID: {patient_id}.")
+        else:
+            st.subheader(f"Records for Patient: {patient_data.get('Name', 'N/A')} (ID: {patient_id})")
+
+            is_confidential = patient_data.get('confidential', False)
+            if is_confidential and not st.session_state.get('access_granted', False):
+                st.warning("🔒 This patient's records are marked as confidential.")
+                if st.button("Request Access to Confidential Data"):
+                    with st.spinner("Requesting..."): time.sleep(1)
+                    st.success("✅ OTP sent to patient for verification."); time.sleep(1)
+                    st.session_state.access_granted = True; st.rerun()
+            else:
+                if is_confidential: st.success("🔓 Access to confidential records granted.")
+
+                patient_records_section(patient_id)
+                st.divider()
+
+                vitals_section(patient_id)
+                st.divider()
+
+                # --- AI Clinical Assistant Section ---
+                ai_assistant_section(patient_id)
+                st.divider()
+
+                add_records_section(patient_id)
+                if st.session_state.get("scan_upload_jobs"):
+                    scan_upload_progress()
+
+# --- TAB 2: Create New Patient ---
+with tab2:
+    create_patient_section()
+
+# --- TAB 3: Maternity Risk Assessment ---
+with tab3:
+    maternity_risk_section()
+
+# --- Firestore usage for this render (debug panel with ?debug=firestore) ---
+render_debug_panel()
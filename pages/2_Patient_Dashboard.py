@@ -1,23 +1,35 @@
 # pages/2_Patient_Dashboard.py
 import streamlit as st
-from firebase_config import get_firestore_client
+from firebase_config import get_firestore_client, get_storage_bucket
+from firestore_metrics import begin_render, render_debug_panel
+from family_tree import record_member_added
+from patient_repository import get_patient, get_patients, load_patient_view, invalidate, update_patient
+from batch_fetch import FetchScope
+from query_executor import format_timings
+from pagination import CursorPaginator, visible_rows, render_show_more
+from edit_buffer import get_edit_buffer
+from snapshot_sync import unwatch_patient, watch_patient
+from patient_snapshot import stage_profile_update
+from search_index import index_document, search
+from scan_previews import scan_image
 import pandas as pd
 from datetime import datetime
 from google.cloud.firestore_v1.base_query import FieldFilter
 from google.cloud import firestore
 
-# Imports for Voice-to-Text Feature
+# Imports for Voice-to-Text Feature (pydub, the Speech SDK and streamlit_webrtc load lazily in voice_recorder)
 import logging
 import io
-import pydub
-import azure.cognitiveservices.speech as speechsdk
-from streamlit_webrtc import webrtc_streamer, WebRtcMode, AudioProcessorBase
 import sys
 import os
 import queue # Import the queue library
 from dotenv import load_dotenv
 load_dotenv()  
 
+NOTES_PAGE_SIZE = 10
+RECORDS_PAGE_SIZE = 25
+AUTOSAVE_POLL_SECONDS = 1
+
 # --- Helper functions ---
 def get_dot(category):
     """Returns a colored emoji dot based on the category string."""
@@ -25,12 +37,23 @@ def get_dot(category):
     elif category == 'Yellow': return "🟡"
     else: return "🟢"
 
+def scan_thumbnail(url):
+    """Returns thumbnail bytes from the local preview cache, or None if the scan has none (yet)."""
+    if not url: return None
+    try: return scan_image(get_storage_bucket(), url)
+    except Exception: return None
+
 def update_category(collection, doc_id, key):
-    """Callback function to update a document's category in Firestore."""
+    """Callback function to queue a document's category change; changes are written together."""
     new_category = st.session_state.get(key)
     if new_category:
-        db.collection(collection).document(doc_id).update({"category": new_category})
-        st.toast("Category updated!", icon="✅")
+        category_edits.stage(collection, doc_id, {"category": new_category})
+
+def save_category_edits():
+    saved = category_edits.commit(db)
+    if saved:
+        # Shown by the records section, which reruns after every save
+        st.session_state.category_edits_saved = saved
 
 # --- Page Configuration and Authentication ---
 st.set_page_config(
@@ -59,13 +82,24 @@ if not st.session_state.get('patient_logged_in'):
     st.stop()
 
 st.title(f"👤 Welcome, {st.session_state.get('patient_name', 'Patient')}!")
-st.sidebar.button("Logout", on_click=lambda: st.switch_page("app.py"))
+
+
+def logout():
+    # Release this session's record listeners before leaving the page
+    unwatch_patient()
+    st.switch_page("app.py")
+
+
+st.sidebar.button("Logout", on_click=logout)
 
 # --- Firebase Connection ---
 db = get_firestore_client()
+begin_render("patient_dashboard")
 patient_id = st.session_state.patient_id
 patient_name = st.session_state.patient_name
 patient_ref = db.collection("patients").document(patient_id)
+watch_patient(db, patient_id)
+category_edits = get_edit_buffer("category_edits", patient_id)
 
 # --- Initialize Session State ---
 if 'viewing_group_id' not in st.session_state:
@@ -73,18 +107,31 @@ if 'viewing_group_id' not in st.session_state:
 if "note_content" not in st.session_state:
     st.session_state.note_content = ""
 
-# --- Main Page Layout ---
-tab1, tab2, tab3 = st.tabs(["Medical Records 🩺", "Private Voice Notes 🧠", "Family Tree Group 🌳"])
+# --- Data Fetching ---
+# On a full run all independent reads are issued together, warming the caches the sections read
+# from; notes are paged with a cursor and only the first page joins this fan-out
+notes_pager = CursorPaginator(
+    f"notes_pages_{patient_id}",
+    db.collection("mental_health_notes").where(filter=FieldFilter("patient_id", "==", patient_id)),
+    page_size=NOTES_PAGE_SIZE,
+    count_key=("mental_health_notes", patient_id),
+)
+notes_pager.accept(load_patient_view(db, patient_id, extra_queries=notes_pager.prefetch_queries("notes")).get("notes"))
 
-# =================================================================================================
-# --- TAB 1: Medical Records ---
-# =================================================================================================
-with tab1:
+# --- Dashboard sections ---
+# Each tab is a fragment: interacting with it reruns only that tab and its own reads.
+
+@st.fragment
+def medical_records_section():
+    saved = st.session_state.pop("category_edits_saved", None)
+    if saved:
+        st.toast(f"{saved} categor{'y' if saved == 1 else 'ies'} updated!", icon="✅")
     st.header("Privacy & Record Categorization")
     st.caption("Mark your entire record as confidential or set the priority for each item below.")
+    patient_view = load_patient_view(db, patient_id)
     # --- Settings ---
     try:
-        patient_data = patient_ref.get().to_dict()
+        patient_data = patient_view["patient"]
         current_confidential_status = patient_data.get('confidential', False)
     except Exception as e:
         st.error(f"Could not load your data: {e}")
@@ -92,7 +139,7 @@ with tab1:
 
     new_status = st.toggle("🔒 Mark all my records as Confidential", value=current_confidential_status)
     if new_status != current_confidential_status:
-        patient_ref.update({"confidential": new_status}); st.toast("Privacy setting updated!")
+        update_patient(db, patient_id, {"confidential": new_status}); st.toast("Privacy setting updated!")
     st.divider()
 
     st.header("Your Medical Records")
@@ -100,17 +147,18 @@ with tab1:
 
     # Prescriptions Table
     st.subheader("💊 Prescriptions")
-    prescriptions = [{"id": doc.id, **doc.to_dict()} for doc in db.collection("prescriptions").where(filter=FieldFilter("patient_id", "==", patient_id)).stream()]
+    prescriptions = category_edits.overlay("prescriptions", patient_view["prescriptions"])
     if prescriptions:
         h_cols = st.columns([3,3,2,1,2]); h_cols[0].markdown("**Medication**"); h_cols[1].markdown("**Condition**"); h_cols[2].markdown("**Duration**"); h_cols[3].markdown("**Status**"); h_cols[4].markdown("**Set Category**"); st.markdown("---")
-        for p in prescriptions:
+        for p in visible_rows("prescriptions_shown", prescriptions, RECORDS_PAGE_SIZE):
             cat = p.get('category', 'Green')
             r_cols = st.columns([3,3,2,1,2]); r_cols[0].write(p.get('medication_name')); r_cols[1].write(p.get('condition')); r_cols[2].write(p.get('duration')); r_cols[3].write(get_dot(cat)); r_cols[4].selectbox("Set", CAT_OPTIONS, index=CAT_OPTIONS.index(cat), key=f"p_{p['id']}", on_change=update_category, args=("prescriptions", p['id'], f"p_{p['id']}"), label_visibility="collapsed")
+        render_show_more("prescriptions_shown", prescriptions, RECORDS_PAGE_SIZE)
     else: st.info("No prescriptions found.")
 
     # Allergies Table
     st.subheader("🤧 Health History")
-    allergies = [{"id": doc.id, **doc.to_dict()} for doc in db.collection("allergies_and_conditions").where(filter=FieldFilter("patient_id", "==", patient_id)).stream()]
+    allergies = category_edits.overlay("allergies_and_conditions", patient_view["allergies_and_conditions"])
     if allergies:
         h_cols = st.columns([6,1,2]); h_cols[0].markdown("**Description**"); h_cols[1].markdown("**Status**"); h_cols[2].markdown("**Set Category**"); st.markdown("---")
         for a in allergies:
@@ -120,19 +168,55 @@ with tab1:
 
     # Scans Table
     st.subheader("📷 Medical Scans")
-    scans = [{"id": doc.id, **doc.to_dict()} for doc in db.collection("scans").where(filter=FieldFilter("patient_id", "==", patient_id)).stream()]
+    scans = category_edits.overlay("scans", patient_view["scans"])
     if scans:
         h_cols = st.columns([5,2,1,2]); h_cols[0].markdown("**Body Part**"); h_cols[1].markdown("**View File**"); h_cols[2].markdown("**Status**"); h_cols[3].markdown("**Set Category**"); st.markdown("---")
-        for s in scans:
+        for s in visible_rows("scans_shown", scans, RECORDS_PAGE_SIZE):
             cat = s.get('category', 'Green')
-            r_cols = st.columns([5,2,1,2]); r_cols[0].write(s.get('body_part')); r_cols[1].markdown(f"[Link to Scan]({s.get('file_url')})"); r_cols[2].write(get_dot(cat)); r_cols[3].selectbox("Set", CAT_OPTIONS, index=CAT_OPTIONS.index(cat), key=f"s_{s['id']}", on_change=update_category, args=("scans", s['id'], f"s_{s['id']}"), label_visibility="collapsed")
+            thumbnail = scan_thumbnail(s.get('thumbnail_url'))
+            r_cols = st.columns([5,2,1,2]); r_cols[0].write(s.get('body_part'))
+            if thumbnail: r_cols[0].image(thumbnail, width=120)
+            r_cols[1].markdown(f"[Link to Scan]({s.get('file_url')})"); r_cols[2].write(get_dot(cat)); r_cols[3].selectbox("Set", CAT_OPTIONS, index=CAT_OPTIONS.index(cat), key=f"s_{s['id']}", on_change=update_category, args=("scans", s['id'], f"s_{s['id']}"), label_visibility="collapsed")
+        render_show_more("scans_shown", scans, RECORDS_PAGE_SIZE)
     else: st.info("No scans found.")
-
-# =================================================================================================
-# --- TAB 2: Private Voice Notes ---
-# =================================================================================================
-with tab2:
-    # --- Basic Configuration ---
+    st.caption(f"Loaded in {format_timings(patient_view)}")
+    # The autosave bar polls only while edits are pending, like the scan upload progress
+    if len(category_edits):
+        category_edits_bar()
+
+SEARCH_LABELS = {"patients": "👤 Profile", "prescriptions": "💊 Prescription", "allergies_and_conditions": "🤧 Health history", "mental_health_notes": "🧠 Private note"}
+
+@st.fragment
+def record_search_section():
+    """Searches the patient's own records and private notes in the local full-text index."""
+    query = st.text_input("🔎 Search your records and notes", placeholder="e.g. asthma, metformin, sleep", key="own_search_query")
+    if query:
+        hits = search(query, patient_id=patient_id, include_private=True)
+        if hits:
+            for hit in hits:
+                st.markdown(f"**{SEARCH_LABELS.get(hit['collection'], hit['collection'])}**: {hit['text']}")
+        else:
+            st.info("No matching records or notes.")
+
+@st.fragment(run_every=AUTOSAVE_POLL_SECONDS)
+def category_edits_bar():
+    """Shows unsaved category changes and commits them once they have been idle for the debounce interval."""
+    if category_edits.due:
+        save_category_edits()
+    if not len(category_edits):
+        # Saved: rerun the page so this fragment is no longer rendered and stops polling
+        st.rerun()
+    else:
+        save_cols = st.columns([4,1])
+        save_cols[0].info(f"{len(category_edits)} unsaved category change(s). They are saved automatically after a few seconds, or now:")
+        save_cols[1].button("Save changes", on_click=save_category_edits, type="primary")
+
+def voice_recorder():
+    """Renders the WebRTC recorder that transcribes a voice note into the note text area."""
+    # Audio and speech dependencies are imported only when the recorder is opened
+    import pydub
+    import azure.cognitiveservices.speech as speechsdk
+    from streamlit_webrtc import webrtc_streamer, WebRtcMode, AudioProcessorBase
     logging.getLogger("pydub").setLevel(logging.WARNING)
 
     # Use st.cache_resource to create the speech_config object only once.
@@ -155,162 +239,170 @@ with tab2:
 
     if not speech_config:
         st.error("Audio transcription is disabled. Please set the environment variables: `SPEECH_KEY` and `SPEECH_ENDPOINT`.")
-    else:
-        # --- WebRTC Audio Processor with Queue for reliable communication ---
-        class AzureSpeechSDKProcessor(AudioProcessorBase):
-            def __init__(self, result_queue):
-                self.audio_frames = []
-                self.is_processing = False
-                self.result_queue = result_queue # To send results back to the main thread
-
-            def recv_queued(self, frames):
-                self.audio_frames.extend(frames)
-
-            def on_ended(self):
-                if self.is_processing or not self.audio_frames:
-                    return
-
-                self.is_processing = True
-                sound = pydub.AudioSegment.empty()
-                for frame in self.audio_frames:
-                    sound += frame
-                self.audio_frames.clear()
-
-                if sound.duration_seconds < 0.5:
-                    self.is_processing = False
-                    return
-
-                try:
-                    sound = sound.set_frame_rate(16000).set_sample_width(2).set_channels(1)
-                    wav_buffer = io.BytesIO()
-                    sound.export(wav_buffer, format="wav")
-                    stream = speechsdk.audio.PushAudioInputStream()
-                    stream.write(wav_buffer.getvalue())
-                    stream.close()
-
-                    audio_config = speechsdk.audio.AudioConfig(stream=stream)
-                    speech_recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=audio_config)
-                    result = speech_recognizer.recognize_once_async().get()
-
-                    final_text = ""
-                    if result.reason == speechsdk.ResultReason.RecognizedSpeech:
-                        final_text = result.text
-                    elif result.reason == speechsdk.ResultReason.NoMatch:
-                        final_text = "Error: Speech could not be recognized."
-                    elif result.reason == speechsdk.ResultReason.Canceled:
-                        final_text = f"Error: Transcription canceled - {result.cancellation_details.reason}"
-
-                    # Put the result into the queue to safely pass it to the main thread
-                    self.result_queue.put(final_text)
-                except Exception as e:
-                    self.result_queue.put(f"An error occurred during transcription: {e}")
-                finally:
-                    self.is_processing = False
-
-        # --- Streamlit UI Components ---
-        st.header("My Private Voice Notes")
-        st.caption("A safe space for your thoughts. These notes are private and not shared with your doctor.")
-        st.markdown("---")
-        st.subheader("Add a Voice Note")
-        st.write("Click START to record your thoughts. Grant microphone access when prompted.")
-
-        # Create the queue before the streamer
-        result_queue = queue.Queue()
-
-        webrtc_ctx = webrtc_streamer(
-            key="speech-to-text-recorder",
-            mode=WebRtcMode.SENDONLY,
-            # Pass the queue to the processor factory
-            audio_processor_factory=lambda: AzureSpeechSDKProcessor(result_queue=result_queue),
-            media_stream_constraints={"video": False, "audio": True},
-        )
+        return
 
-        if webrtc_ctx.state.playing:
-            st.info("🎙️ Recording... Click STOP to finish.")
-        else:
-            st.info("▶️ Recorder is ready. Click START to begin.")
+    # --- WebRTC Audio Processor with Queue for reliable communication ---
+    class AzureSpeechSDKProcessor(AudioProcessorBase):
+        def __init__(self, result_queue):
+            self.audio_frames = []
+            self.is_processing = False
+            self.result_queue = result_queue # To send results back to the main thread
+
+        def recv_queued(self, frames):
+            self.audio_frames.extend(frames)
+
+        def on_ended(self):
+            if self.is_processing or not self.audio_frames:
+                return
+
+            self.is_processing = True
+            sound = pydub.AudioSegment.empty()
+            for frame in self.audio_frames:
+                sound += frame
+            self.audio_frames.clear()
+
+            if sound.duration_seconds < 0.5:
+                self.is_processing = False
+                return
 
-        # Check the queue for a result when the recorder is not playing
-        if not webrtc_ctx.state.playing:
             try:
-                # Non-blocking get from the queue
-                result = result_queue.get(block=False)
-                st.session_state.note_content = result
-                st.rerun() # Rerun to update the text_area with the new content
-            except queue.Empty:
-                pass # No result yet
-
-        st.markdown("---")
-        st.subheader("Your Note")
-
-        with st.form("mental_health_note_form"):
-            note_content_input = st.text_area(
-                "Your transcribed text will appear here. You can also type or edit directly.",
-                value=st.session_state.note_content, height=200, key="text_area_content"
-            )
-            submitted = st.form_submit_button("Save Note to Diary")
-            if submitted and note_content_input:
-                db.collection("mental_health_notes").add({
-                    "patient_id": patient_id,
-                    "note": note_content_input,
-                    "timestamp": firestore.SERVER_TIMESTAMP
-                })
-                st.success("Your note has been saved successfully!")
-                st.session_state.note_content = "" # Clear the text area after saving
-                st.rerun()
-
-        st.header("Your Past Entries")
-        notes_ref = db.collection("mental_health_notes").where(filter=FieldFilter("patient_id", "==", patient_id)).order_by("timestamp", direction="DESCENDING").stream()
-        notes_list = list(notes_ref)
-
-        if not notes_list:
-            st.info("You haven't saved any notes yet.")
-        else:
-            for note_doc in notes_list:
-                note = note_doc.to_dict()
-                if 'timestamp' in note and isinstance(note['timestamp'], datetime):
-                    entry_date = note['timestamp'].strftime("%B %d, %Y at %I:%M %p")
-                    with st.expander(f"**Note from: {entry_date}**"):
-                        st.write(note['note'])
-                else:
-                    st.warning(f"Note with ID {note_doc.id} has a missing or invalid timestamp.")
-
-# =================================================================================================
-# --- TAB 3: Family Tree Group ---
-# =================================================================================================
-# This tab's code remains unchanged.
-with tab3:
+                sound = sound.set_frame_rate(16000).set_sample_width(2).set_channels(1)
+                wav_buffer = io.BytesIO()
+                sound.export(wav_buffer, format="wav")
+                stream = speechsdk.audio.PushAudioInputStream()
+                stream.write(wav_buffer.getvalue())
+                stream.close()
+
+                audio_config = speechsdk.audio.AudioConfig(stream=stream)
+                speech_recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=audio_config)
+                result = speech_recognizer.recognize_once_async().get()
+
+                final_text = ""
+                if result.reason == speechsdk.ResultReason.RecognizedSpeech:
+                    final_text = result.text
+                elif result.reason == speechsdk.ResultReason.NoMatch:
+                    final_text = "Error: Speech could not be recognized."
+                elif result.reason == speechsdk.ResultReason.Canceled:
+                    final_text = f"Error: Transcription canceled - {result.cancellation_details.reason}"
+
+                # Put the result into the queue to safely pass it to the main thread
+                self.result_queue.put(final_text)
+            except Exception as e:
+                self.result_queue.put(f"An error occurred during transcription: {e}")
+            finally:
+                self.is_processing = False
+
+    st.write("Click START to record your thoughts. Grant microphone access when prompted.")
+
+    # Create the queue before the streamer
+    result_queue = queue.Queue()
+
+    webrtc_ctx = webrtc_streamer(
+        key="speech-to-text-recorder",
+        mode=WebRtcMode.SENDONLY,
+        # Pass the queue to the processor factory
+        audio_processor_factory=lambda: AzureSpeechSDKProcessor(result_queue=result_queue),
+        media_stream_constraints={"video": False, "audio": True},
+    )
+
+    if webrtc_ctx.state.playing:
+        st.info("🎙️ Recording... Click STOP to finish.")
+    else:
+        st.info("▶️ Recorder is ready. Click START to begin.")
+
+    # Check the queue for a result when the recorder is not playing
+    if not webrtc_ctx.state.playing:
+        try:
+            # Non-blocking get from the queue
+            result = result_queue.get(block=False)
+            st.session_state.note_content = result
+            st.rerun(scope="fragment") # Rerun to update the text_area with the new content
+        except queue.Empty:
+            pass # No result yet
+
+@st.fragment
+def voice_notes_section():
+    # --- Streamlit UI Components ---
+    st.header("My Private Voice Notes")
+    st.caption("A safe space for your thoughts. These notes are private and not shared with your doctor.")
+    st.markdown("---")
+    st.subheader("Add a Voice Note")
+    if st.toggle("🎙️ Record with microphone", key="voice_recorder_open"):
+        voice_recorder()
+    else:
+        st.write("Turn on the recorder to dictate a note, or type it below.")
+
+    st.markdown("---")
+    st.subheader("Your Note")
+
+    with st.form("mental_health_note_form"):
+        note_content_input = st.text_area(
+            "Your transcribed text will appear here. You can also type or edit directly.",
+            value=st.session_state.note_content, height=200, key="text_area_content"
+        )
+        submitted = st.form_submit_button("Save Note to Diary")
+        if submitted and note_content_input:
+            _, note_ref = db.collection("mental_health_notes").add({
+                "patient_id": patient_id,
+                "note": note_content_input,
+                "timestamp": firestore.SERVER_TIMESTAMP
+            })
+            index_document("mental_health_notes", note_ref.id, patient_id, {"note": note_content_input})
+            notes_pager.reset()
+            st.success("Your note has been saved successfully!")
+            st.session_state.note_content = "" # Clear the text area after saving
+            st.rerun(scope="fragment")
+
+    st.header("Your Past Entries")
+    notes_list = notes_pager.items
+
+    if not notes_list:
+        st.info("You haven't saved any notes yet.")
+    else:
+        for note_doc in notes_list:
+            note = note_doc.to_dict()
+            if 'timestamp' in note and isinstance(note['timestamp'], datetime):
+                entry_date = note['timestamp'].strftime("%B %d, %Y at %I:%M %p")
+                with st.expander(f"**Note from: {entry_date}**"):
+                    st.write(note['note'])
+            else:
+                st.warning(f"Note with ID {note_doc.id} has a missing or invalid timestamp.")
+        notes_pager.render_load_more("Load older notes")
+
+@st.fragment
+def family_groups_section():
+    fetch_scope = FetchScope(db)  # memoizes document lookups for this run of the section
     st.header("Family Tree Groups")
     st.caption("Create or join groups to share health information with family members.")
     # (Rest of Tab 3 code is here)
     if st.session_state.viewing_group_id:
         group_id = st.session_state.viewing_group_id
-        group_doc = db.collection("family_groups").document(group_id).get()
-        if group_doc.exists:
-            st.subheader(f"Managing Group: *{group_doc.to_dict().get('group_name')}*")
+        group_data = fetch_scope.get("family_groups", group_id)
+        if group_data is not None:
+            st.subheader(f"Managing Group: *{group_data.get('group_name')}*")
         if st.button("⬅️ Back to All Groups"):
             st.session_state.viewing_group_id = None
-            st.rerun()
+            st.rerun(scope="fragment")
         with st.expander("Add a new family member to this group"):
             with st.form("add_member_form", clear_on_submit=True):
                 new_member_id = st.text_input("New Member's Patient ID")
                 relationship = st.text_input("Their relationship to you (e.g., Father, Sister, Son)")
                 if st.form_submit_button("Add Member") and new_member_id and relationship:
-                    new_member_ref = db.collection("patients").document(new_member_id)
-                    new_member_doc = new_member_ref.get()
-                    if not new_member_doc.exists:
+                    new_member_data = get_patient(db, new_member_id)
+                    if new_member_data is None:
                         st.error("Patient ID not found.")
                     else:
-                        new_member_name = new_member_doc.to_dict().get('Name', 'N/A')
+                        new_member_name = new_member_data.get('Name', 'N/A')
                         db.collection("family_groups").document(group_id).collection("members").document(new_member_id).set({"name": new_member_name,"relationship": relationship,"relative_to_id": patient_id,"added_at": firestore.SERVER_TIMESTAMP})
-                        new_member_ref.update({"family_groups": firestore.ArrayUnion([group_id])})
-                        st.success(f"Added {new_member_name} to the group!");st.rerun()
+                        update_patient(db, new_member_id, {"family_groups": firestore.ArrayUnion([group_id])})
+                        record_member_added(group_id, new_member_id, relationship, patient_id)
+                        st.success(f"Added {new_member_name} to the group!");st.rerun(scope="fragment")
         st.subheader("Group Members")
         members_ref = db.collection("family_groups").document(group_id).collection("members").stream()
         members_list = [m.to_dict() for m in members_ref]
         if members_list:
             relative_ids = {m['relative_to_id'] for m in members_list if 'relative_to_id' in m}
-            relatives_map = {rid: db.collection('patients').document(rid).get().to_dict().get('Name', 'Unknown') for rid in relative_ids}
+            relatives_map = {rid: (data or {}).get('Name', 'Unknown') for rid, data in get_patients(db, relative_ids).items()}
             h_cols = st.columns([2,2,2]); h_cols[0].markdown("**Name**"); h_cols[1].markdown("**Relationship**"); h_cols[2].markdown("**Relative To**")
             for member in members_list:
                 r_cols = st.columns([2,2,2]); r_cols[0].write(member.get('name')); r_cols[1].write(member.get('relationship')); r_cols[2].write(relatives_map.get(member.get('relative_to_id'), "N/A"))
@@ -322,21 +414,43 @@ with tab3:
                 group_name = st.text_input("New Group Name (e.g., Paternal Side)")
                 if st.form_submit_button("Create Group") and group_name:
                     new_group_ref = db.collection("family_groups").document()
-                    batch = db.batch();batch.set(new_group_ref, {"group_name": group_name,"creator_id": patient_id,"created_at": firestore.SERVER_TIMESTAMP});members_subcollection = new_group_ref.collection("members");batch.set(members_subcollection.document(patient_id), {"name": patient_name,"relationship": "Self","relative_to_id": patient_id,"added_at": firestore.SERVER_TIMESTAMP});batch.update(patient_ref, {"family_groups": firestore.ArrayUnion([new_group_ref.id])});batch.commit()
-                    st.success(f"Group '{group_name}' created!");st.rerun()
+                    batch = db.batch();batch.set(new_group_ref, {"group_name": group_name,"creator_id": patient_id,"created_at": firestore.SERVER_TIMESTAMP});members_subcollection = new_group_ref.collection("members");batch.set(members_subcollection.document(patient_id), {"name": patient_name,"relationship": "Self","relative_to_id": patient_id,"added_at": firestore.SERVER_TIMESTAMP});batch.update(patient_ref, {"family_groups": firestore.ArrayUnion([new_group_ref.id]), "updated_at": firestore.SERVER_TIMESTAMP});stage_profile_update(batch, db, patient_id, {"family_groups": firestore.ArrayUnion([new_group_ref.id])});batch.commit()
+                    invalidate(patient_id, "patient")
+                    record_member_added(new_group_ref.id, patient_id, "Self", patient_id)
+                    st.success(f"Group '{group_name}' created!");st.rerun(scope="fragment")
         st.subheader("Your Existing Groups")
         try:
-            patient_doc_data = patient_ref.get().to_dict()
+            patient_doc_data = get_patient(db, patient_id)
             my_group_ids = patient_doc_data.get('family_groups', [])
             if not my_group_ids:
                 st.info("You are not part of any groups yet. Create one to get started.")
             else:
+                groups = fetch_scope.get_many("family_groups", my_group_ids)
                 for group_id in my_group_ids:
-                    group_doc = db.collection("family_groups").document(group_id).get()
-                    if group_doc.exists:
-                        g_cols = st.columns([3,1]);g_cols[0].write(f"**{group_doc.to_dict().get('group_name')}**")
+                    group_data = groups.get(group_id)
+                    if group_data is not None:
+                        g_cols = st.columns([3,1]);g_cols[0].write(f"**{group_data.get('group_name')}**")
                         if g_cols[1].button("View/Manage", key=f"view_{group_id}"):
                             st.session_state.viewing_group_id = group_id
-                            st.rerun()
+                            st.rerun(scope="fragment")
         except Exception as e:
-            st.error("Could not load your family groups. Ensure your patient profile has the 'family_groups' field.")
\ No newline at end of file
+            st.error("Could not load your family groups. Ensure your patient profile has the 'family_groups' field.")
+
+# --- Main Page Layout ---
+tab1, tab2, tab3 = st.tabs(["Medical Records 🩺", "Private Voice Notes 🧠", "Family Tree Group 🌳"])
+
+# --- TAB 1: Medical Records ---
+with tab1:
+    record_search_section()
+    medical_records_section()
+
+# --- TAB 2: Private Voice Notes ---
+with tab2:
+    voice_notes_section()
+
+# --- TAB 3: Family Tree Group ---
+with tab3:
+    family_groups_section()
+
+# --- Firestore usage for this render (debug panel with ?debug=firestore) ---
+render_debug_panel()
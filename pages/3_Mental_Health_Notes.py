@@ -1,6 +1,10 @@
 # pages/3_Mental_Health_Notes.py
 import streamlit as st
 from firebase_config import get_firestore_client
+from firestore_metrics import begin_render, render_debug_panel
+from pagination import CursorPaginator
+from search_index import index_document
+from google.cloud.firestore_v1.base_query import FieldFilter
 from datetime import datetime
 import azure.cognitiveservices.speech as speechsdk
 from streamlit_webrtc import webrtc_streamer, WebRtcMode, AudioProcessorBase
@@ -42,7 +46,14 @@ speech_config = speechsdk.SpeechConfig(subscription=SPEECH_KEY, region=SPEECH_RE
 
 
 db = get_firestore_client()
+begin_render("mental_health_notes")
 patient_id = st.session_state.patient_id
+notes_pager = CursorPaginator(
+    f"notes_pages_{patient_id}",
+    db.collection("mental_health_notes").where(filter=FieldFilter("patient_id", "==", patient_id)),
+    page_size=10,
+    count_key=("mental_health_notes", patient_id),
+)
 
 # --- WebRTC Audio Processor for Azure ---
 class AzureAudioProcessor(AudioProcessorBase):
@@ -145,11 +156,13 @@ with st.form("mental_health_note_form"):
     submitted = st.form_submit_button("Save Note to Diary")
 
     if submitted and note_content_input:
-        db.collection("mental_health_notes").add({
+        _, note_ref = db.collection("mental_health_notes").add({
             "patient_id": patient_id,
             "note": note_content_input,
             "timestamp": datetime.now()
         })
+        index_document("mental_health_notes", note_ref.id, patient_id, {"note": note_content_input})
+        notes_pager.reset()
         st.success("Your note has been saved successfully!")
         st.session_state.note_content = "" # Clear content after saving
         st.rerun()
@@ -157,8 +170,7 @@ with st.form("mental_health_note_form"):
 # --- Display Past Notes ---
 st.header("Your Past Entries")
 try:
-    notes_ref = db.collection("mental_health_notes").where("patient_id", "==", patient_id).order_by("timestamp", direction="DESCENDING").stream()
-    notes_entries = list(notes_ref)
+    notes_entries = notes_pager.items
 
     if notes_entries:
         for note_doc in notes_entries:
@@ -166,7 +178,11 @@ try:
             entry_date = note['timestamp'].strftime("%B %d, %Y at %I:%M %p")
             with st.expander(f"**Note from: {entry_date}**"):
                 st.write(note['note'])
+        notes_pager.render_load_more("Load older notes")
     else:
         st.info("You haven't saved any notes yet. Use the form above to get started.")
 except Exception as e:
-    st.error(f"Failed to load notes: {e}")
\ No newline at end of file
+    st.error(f"Failed to load notes: {e}")
+
+# --- Firestore usage for this render (debug panel with ?debug=firestore) ---
+render_debug_panel()
@@ -0,0 +1,131 @@
+# pagination.py
+"""
+Cursor-based pagination with "load more" for long, ordered record lists.
+
+Pages already loaded are kept in `st.session_state`, so a rerun renders them without reading
+Firestore again; "Load more" fetches only the next page with `start_after` on the last
+document seen. Total counts come from an aggregation query cached for a few minutes.
+"""
+import streamlit as st
+
+from ttl_cache import TTLCache
+
+DEFAULT_PAGE_SIZE = 20
+COUNT_TTL_SECONDS = 300
+
+_count_cache = TTLCache(ttl=COUNT_TTL_SECONDS)
+
+
+def load_page(query, order_field, page_size, cursor=None, descending=True):
+    """Returns (documents, last_document, exhausted) for the page after `cursor` (a DocumentSnapshot)."""
+    ordered = query.order_by(order_field, direction="DESCENDING" if descending else "ASCENDING")
+    if cursor is not None:
+        ordered = ordered.start_after(cursor)
+    docs = list(ordered.limit(page_size + 1).stream())
+    exhausted = len(docs) <= page_size
+    docs = docs[:page_size]
+    return docs, (docs[-1] if docs else cursor), exhausted
+
+
+def cached_count(query, count_key):
+    """Returns the number of documents matching `query`, cached under `count_key`."""
+    total = _count_cache.get(count_key)
+    if total is None:
+        total = query.count().get()[0][0].value
+        _count_cache.set(count_key, total)
+    return total
+
+
+def invalidate_count(count_key):
+    _count_cache.invalidate(lambda key: key == count_key)
+
+
+class CursorPaginator:
+    """Accumulates pages of an ordered query in session state under `state_key`."""
+
+    def __init__(self, state_key, query, order_field="timestamp", descending=True, page_size=DEFAULT_PAGE_SIZE, count_key=None):
+        self.state_key = state_key
+        self.query = query
+        self.order_field = order_field
+        self.descending = descending
+        self.page_size = page_size
+        self.count_key = count_key or state_key
+
+    @property
+    def _state(self):
+        if self.state_key not in st.session_state:
+            st.session_state[self.state_key] = {"docs": [], "cursor": None, "exhausted": False, "loaded": False}
+        return st.session_state[self.state_key]
+
+    def _fetch_next(self):
+        return load_page(self.query, self.order_field, self.page_size, self._state["cursor"], self.descending)
+
+    def prefetch_queries(self, name):
+        """
+        Returns {name: callable} for the first page if it is not loaded yet, so it can join the
+        render's concurrent fan-out; pass that result to `accept`. Returns {} otherwise.
+        """
+        if self._state["loaded"]:
+            return {}
+        query, order_field, page_size, descending = self.query, self.order_field, self.page_size, self.descending
+        return {name: lambda: load_page(query, order_field, page_size, None, descending)}
+
+    def accept(self, page):
+        """Appends a page fetched via `prefetch_queries` (None is ignored)."""
+        if page is None:
+            return
+        docs, cursor, exhausted = page
+        state = self._state
+        state.update(docs=state["docs"] + docs, cursor=cursor, exhausted=exhausted, loaded=True)
+
+    @property
+    def items(self):
+        """Documents loaded so far (loads the first page if needed)."""
+        if not self._state["loaded"]:
+            self.accept(self._fetch_next())
+        return self._state["docs"]
+
+    @property
+    def has_more(self):
+        return not self._state["exhausted"]
+
+    def load_more(self):
+        self.accept(self._fetch_next())
+
+    def reset(self):
+        """Forgets loaded pages and the cached count, e.g. after a new document is written."""
+        st.session_state.pop(self.state_key, None)
+        invalidate_count(self.count_key)
+
+    def total(self):
+        return cached_count(self.query, self.count_key)
+
+    def render_load_more(self, label="Load more"):
+        """Shows 'Showing X of Y' and a load-more button while more pages exist."""
+        loaded = len(self._state["docs"])
+        try:
+            st.caption(f"Showing {loaded} of {self.total()}")
+        except Exception:
+            st.caption(f"Showing {loaded}")
+        if self.has_more and st.button(label, key=f"{self.state_key}_more"):
+            self.load_more()
+            st.rerun()
+
+
+def visible_rows(state_key, items, page_size=DEFAULT_PAGE_SIZE):
+    """
+    For lists already held in memory (e.g. from the record cache): returns the first N items,
+    where N grows by `page_size` each time the "Show more" button below the list is pressed.
+    Call `render_show_more` after rendering the returned rows.
+    """
+    limit = st.session_state.get(state_key, page_size)
+    return items[:limit]
+
+
+def render_show_more(state_key, items, page_size=DEFAULT_PAGE_SIZE):
+    limit = st.session_state.get(state_key, page_size)
+    if len(items) > limit:
+        st.caption(f"Showing {limit} of {len(items)}")
+        if st.button("Show more", key=f"{state_key}_more"):
+            st.session_state[state_key] = limit + page_size
+            st.rerun()
@@ -0,0 +1,298 @@
+# parquet_export.py
+"""
+Incremental export of the clinical collections to partitioned Parquet for analytics.
+
+    python parquet_export.py --out exports/            # first run: full export; later runs: incremental
+    python parquet_export.py --out exports/ --full     # force a full re-export
+    python parquet_export.py --out exports/ --collections prescriptions,scans
+
+Layout (hive partitioning, readable by pandas, pyarrow, DuckDB, Spark):
+
+    exports/<collection>/month=YYYY-MM/part-<run_id>.parquet     records, by month of their event time
+    exports/patients/part-<run_id>.parquet                       patients (not partitioned)
+    exports/_watermarks.json                                     per-collection watermarks and run history
+
+Every column has a fixed Arrow type (see COLLECTIONS); maternity assessments are flattened into one
+column per prediction and model feature. Each row also carries `_id` and `_exported_at`.
+
+Watermarks: after a run, each collection remembers the highest `timestamp` / `assessment_date` and
+`updated_at` it exported. The next run only queries documents at or above those values (minus
+--lookback-minutes, to absorb client clock skew), so new records and records re-categorized or
+edited through patient_snapshot are picked up without rescanning the collection. Records that
+change appear once per export run; `read_collection()` keeps the latest version of each document.
+Deletions are not tracked; run with --full to reconcile them.
+"""
+import argparse
+import datetime
+import json
+import os
+import time
+import uuid
+
+WATERMARK_FILE = "_watermarks.json"
+DEFAULT_PAGE_SIZE = 5000
+ROWS_PER_FLUSH = 10000
+DEFAULT_LOOKBACK_MINUTES = 10
+
+# column: (source field path, type); types: string, strings (list), int, float, bool, timestamp, date, json
+_RECORD_COLUMNS = {"patient_id": ("patient_id", "string"), "category": ("category", "string")}
+_TIMES = {"timestamp": ("timestamp", "timestamp"), "updated_at": ("updated_at", "timestamp")}
+COLLECTIONS = {
+    "patients": {
+        "watermarks": ("updated_at",),
+        "partition_by": None,
+        "columns": {
+            "name": ("Name", "string"), "dob": ("DOB", "date"), "gender": ("Gender", "string"), "blood_group": ("BloodGroup", "string"),
+            "ethnicity": ("Ethnicity", "string"), "confidential": ("confidential", "bool"), "family_groups": ("family_groups", "strings"),
+            "updated_at": ("updated_at", "timestamp"),
+        },
+    },
+    "prescriptions": {
+        "watermarks": ("timestamp", "updated_at"),
+        "partition_by": "timestamp",
+        "columns": {
+            **_RECORD_COLUMNS, "medication_name": ("medication_name", "string"), "condition": ("condition", "string"),
+            "condition_code": ("condition_code", "string"), "duration": ("duration", "string"), "timing": ("timing", "strings"), **_TIMES,
+        },
+    },
+    "allergies_and_conditions": {
+        "watermarks": ("timestamp", "updated_at"),
+        "partition_by": "timestamp",
+        "columns": {**_RECORD_COLUMNS, "description": ("description", "string"), "condition_code": ("condition_code", "string"), **_TIMES},
+    },
+    "scans": {
+        "watermarks": ("timestamp", "updated_at"),
+        "partition_by": "timestamp",
+        "columns": {**_RECORD_COLUMNS, "body_part": ("body_part", "string"), "file_url": ("file_url", "string"), **_TIMES},
+    },
+    "maternity_assessments": {
+        "watermarks": ("assessment_date",),
+        "partition_by": "assessment_date",
+        "columns": {
+            "patient_id": ("patient_id", "string"), "assessment_date": ("assessment_date", "timestamp"), "assessed_by": ("assessed_by", "string"),
+            **{risk: (f"predictions.{risk}", "int") for risk in ("risk_gdm", "risk_preeclampsia", "risk_anemia", "risk_preterm_labor")},
+            "age": ("assessment_data.age", "int"), "bmi": ("assessment_data.bmi", "float"), "blood_pressure": ("assessment_data.blood_pressure", "float"),
+            "hemoglobin": ("assessment_data.hemoglobin", "float"), "glucose": ("assessment_data.glucose", "float"), "parity": ("assessment_data.parity", "int"),
+            **{feature: (f"assessment_data.{feature}", "string") for feature in ("education", "smoking", "income", "history_anemia", "history_gdm", "history_preeclampsia", "history_preterm")},
+            "explanations": ("explanations", "json"),
+        },
+    },
+}
+
+
+# --- Values ---
+def _utc(value):
+    if isinstance(value, datetime.datetime):
+        return value if value.tzinfo else value.replace(tzinfo=datetime.timezone.utc)
+    return None
+
+
+def _lookup(data, field_path):
+    for part in field_path.split("."):
+        if not isinstance(data, dict):
+            return None
+        data = data.get(part)
+    return data
+
+
+def _convert(value, kind):
+    if value is None:
+        return None
+    try:
+        if kind == "timestamp":
+            return _utc(value)
+        if kind == "date":
+            return datetime.date.fromisoformat(value) if isinstance(value, str) else None
+        if kind == "strings":
+            return [str(v) for v in value] if isinstance(value, list) else None
+        if kind == "int":
+            return int(value)
+        if kind == "float":
+            return float(value)
+        if kind == "bool":
+            return bool(value)
+        if kind == "json":
+            return json.dumps(value, default=str)
+        return str(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _schema(spec):
+    import pyarrow as pa
+    types = {"string": pa.string(), "strings": pa.list_(pa.string()), "int": pa.int64(), "float": pa.float64(), "bool": pa.bool_(),
+             "timestamp": pa.timestamp("us", tz="UTC"), "date": pa.date32(), "json": pa.string()}
+    fields = [pa.field("_id", pa.string(), nullable=False)]
+    fields += [pa.field(column, types[kind]) for column, (_, kind) in spec["columns"].items()]
+    fields.append(pa.field("_exported_at", pa.timestamp("us", tz="UTC"), nullable=False))
+    return pa.schema(fields)
+
+
+def to_row(spec, doc_id, data, exported_at):
+    row = {"_id": doc_id}
+    for column, (field_path, kind) in spec["columns"].items():
+        row[column] = _convert(_lookup(data, field_path), kind)
+    row["_exported_at"] = exported_at
+    return row
+
+
+def _partition(spec, data):
+    if not spec["partition_by"]:
+        return None
+    value = _utc(_lookup(data, spec["partition_by"]))
+    return f"month={value:%Y-%m}" if value else "month=unknown"
+
+
+# --- Writing ---
+class PartitionWriters:
+    """One ParquetWriter per partition touched by a run; rows are buffered and flushed as row groups."""
+
+    def __init__(self, directory, run_id, schema):
+        self.directory, self.run_id, self.schema = directory, run_id, schema
+        self._writers = {}
+        self._buffers = {}
+        self.files = []
+
+    def add(self, partition, row):
+        buffer = self._buffers.setdefault(partition, [])
+        buffer.append(row)
+        if len(buffer) >= ROWS_PER_FLUSH:
+            self._flush(partition)
+
+    def _flush(self, partition):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        rows = self._buffers.pop(partition, None)
+        if not rows:
+            return
+        writer = self._writers.get(partition)
+        if writer is None:
+            directory = os.path.join(self.directory, partition) if partition else self.directory
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"part-{self.run_id}.parquet")
+            writer = self._writers[partition] = pq.ParquetWriter(path, self.schema, compression="zstd")
+            self.files.append(path)
+        writer.write_table(pa.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        for partition in list(self._buffers):
+            self._flush(partition)
+        for writer in self._writers.values():
+            writer.close()
+
+
+# --- Reading from the store ---
+def _paged(query, page_size):
+    """Streams a query in cursor-paginated pages so no single RPC runs for the whole collection."""
+    cursor = None
+    while True:
+        page_query = query.limit(page_size)
+        if cursor is not None:
+            page_query = page_query.start_after(cursor)
+        docs = list(page_query.stream())
+        yield from docs
+        if len(docs) < page_size:
+            return
+        cursor = docs[-1]
+
+
+def changed_documents(db, collection, watermarks, lookback, page_size):
+    """Yields documents at or above any watermark (or every document if there are none), each once."""
+    from google.cloud.firestore_v1.base_query import FieldFilter
+    if not watermarks:
+        yield from _paged(db.collection(collection), page_size)
+        return
+    seen = set()
+    for field, mark in watermarks.items():
+        since = datetime.datetime.fromisoformat(mark) - lookback
+        query = db.collection(collection).where(filter=FieldFilter(field, ">=", since)).order_by(field)
+        for doc in _paged(query, page_size):
+            if doc.id not in seen:
+                seen.add(doc.id)
+                yield doc
+
+
+# --- Watermarks ---
+def load_state(out_dir):
+    path = os.path.join(out_dir, WATERMARK_FILE)
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(out_dir, state):
+    path = os.path.join(out_dir, WATERMARK_FILE)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+# --- Export ---
+def export_collection(db, collection, out_dir, state, run_id, full=False, lookback_minutes=DEFAULT_LOOKBACK_MINUTES, page_size=DEFAULT_PAGE_SIZE):
+    """Exports one collection's new and changed documents and advances its watermarks. Returns the row count."""
+    spec = COLLECTIONS[collection]
+    previous = {} if full else state.get(collection, {}).get("watermarks", {})
+    exported_at = datetime.datetime.now(datetime.timezone.utc)
+    writers = PartitionWriters(os.path.join(out_dir, collection), run_id, _schema(spec))
+    highest = {field: None for field in spec["watermarks"]}
+    count = 0
+    try:
+        for doc in changed_documents(db, collection, previous, datetime.timedelta(minutes=lookback_minutes), page_size):
+            data = doc.to_dict() or {}
+            writers.add(_partition(spec, data), to_row(spec, doc.id, data, exported_at))
+            for field in highest:
+                value = _utc(data.get(field))
+                if value and (highest[field] is None or value > highest[field]):
+                    highest[field] = value
+            count += 1
+    finally:
+        writers.close()
+
+    watermarks = {}
+    for field in spec["watermarks"]:
+        candidates = [value for value in (highest[field], previous.get(field) and datetime.datetime.fromisoformat(previous[field])) if value]
+        # A field no document carries yet starts from this run, so the next run does not rescan everything
+        watermarks[field] = (max(candidates) if candidates else exported_at).isoformat()
+    runs = state.get(collection, {}).get("runs", [])[-29:] + [{"run_id": run_id, "mode": "incremental" if previous else "full", "rows": count, "files": len(writers.files), "at": exported_at.isoformat()}]
+    state[collection] = {"watermarks": watermarks, "runs": runs}
+    save_state(out_dir, state)
+    return count
+
+
+def export(db, out_dir, collections=None, full=False, lookback_minutes=DEFAULT_LOOKBACK_MINUTES, page_size=DEFAULT_PAGE_SIZE):
+    """Exports each collection in turn; a collection's watermarks only advance once its files are closed."""
+    os.makedirs(out_dir, exist_ok=True)
+    state = load_state(out_dir)
+    run_id = f"{datetime.datetime.now(datetime.timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+    totals = {}
+    for collection in collections or COLLECTIONS:
+        started = time.perf_counter()
+        totals[collection] = export_collection(db, collection, out_dir, state, run_id, full, lookback_minutes, page_size)
+        print(f"{collection}: {totals[collection]:,} rows in {time.perf_counter() - started:.1f}s")
+    return totals
+
+
+def read_collection(out_dir, collection):
+    """Loads an exported collection as a DataFrame with only the latest exported version of each document."""
+    import pyarrow.dataset as ds
+    table = ds.dataset(os.path.join(out_dir, collection), format="parquet", partitioning="hive").to_table()
+    df = table.to_pandas()
+    return df.sort_values("_exported_at").drop_duplicates("_id", keep="last").reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export clinical collections to partitioned Parquet, incrementally.")
+    parser.add_argument("--out", default="exports", help="Export directory.")
+    parser.add_argument("--collections", help=f"Comma-separated subset of {', '.join(COLLECTIONS)}.")
+    parser.add_argument("--full", action="store_true", help="Ignore watermarks and export everything.")
+    parser.add_argument("--lookback-minutes", type=float, default=DEFAULT_LOOKBACK_MINUTES, help="Overlap below each watermark.")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    args = parser.parse_args()
+
+    collections = args.collections.split(",") if args.collections else None
+    unknown = set(collections or ()) - set(COLLECTIONS)
+    if unknown:
+        parser.error(f"unknown collections: {', '.join(sorted(unknown))}")
+    from firebase_config import get_firestore_client
+    export(get_firestore_client(), args.out, collections, args.full, args.lookback_minutes, args.page_size)
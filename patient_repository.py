@@ -0,0 +1,204 @@
+# patient_repository.py
+"""
+Process-wide cached access to patient documents and their record collections.
+
+Streamlit reruns the whole page script on every widget interaction. The repository keeps the
+patient document and the prescriptions / allergies_and_conditions / scans lists in a TTL cache
+shared by all sessions, so a rerun that changes nothing costs zero Firestore reads. Every write
+to these collections must go through the write helpers below, which invalidate the cache and
+update the local full-text index (`search_index`). Returned dicts are shared between sessions and
+must be treated as read-only.
+
+When `snapshot_sync` has live listeners running for a patient, reads are served from that
+in-memory store instead, and writes are applied to it immediately. On a cache miss the patient's
+`patient_snapshot` document is tried first, so a cold load costs one document read.
+"""
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+import patient_snapshot
+from batch_fetch import get_documents
+from hereditary_risk import mark_conditions_changed
+from query_executor import QueryResults, run_concurrently
+from search_index import index_document, index_patient
+from snapshot_sync import add_change_callback, get_live_store
+from ttl_cache import TTLCache
+
+RECORD_COLLECTIONS = ("prescriptions", "allergies_and_conditions", "scans")
+
+
+_cache = TTLCache()
+
+
+# --- Reads ---
+def _load_snapshot(db, patient_id):
+    """Fills the cache for a patient from their snapshot document. Returns False if there is none."""
+    if _cache.get(("no_snapshot", patient_id)):
+        return False
+    snapshot = patient_snapshot.load(db, patient_id)
+    if snapshot is None:
+        _cache.set(("no_snapshot", patient_id), True)
+        return False
+    _cache.set(("patient", patient_id), snapshot["patient"])
+    for collection in RECORD_COLLECTIONS:
+        _cache.set((collection, patient_id), snapshot[collection])
+    return True
+
+
+def get_patient(db, patient_id):
+    """Returns the patient document as a dict, or None if it does not exist."""
+    store = get_live_store(patient_id)
+    if store is not None:
+        return store.get_patient()
+    key = ("patient", patient_id)
+    patient = _cache.get(key)
+    if patient is None and _load_snapshot(db, patient_id):
+        patient = _cache.get(key)
+    if patient is None:
+        doc = db.collection("patients").document(patient_id).get()
+        if not doc.exists:
+            return None
+        patient = doc.to_dict()
+        _cache.set(key, patient)
+    return patient
+
+
+def get_patients(db, patient_ids):
+    """Returns {patient_id: dict or None}; cache misses are fetched with one batched get_all."""
+    found, missing = {}, []
+    for patient_id in dict.fromkeys(patient_ids):
+        store = get_live_store(patient_id)
+        patient = store.get_patient() if store is not None else _cache.get(("patient", patient_id))
+        if patient is None:
+            missing.append(patient_id)
+        else:
+            found[patient_id] = patient
+    for patient_id, patient in get_documents(db, "patients", missing).items():
+        if patient is not None:
+            _cache.set(("patient", patient_id), patient)
+        found[patient_id] = patient
+    return found
+
+
+def get_collection_records(db, collection, patient_id):
+    """Returns [{"id": ..., **fields}] for one record collection of a patient."""
+    store = get_live_store(patient_id)
+    if store is not None:
+        return store.get_records(collection)
+    key = (collection, patient_id)
+    records = _cache.get(key)
+    if records is None and _load_snapshot(db, patient_id):
+        records = _cache.get(key)
+    if records is None:
+        query = db.collection(collection).where(filter=FieldFilter("patient_id", "==", patient_id))
+        records = [{"id": doc.id, **doc.to_dict()} for doc in query.stream()]
+        _cache.set(key, records)
+    return records
+
+
+def load_patient_view(db, patient_id, extra_queries=None):
+    """
+    Returns QueryResults with "patient" and each record collection, plus any `extra_queries`
+    ({name: callable}) the page wants in the same round. Whatever is not already in the live store
+    or cache is fetched concurrently; cached parts report a timing of 0 ms.
+    """
+    names = ("patient",) + RECORD_COLLECTIONS
+    store = get_live_store(patient_id)
+    if store is not None:
+        cached = {"patient": store.get_patient(), **{c: store.get_records(c) for c in RECORD_COLLECTIONS}}
+    else:
+        cached = {name: _cache.get((name, patient_id)) for name in names}
+        if any(value is None for value in cached.values()) and _load_snapshot(db, patient_id):
+            cached = {name: _cache.get((name, patient_id)) for name in names}
+
+    queries = dict(extra_queries or {})
+    for name in names:
+        if cached.get(name) is None:
+            queries[name] = (lambda: get_patient(db, patient_id)) if name == "patient" else (lambda c=name: get_collection_records(db, c, patient_id))
+    results = run_concurrently(queries)
+    for name in names:
+        if name not in results:
+            results[name] = cached[name]
+            results.timings[name] = 0.0
+    return results
+
+
+def get_records(db, patient_id):
+    """Returns {"prescriptions": [...], "allergies_and_conditions": [...], "scans": [...]} for a patient."""
+    view = load_patient_view(db, patient_id)
+    return QueryResults({c: view[c] for c in RECORD_COLLECTIONS}, {c: view.timings[c] for c in RECORD_COLLECTIONS}, view.elapsed_ms)
+
+
+# --- Invalidation ---
+def invalidate(patient_id, collection=None):
+    """Drops the cached patient document and records (or only one collection) for a patient."""
+    if collection is None:
+        _cache.invalidate(lambda key: key[1] == patient_id)
+    else:
+        _cache.invalidate(lambda key: key == (collection, patient_id))
+
+
+def _after_record_write(collection, patient_id):
+    invalidate(patient_id, collection)
+    if collection == "allergies_and_conditions":
+        mark_conditions_changed(patient_id)
+
+
+# Changes made elsewhere (e.g. the patient re-categorizing a record) arrive through the listeners
+add_change_callback(_after_record_write)
+
+
+# --- Writes ---
+def add_record(db, collection, data, merges=()):
+    """
+    Adds a record document for data['patient_id'] (and any `merges`, see patient_snapshot.add_record)
+    and invalidates that patient's cached collection.
+    """
+    doc_ref = patient_snapshot.add_record(db, collection, data, merges)
+    _after_record_write(collection, data['patient_id'])
+    index_document(collection, doc_ref.id, data['patient_id'], data)
+    store = get_live_store(data['patient_id'])
+    if store is not None:
+        store.apply_record_write(collection, doc_ref.id, data, replace=True)
+    return doc_ref
+
+
+def update_record(db, collection, doc_id, patient_id, fields):
+    """Updates fields of one record document and invalidates that patient's cached collection."""
+    patient_snapshot.update_record(db, collection, doc_id, patient_id, fields)
+    _after_record_write(collection, patient_id)
+    index_document(collection, doc_id, patient_id, fields)
+    store = get_live_store(patient_id)
+    if store is not None:
+        store.apply_record_write(collection, doc_id, fields)
+
+
+def update_records(db, patient_id, updates):
+    """Applies [(collection, doc_id, fields), ...] for one patient as batched writes and invalidates once per collection."""
+    if not updates:
+        return
+    patient_snapshot.update_records(db, patient_id, updates)
+    for collection in dict.fromkeys(collection for collection, _, _ in updates):
+        _after_record_write(collection, patient_id)
+    for collection, doc_id, fields in updates:
+        index_document(collection, doc_id, patient_id, fields)
+    store = get_live_store(patient_id)
+    if store is not None:
+        for collection, doc_id, fields in updates:
+            store.apply_record_write(collection, doc_id, fields)
+
+
+def set_patient(db, patient_id, data):
+    """Creates or replaces a patient document."""
+    patient_snapshot.set_patient(db, patient_id, data)
+    invalidate(patient_id)
+    index_patient(patient_id, data)
+
+
+def update_patient(db, patient_id, fields):
+    """Updates fields of a patient document and invalidates the cached copy."""
+    patient_snapshot.update_patient(db, patient_id, fields)
+    invalidate(patient_id, "patient")
+    index_patient(patient_id, fields)
+    store = get_live_store(patient_id)
+    if store is not None:
+        store.apply_patient_update(fields)
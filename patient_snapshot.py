@@ -0,0 +1,184 @@
+# patient_snapshot.py
+"""
+Materialized `patient_snapshots/{patient_id}` documents for single-read dashboard loads.
+
+A snapshot holds the patient's profile (without credentials) and compact summaries of their
+prescriptions, allergies_and_conditions and scans, keyed by record ID:
+
+    {"profile": {...}, "prescriptions": {doc_id: {...}}, "allergies_and_conditions": {...},
+     "scans": {...}, "complete": True, "updated_at": <timestamp>}
+
+Every write to those collections commits the record and the snapshot change in the same atomic
+batch. Updates also stamp the source document's `updated_at`, which incremental exports use as a
+change watermark. Snapshots created or rebuilt from the source collections are marked `complete`; only
+complete snapshots are trusted for reads.
+
+One-off migration for existing patients:
+    python patient_snapshot.py --backfill [--workers 8]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from google.cloud import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from datastore import transactional
+
+SNAPSHOT_COLLECTION = "patient_snapshots"
+SUMMARY_FIELDS = {
+    "prescriptions": ("medication_name", "condition", "condition_code", "duration", "category"),
+    "allergies_and_conditions": ("description", "condition_code", "category"),
+    "scans": ("body_part", "file_url", "thumbnail_url", "preview_url", "category"),
+}
+PRIVATE_PROFILE_FIELDS = {"password"}
+# Firestore allows 500 writes per batch; one slot is kept for the snapshot document.
+MAX_UPDATES_PER_BATCH = 499
+
+
+def snapshot_ref(db, patient_id):
+    return db.collection(SNAPSHOT_COLLECTION).document(patient_id)
+
+
+def summarize(collection, data):
+    """Returns the subset of a record's fields kept in the snapshot."""
+    return {key: data[key] for key in SUMMARY_FIELDS[collection] if key in data}
+
+
+def profile_of(patient_data):
+    return {key: value for key, value in patient_data.items() if key not in PRIVATE_PROFILE_FIELDS}
+
+
+# --- Staging helpers (add snapshot maintenance to an existing batch or transaction) ---
+def stage_record_write(writer, db, collection, doc_id, patient_id, fields):
+    """Merges the summarized fields of a record write into the patient's snapshot."""
+    summary = summarize(collection, fields)
+    if summary:
+        writer.set(snapshot_ref(db, patient_id), {collection: {doc_id: summary}, "updated_at": firestore.SERVER_TIMESTAMP}, merge=True)
+
+
+def stage_profile_update(writer, db, patient_id, fields):
+    """Merges patient document changes (including ArrayUnion transforms) into the snapshot profile."""
+    profile = profile_of(fields)
+    if profile:
+        writer.set(snapshot_ref(db, patient_id), {"profile": profile, "updated_at": firestore.SERVER_TIMESTAMP}, merge=True)
+
+
+# --- Writes ---
+def add_record(db, collection, data, merges=()):
+    """
+    Creates a record document and adds its summary to the snapshot atomically, together with any
+    `merges` ([(doc_ref, fields), ...], e.g. a reference count). Returns the new reference.
+    """
+    doc_ref = db.collection(collection).document()
+    batch = db.batch()
+    batch.set(doc_ref, data)
+    stage_record_write(batch, db, collection, doc_ref.id, data['patient_id'], data)
+    for ref, fields in merges:
+        batch.set(ref, fields, merge=True)
+    batch.commit()
+    return doc_ref
+
+
+def update_record(db, collection, doc_id, patient_id, fields):
+    """Updates a record document and its snapshot summary atomically."""
+    batch = db.batch()
+    batch.update(db.collection(collection).document(doc_id), {**fields, "updated_at": firestore.SERVER_TIMESTAMP})
+    stage_record_write(batch, db, collection, doc_id, patient_id, fields)
+    batch.commit()
+
+
+def update_records(db, patient_id, updates):
+    """
+    Applies many record updates for one patient ([(collection, doc_id, fields), ...]) and their
+    snapshot summaries in as few atomic batches as possible.
+    """
+    for start in range(0, len(updates), MAX_UPDATES_PER_BATCH):
+        chunk = updates[start:start + MAX_UPDATES_PER_BATCH]
+        batch = db.batch()
+        summaries = {}
+        for collection, doc_id, fields in chunk:
+            batch.update(db.collection(collection).document(doc_id), {**fields, "updated_at": firestore.SERVER_TIMESTAMP})
+            summary = summarize(collection, fields)
+            if summary:
+                summaries.setdefault(collection, {}).setdefault(doc_id, {}).update(summary)
+        if summaries:
+            batch.set(snapshot_ref(db, patient_id), {**summaries, "updated_at": firestore.SERVER_TIMESTAMP}, merge=True)
+        batch.commit()
+
+
+def set_patient(db, patient_id, data):
+    """Creates a patient together with a complete, empty snapshot."""
+    batch = db.batch()
+    batch.set(db.collection("patients").document(patient_id), {**data, "updated_at": firestore.SERVER_TIMESTAMP})
+    batch.set(snapshot_ref(db, patient_id), {"profile": profile_of(data), **{c: {} for c in SUMMARY_FIELDS}, "complete": True, "updated_at": firestore.SERVER_TIMESTAMP})
+    batch.commit()
+
+
+def update_patient(db, patient_id, fields):
+    """Updates a patient document and the snapshot profile atomically."""
+    batch = db.batch()
+    batch.update(db.collection("patients").document(patient_id), {**fields, "updated_at": firestore.SERVER_TIMESTAMP})
+    stage_profile_update(batch, db, patient_id, fields)
+    batch.commit()
+
+
+# --- Reads ---
+def load(db, patient_id):
+    """
+    Returns {"patient": profile, "prescriptions": [...], "allergies_and_conditions": [...], "scans": [...]}
+    from one document read, or None if the patient has no complete snapshot yet.
+    """
+    doc = snapshot_ref(db, patient_id).get()
+    data = doc.to_dict() if doc.exists else None
+    if not data or not data.get("complete"):
+        return None
+    snapshot = {"patient": data.get("profile", {})}
+    for collection in SUMMARY_FIELDS:
+        snapshot[collection] = [{"id": doc_id, "patient_id": patient_id, **summary} for doc_id, summary in (data.get(collection) or {}).items()]
+    return snapshot
+
+
+# --- Rebuild / Backfill ---
+@transactional
+def _rebuild_in_transaction(transaction, db, patient_id):
+    patient_doc = db.collection("patients").document(patient_id).get(transaction=transaction)
+    if not patient_doc.exists:
+        return False
+    snapshot = {"profile": profile_of(patient_doc.to_dict()), "complete": True, "updated_at": firestore.SERVER_TIMESTAMP}
+    for collection in SUMMARY_FIELDS:
+        query = db.collection(collection).where(filter=FieldFilter("patient_id", "==", patient_id))
+        snapshot[collection] = {doc.id: summarize(collection, doc.to_dict()) for doc in transaction.get(query)}
+    transaction.set(snapshot_ref(db, patient_id), snapshot)
+    return True
+
+
+def rebuild(db, patient_id):
+    """Rebuilds one patient's snapshot from the source collections inside a transaction."""
+    return _rebuild_in_transaction(db.transaction(), db, patient_id)
+
+
+def backfill(db, workers=8):
+    """Rebuilds the snapshot of every patient. Safe to re-run."""
+    started = time.perf_counter()
+    patient_ids = [doc.id for doc in db.collection("patients").select([]).stream()]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda pid: rebuild(db, pid), patient_ids))
+    elapsed = time.perf_counter() - started
+    print(f"Rebuilt {sum(results)} of {len(patient_ids)} patient snapshots in {elapsed:.1f}s")
+    return sum(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain patient snapshot documents.")
+    parser.add_argument("--backfill", action="store_true", help="Rebuild snapshots for all existing patients.")
+    parser.add_argument("--patient", help="Rebuild the snapshot of a single patient.")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    from firebase_config import get_firestore_client
+    client = get_firestore_client()
+    if args.patient:
+        print("Rebuilt" if rebuild(client, args.patient) else "Patient not found")
+    if args.backfill:
+        backfill(client, args.workers)
@@ -0,0 +1,80 @@
+# query_executor.py
+"""
+Runs the independent Firestore reads of a page render concurrently on a bounded thread pool.
+
+    results = run_concurrently({"scans": lambda: ..., "notes": lambda: ...})
+    results["scans"], results.timings["scans"], results.elapsed_ms
+
+Render latency approaches the slowest single query instead of the sum of all round trips.
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = 16
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="medtree-query")
+_worker_state = threading.local()
+
+
+class QueryResults(dict):
+    """Query results by name, with per-query wall-clock timings in milliseconds."""
+
+    def __init__(self, results=None, timings=None, elapsed_ms=0.0):
+        super().__init__(results or {})
+        self.timings = timings or {}
+        self.elapsed_ms = elapsed_ms
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    return fn(), (time.perf_counter() - started) * 1000
+
+
+def _timed_in_worker(fn):
+    _worker_state.active = True
+    try:
+        return _timed(fn)
+    finally:
+        _worker_state.active = False
+
+
+def run_concurrently(queries, timeout=None):
+    """
+    Runs each callable in `queries` ({name: callable}) concurrently and returns QueryResults.
+
+    If any query raises, the first exception (in `queries` order) is re-raised after all have
+    finished. Calls made from inside a pool worker run inline, so nesting cannot exhaust the pool.
+    """
+    started = time.perf_counter()
+    if not queries:
+        return QueryResults()
+    if getattr(_worker_state, "active", False) or len(queries) == 1:
+        outcomes = {}
+        for name, fn in queries.items():
+            outcomes[name] = _timed(fn)
+    else:
+        # Each worker runs in a copy of the caller's context so per-render metrics follow the query
+        futures = {name: _executor.submit(contextvars.copy_context().run, _timed_in_worker, fn) for name, fn in queries.items()}
+        errors = []
+        outcomes = {}
+        for name, future in futures.items():
+            try:
+                outcomes[name] = future.result(timeout=timeout)
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+    elapsed = (time.perf_counter() - started) * 1000
+    return QueryResults(
+        {name: result for name, (result, _) in outcomes.items()},
+        {name: round(ms, 1) for name, (_, ms) in outcomes.items()},
+        round(elapsed, 1),
+    )
+
+
+def format_timings(results):
+    """One-line summary such as '42.1 ms total (scans 40.3 ms, notes 12.0 ms)'."""
+    parts = ", ".join(f"{name} {ms} ms" for name, ms in sorted(results.timings.items(), key=lambda item: -item[1]))
+    return f"{results.elapsed_ms} ms total" + (f" ({parts})" if parts else "")
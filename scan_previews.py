@@ -0,0 +1,198 @@
+# scan_previews.py
+"""
+Thumbnails and first-page previews of scans, generated in the background and served from a local cache.
+
+For each scan blob two JPEGs are stored beside the original, `{blob_name}.thumbnail.jpg` (at most
+THUMBNAIL_SIZE px) and `{blob_name}.preview.jpg` (at most PREVIEW_SIZE px), and their URLs are
+recorded on the `scans` document (and its snapshot summary) as `thumbnail_url` / `preview_url`.
+Images are scaled with Pillow; PDFs are previewed by rendering their first page with pypdfium2.
+Content-addressed scans (`scan_uploads`) keep the URLs on their `scan_blobs` document too, so
+another scan of the same file reuses them without rendering again.
+
+`scan_image` returns preview bytes through a process-wide LRU cache bounded by total size, so the
+record tables can show them inline on every rerun without downloading them again.
+
+One-off job for scans uploaded before previews existed:
+    python scan_previews.py --backfill [--workers 4]
+"""
+import argparse
+import io
+import sys
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from patient_repository import update_record
+from scan_uploads import blob_doc_ref, content_blob_name
+
+THUMBNAIL_SIZE = 160
+PREVIEW_SIZE = 1024
+JPEG_QUALITY = 82
+PREVIEW_KINDS = {"thumbnail": THUMBNAIL_SIZE, "preview": PREVIEW_SIZE}
+MAX_WORKERS = 2
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="medtree-preview")
+
+
+# --- Rendering ---
+def _first_pdf_page(data, size):
+    import pypdfium2 as pdfium
+    pdf = pdfium.PdfDocument(data)
+    try:
+        page = pdf[0]
+        width, height = page.get_size()
+        # Rendered just large enough for the biggest preview
+        return page.render(scale=size / max(width, height)).to_pil()
+    finally:
+        pdf.close()
+
+
+def render_previews(data):
+    """Returns {kind: JPEG bytes} for each of PREVIEW_KINDS from an image or PDF file's bytes."""
+    from PIL import Image, ImageOps
+    largest = max(PREVIEW_KINDS.values())
+    if data[:5] == b"%PDF-":
+        image = _first_pdf_page(data, largest)
+    else:
+        image = Image.open(io.BytesIO(data))
+        # JPEGs can be decoded directly at a reduced scale
+        image.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(image)
+    image = image.convert("RGB")
+    previews = {}
+    for kind, size in sorted(PREVIEW_KINDS.items(), key=lambda item: -item[1]):
+        image.thumbnail((size, size))
+        out = io.BytesIO()
+        image.save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+        previews[kind] = out.getvalue()
+    return previews
+
+
+# --- Generation ---
+def blob_name_from_url(bucket, url):
+    """Returns the bucket object name behind a public URL of that bucket, or None for other URLs."""
+    prefix = bucket.blob("_").public_url[:-1]
+    if not url or not url.startswith(prefix):
+        return None
+    return urllib.parse.unquote(url[len(prefix):])
+
+
+def scan_blob_name(bucket, scan):
+    if scan.get("blob_digest"):
+        return content_blob_name(scan["blob_digest"])
+    return blob_name_from_url(bucket, scan.get("file_url"))
+
+
+def _store_previews(bucket, blob_name):
+    urls = {}
+    for kind, jpeg in render_previews(bucket.blob(blob_name).download_as_bytes()).items():
+        blob = bucket.blob(f"{blob_name}.{kind}.jpg")
+        blob.upload_from_string(jpeg, content_type="image/jpeg")
+        blob.make_public()
+        urls[f"{kind}_url"] = blob.public_url
+    return urls
+
+
+def generate(db, bucket, scan_id, patient_id, blob_name, digest=None):
+    """Creates (or reuses, for a known digest) the previews of one scan and records their URLs on it."""
+    urls = None
+    if digest:
+        blob_doc = blob_doc_ref(db, digest).get()
+        known = blob_doc.to_dict() if blob_doc.exists else {}
+        if all(f"{kind}_url" in known for kind in PREVIEW_KINDS):
+            urls = {f"{kind}_url": known[f"{kind}_url"] for kind in PREVIEW_KINDS}
+    if urls is None:
+        urls = _store_previews(bucket, blob_name)
+        if digest:
+            blob_doc_ref(db, digest).set(urls, merge=True)
+    update_record(db, "scans", scan_id, patient_id, urls)
+    return urls
+
+
+def _generate_logged(db, bucket, scan_id, patient_id, blob_name, digest):
+    try:
+        return generate(db, bucket, scan_id, patient_id, blob_name, digest)
+    except Exception as e:
+        print(f"Preview generation failed for scan {scan_id} ({blob_name}): {e}", file=sys.stderr)
+        return None
+
+
+def schedule(db, bucket, scan_id, patient_id, blob_name, digest=None):
+    """Queues preview generation for a new scan on the preview pool; failures are logged, not raised."""
+    return _executor.submit(_generate_logged, db, bucket, scan_id, patient_id, blob_name, digest)
+
+
+# --- Local cache ---
+class LRUBytesCache:
+    """A thread-safe LRU cache of byte strings, bounded by their total size."""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._data[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes and len(self._data) > 1:
+                _, evicted = self._data.popitem(last=False)
+                self.size -= len(evicted)
+
+
+_cache = LRUBytesCache()
+
+
+def scan_image(bucket, url):
+    """Returns the bytes of a preview image by its URL, downloading it only on a cache miss."""
+    blob_name = blob_name_from_url(bucket, url)
+    if blob_name is None:
+        return None
+    data = _cache.get(blob_name)
+    if data is None:
+        data = bucket.blob(blob_name).download_as_bytes()
+        _cache.set(blob_name, data)
+    return data
+
+
+# --- Backfill ---
+def backfill(db, bucket, workers=MAX_WORKERS):
+    """Generates previews for every scan that has none yet. Safe to re-run."""
+    started = time.perf_counter()
+    query = db.collection("scans").select(["patient_id", "file_url", "blob_digest", "thumbnail_url"])
+    pending = []
+    for doc in query.stream():
+        scan = doc.to_dict()
+        blob_name = scan_blob_name(bucket, scan)
+        if not scan.get("thumbnail_url") and blob_name is not None:
+            pending.append((doc.id, scan.get("patient_id"), blob_name, scan.get("blob_digest")))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda args: _generate_logged(db, bucket, *args), pending))
+    done = sum(result is not None for result in results)
+    print(f"Generated previews for {done} of {len(pending)} scans in {time.perf_counter() - started:.1f}s")
+    return done
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate scan thumbnails and previews.")
+    parser.add_argument("--backfill", action="store_true", help="Generate previews for existing scans that have none.")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    args = parser.parse_args()
+
+    if args.backfill:
+        from firebase_config import get_firestore_client, get_storage_bucket
+        backfill(get_firestore_client(), get_storage_bucket(), args.workers)
@@ -0,0 +1,403 @@
+# scan_uploads.py
+"""
+Chunked, resumable uploads of scan files, run off the Streamlit script thread.
+
+    job = start_upload(bucket, "scans/PAT-1/mri.pdf", uploaded_file, uploaded_file.size, "application/pdf",
+                       on_complete=lambda job: ...)
+    job.status, job.progress, job.sha256, job.error
+
+The file is streamed in CHUNK_SIZE pieces through a resumable upload session (the GCS JSON API
+protocol, or the `local_blobs` equivalent), and its SHA-256 is computed from the same chunks. A
+failed chunk is retried after asking the session how much it has stored. The session URL is kept
+in a local state file (MEDTREE_UPLOAD_STATE, see `datastore`) under a key derived from the target
+and the file's first chunk, so uploading the same file again after an interruption (a dropped
+connection, a restarted server) continues from the stored offset instead of starting over.
+
+Scans are content-addressed (`start_scan_upload`): the file is hashed first and stored once at
+scans/sha256/{xx}/{digest}, with a `scan_blobs/{digest}` document holding its URL and a reference
+count that each scan record increments in the same batch that creates it. Uploading content that
+is already stored transfers nothing. Unreferenced blobs are removed by:
+    python scan_uploads.py --collect [--grace-hours 24]
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from google.cloud import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+import local_blobs
+from datastore import transactional, upload_state_path
+
+# GCS requires every chunk except the last to be a multiple of 256 KiB
+CHUNK_SIZE = 32 * 256 * 1024
+MAX_ATTEMPTS = 6
+BACKOFF_SECONDS = 0.5
+REQUEST_TIMEOUT_SECONDS = 120
+MAX_WORKERS = 4
+SCAN_BLOBS_COLLECTION = "scan_blobs"
+CONTENT_PREFIX = "scans/sha256"
+GC_GRACE_SECONDS = 24 * 3600
+# Resumable sessions expire after a week on GCS; older records are dropped
+SESSION_MAX_AGE_SECONDS = 6 * 24 * 3600
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="medtree-upload")
+
+
+class UploadError(Exception):
+    pass
+
+
+class _SessionExpired(Exception):
+    pass
+
+
+class UploadJob:
+    """Progress and outcome of one upload; updated by the worker thread, read by the page."""
+
+    def __init__(self, blob_name, size):
+        self.blob_name = blob_name
+        self.size = size
+        self.status = "queued"  # queued, hashing, uploading, done, failed
+        self.uploaded = 0
+        self.resumed_from = 0
+        self.sha256 = None
+        self.skipped = False
+        self.blob = None
+        self.error = None
+        self.future = None
+
+    @property
+    def progress(self):
+        return self.uploaded / self.size if self.size else 1.0
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+
+# --- Session transports ---
+def _stored_bytes(response, size):
+    if response.status_code in (200, 201):
+        return size
+    if response.status_code == 308:
+        # "Range: bytes=0-N" ends at the last stored byte; no header means nothing is stored yet
+        stored = response.headers.get("Range")
+        return int(stored.rsplit("-", 1)[1]) + 1 if stored else 0
+    if response.status_code in (404, 410):
+        raise _SessionExpired(response.url)
+    response.raise_for_status()
+    raise UploadError(f"Unexpected status {response.status_code} from the upload session")
+
+
+def _http_status(session_url, size):
+    response = requests.put(session_url, headers={"Content-Range": f"bytes */{size}"}, timeout=REQUEST_TIMEOUT_SECONDS)
+    return _stored_bytes(response, size)
+
+
+def _http_put(session_url, data, start, size):
+    headers = {"Content-Range": f"bytes {start}-{start + len(data) - 1}/{size}", "Content-Length": str(len(data))}
+    response = requests.put(session_url, data=data, headers=headers, timeout=REQUEST_TIMEOUT_SECONDS)
+    return _stored_bytes(response, size)
+
+
+def _local_status(session_url, size):
+    committed = local_blobs.committed_bytes(session_url)
+    if committed is None:
+        raise _SessionExpired(session_url)
+    return committed
+
+
+def _transport(session_url):
+    if session_url.startswith("file:"):
+        return _local_status, local_blobs.put_chunk
+    return _http_status, _http_put
+
+
+# --- Resume state ---
+class _SessionState:
+    """Open session URLs by resume key, in a JSON file replaced atomically on every change."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save(self, sessions):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(sessions, f)
+        os.replace(tmp, self.path)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._load().get(key)
+        if entry and time.time() - entry["created"] < SESSION_MAX_AGE_SECONDS:
+            return entry["url"]
+        return None
+
+    def put(self, key, url):
+        with self._lock:
+            sessions = {k: v for k, v in self._load().items() if time.time() - v["created"] < SESSION_MAX_AGE_SECONDS}
+            sessions[key] = {"url": url, "created": time.time()}
+            self._save(sessions)
+
+    def drop(self, key):
+        with self._lock:
+            sessions = self._load()
+            if sessions.pop(key, None) is not None:
+                self._save(sessions)
+
+
+_state = None
+_state_lock = threading.Lock()
+
+
+def _session_state():
+    global _state
+    with _state_lock:
+        if _state is None:
+            _state = _SessionState(upload_state_path())
+        return _state
+
+
+# --- Upload ---
+def _read_at(source, offset, length):
+    source.seek(offset)
+    return source.read(length)
+
+
+def _resume_key(blob_name, size, content_type, source):
+    head = hashlib.sha256(_read_at(source, 0, CHUNK_SIZE)).hexdigest()
+    return f"{blob_name}|{size}|{content_type}|{head}"
+
+
+def _open_session(bucket, blob_name, size, content_type, resume_key, state):
+    """Returns (session_url, stored_offset), reusing a stored session for the same file when it is still alive."""
+    session_url = state.get(resume_key)
+    if session_url is not None:
+        try:
+            return session_url, _transport(session_url)[0](session_url, size)
+        except (_SessionExpired, requests.RequestException, UploadError):
+            state.drop(resume_key)
+    session_url = bucket.blob(blob_name).create_resumable_upload_session(content_type=content_type, size=size)
+    state.put(resume_key, session_url)
+    return session_url, 0
+
+
+def upload(bucket, blob_name, source, size, content_type=None, job=None):
+    """
+    Uploads `size` bytes of the seekable file object `source` to `blob_name` through a resumable
+    session, resuming a previous interrupted upload of the same file. Returns the hex SHA-256.
+    """
+    if size <= 0:
+        raise UploadError("Cannot upload an empty file")
+    job = job or UploadJob(blob_name, size)
+    state = _session_state()
+    resume_key = _resume_key(blob_name, size, content_type, source)
+    session_url, offset = _open_session(bucket, blob_name, size, content_type, resume_key, state)
+    status, put = _transport(session_url)
+    job.status, job.resumed_from, job.uploaded = "uploading", offset, offset
+
+    # The stored prefix is re-hashed locally, which is much cheaper than sending it again
+    digest = hashlib.sha256()
+    hashed = 0
+    while hashed < offset:
+        data = _read_at(source, hashed, min(CHUNK_SIZE, offset - hashed))
+        digest.update(data)
+        hashed += len(data)
+
+    failures = 0
+    try:
+        while offset < size:
+            data = _read_at(source, offset, min(CHUNK_SIZE, size - offset))
+            error = None
+            try:
+                committed = put(session_url, data, offset, size)
+            except (requests.RequestException, OSError) as e:
+                error, committed = e, offset
+            if committed <= offset:
+                failures += 1
+                if failures >= MAX_ATTEMPTS:
+                    raise UploadError(f"Upload interrupted at {offset} of {size} bytes: {error or 'no progress'}") from error
+                time.sleep(BACKOFF_SECONDS * 2 ** failures)
+                # Continue from however much the session stored before the failure
+                try:
+                    committed = status(session_url, size)
+                except (requests.RequestException, OSError):
+                    continue
+            else:
+                failures = 0
+            if committed > offset:
+                digest.update(data[:committed - offset])
+                offset = committed
+                job.uploaded = offset
+    except _SessionExpired:
+        state.drop(resume_key)
+        raise UploadError("The upload session expired; upload the file again to start a new one")
+
+    state.drop(resume_key)
+    job.sha256 = digest.hexdigest()
+    return job.sha256
+
+
+def _upload_named(job, bucket, source, content_type):
+    upload(bucket, job.blob_name, source, job.size, content_type, job)
+    job.blob = bucket.blob(job.blob_name)
+
+
+def _run(job, work, on_complete):
+    try:
+        work()
+        if on_complete is not None:
+            on_complete(job)
+        job.status = "done"
+    except Exception as e:
+        job.error = str(e)
+        job.status = "failed"
+
+
+def start_upload(bucket, blob_name, source, size, content_type=None, on_complete=None):
+    """
+    Starts `upload` on the upload pool and returns its UploadJob at once. `on_complete(job)` runs
+    on the worker after the last chunk is stored (e.g. to make the blob public and add the record).
+    """
+    job = UploadJob(blob_name, size)
+    job.future = _executor.submit(_run, job, lambda: _upload_named(job, bucket, source, content_type), on_complete)
+    return job
+
+
+# --- Content-addressed scans ---
+def content_blob_name(digest):
+    return f"{CONTENT_PREFIX}/{digest[:2]}/{digest}"
+
+
+def blob_doc_ref(db, digest):
+    return db.collection(SCAN_BLOBS_COLLECTION).document(digest)
+
+
+def blob_reference(db, digest, delta=1):
+    """
+    Returns (doc_ref, fields) that add `delta` references to a content blob, for
+    `patient_repository.add_record(..., merges=[...])`; a scan deletion would stage delta=-1.
+    """
+    return blob_doc_ref(db, digest), {"refcount": firestore.Increment(delta), "updated_at": firestore.SERVER_TIMESTAMP}
+
+
+def file_digest(source, size):
+    """Returns the hex SHA-256 of the first `size` bytes of `source`, read in chunks."""
+    digest = hashlib.sha256()
+    offset = 0
+    while offset < size:
+        data = _read_at(source, offset, min(CHUNK_SIZE, size - offset))
+        if not data:
+            break
+        digest.update(data)
+        offset += len(data)
+    return digest.hexdigest()
+
+
+@transactional
+def _claim_in_transaction(transaction, db, digest):
+    """
+    Returns True if a ready blob is stored for the digest, stamping its `updated_at` so the collector's
+    grace period starts over until the new scan's reference lands.
+    """
+    snapshot = blob_doc_ref(db, digest).get(transaction=transaction)
+    data = snapshot.to_dict() if snapshot.exists else None
+    if not data or not data.get("ready") or not data.get("blob_name"):
+        return False
+    transaction.update(snapshot.reference, {"updated_at": firestore.SERVER_TIMESTAMP})
+    return True
+
+
+def _upload_content(job, db, bucket, source, content_type):
+    job.status = "hashing"
+    digest = file_digest(source, job.size)
+    job.blob_name = content_blob_name(digest)
+    if _claim_in_transaction(db.transaction(), db, digest):
+        # The same content is already stored; the new scan only adds a reference to it
+        job.skipped, job.sha256, job.uploaded = True, digest, job.size
+    else:
+        if upload(bucket, job.blob_name, source, job.size, content_type, job) != digest:
+            raise UploadError("The file changed while it was being uploaded")
+        blob = bucket.blob(job.blob_name)
+        blob.make_public()
+        # Created with no references; the scan record that follows adds the first one
+        blob_doc_ref(db, digest).set({
+            "blob_name": job.blob_name, "file_url": blob.public_url, "size": job.size, "content_type": content_type,
+            "ready": True, "refcount": firestore.Increment(0), "created_at": firestore.SERVER_TIMESTAMP, "updated_at": firestore.SERVER_TIMESTAMP,
+        }, merge=True)
+    job.blob = bucket.blob(job.blob_name)
+
+
+def start_scan_upload(db, bucket, source, size, content_type=None, on_complete=None):
+    """
+    Hashes the file, then uploads it to its content address unless a blob with the same digest is
+    already stored, in which case nothing is transferred (`job.skipped`). `on_complete(job)` should
+    add the scan record with `blob_reference(db, job.sha256)` merged into the same write.
+    """
+    job = UploadJob(None, size)
+    job.future = _executor.submit(_run, job, lambda: _upload_content(job, db, bucket, source, content_type), on_complete)
+    return job
+
+
+@transactional
+def _unlink_in_transaction(transaction, db, digest, cutoff):
+    """
+    Deletes the blob document if it is still unreferenced and past the cutoff. Returns the blob name
+    ("" for a document that never had one), or None if the document was kept.
+    """
+    snapshot = blob_doc_ref(db, digest).get(transaction=transaction)
+    data = snapshot.to_dict() if snapshot.exists else None
+    if not data or data.get("refcount", 0) > 0 or data.get("updated_at") is None or data["updated_at"] > cutoff:
+        return None
+    transaction.delete(snapshot.reference)
+    return data.get("blob_name") or ""
+
+
+def collect_unreferenced(db, bucket, grace_seconds=GC_GRACE_SECONDS):
+    """
+    Deletes content blobs that no scan has referenced for `grace_seconds`. An upload that finds a
+    blob ready stamps its `updated_at` in a transaction, so the grace period covers it until its
+    reference is added.
+    """
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=grace_seconds)
+    candidates = [doc.id for doc in db.collection(SCAN_BLOBS_COLLECTION).where(filter=FieldFilter("refcount", "<=", 0)).stream()]
+    deleted = 0
+    for digest in candidates:
+        # The object is deleted only once its document is gone, so a retried transaction cannot strand a reference
+        blob_name = _unlink_in_transaction(db.transaction(), db, digest, cutoff)
+        if blob_name is None:
+            continue
+        # An upload of the same content may have started over since the document was deleted
+        if blob_name and not blob_doc_ref(db, digest).get().exists:
+            blob = bucket.blob(blob_name)
+            if blob.exists():
+                blob.delete()
+        deleted += 1
+    print(f"Deleted {deleted} of {len(candidates)} unreferenced scan blobs")
+    return deleted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain content-addressed scan blobs.")
+    parser.add_argument("--collect", action="store_true", help="Delete blobs that no scan references any more.")
+    parser.add_argument("--grace-hours", type=float, default=GC_GRACE_SECONDS / 3600)
+    args = parser.parse_args()
+
+    if args.collect:
+        from firebase_config import get_firestore_client, get_storage_bucket
+        collect_unreferenced(get_firestore_client(), get_storage_bucket(), args.grace_hours * 3600)
@@ -0,0 +1,318 @@
+# search_index.py
+"""
+Local full-text index over patient names, condition descriptions, medication names and notes.
+
+Firestore has no full-text search, so searchable text is tokenized into an inverted index kept in
+a local SQLite file (MEDTREE_SEARCH_INDEX, see `datastore`):
+
+    terms(token, doc_key)                                       one posting per distinct token
+    documents(doc_key, collection, doc_id, patient_id, text, private, category, tokens)
+    confidential_patients(patient_id)                           patients marked confidential
+
+Tokens are accent-folded, lower-cased runs of letters and digits. Every query term matches as a
+prefix, answered by a range scan of the `terms` primary key, and a document must match all terms;
+exact token matches rank above prefix matches. Nothing reads Firestore at query time.
+
+The write helpers in `patient_repository` and the note forms update the index as they write, so
+it stays current without scanning collections. `mental_health_notes` are indexed as private and
+are only returned by searches scoped to their own patient (`search(..., patient_id=..., include_private=True)`).
+Searches across patients also leave out Red (critical) records and the records of confidential
+patients; a confidential patient's name still matches, and opening them asks for access as usual.
+An index file from an older schema is emptied on open and must be rebuilt.
+
+One-off build for existing data (or after a bulk import):
+    python search_index.py --rebuild
+"""
+import argparse
+import json
+import re
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+
+from datastore import search_index_path
+
+# collection: the field whose text is indexed
+INDEXED_FIELDS = {
+    "patients": "Name",
+    "allergies_and_conditions": "description",
+    "prescriptions": "medication_name",
+    "mental_health_notes": "note",
+}
+PRIVATE_COLLECTIONS = {"mental_health_notes"}
+# Records in this category are hidden from searches across patients, like on the Doctor Dashboard
+RESTRICTED_CATEGORY = "Red"
+SCHEMA_VERSION = 2
+MAX_STORED_TEXT = 300
+DEFAULT_LIMIT = 20
+_TOKEN = re.compile(r"[a-z0-9]+")
+# Greater than any character, so [prefix, prefix + _PREFIX_END) is every token starting with prefix
+_PREFIX_END = "\U0010ffff"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS terms (
+    token TEXT NOT NULL,
+    doc_key TEXT NOT NULL,
+    PRIMARY KEY (token, doc_key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS documents (
+    doc_key TEXT PRIMARY KEY,
+    collection TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    patient_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    private INTEGER NOT NULL,
+    category TEXT NOT NULL DEFAULT '',
+    tokens TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_patient ON documents(patient_id);
+CREATE TABLE IF NOT EXISTS confidential_patients (
+    patient_id TEXT PRIMARY KEY
+) WITHOUT ROWID;
+"""
+
+
+def tokenize(text):
+    """Returns the distinct tokens of `text` in order of first appearance."""
+    folded = unicodedata.normalize("NFKD", str(text or ""))
+    folded = "".join(ch for ch in folded if not unicodedata.combining(ch)).casefold()
+    return list(dict.fromkeys(_TOKEN.findall(folded)))
+
+
+class SearchIndex:
+    """An inverted index in one SQLite file, safe to share between threads."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.RLock()
+        with self._lock:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != SCHEMA_VERSION:
+                if self._conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'documents'").fetchone():
+                    print(f"Search index {path} has an older schema and was emptied; run: python search_index.py --rebuild", file=sys.stderr)
+                self._conn.executescript("DROP TABLE IF EXISTS terms; DROP TABLE IF EXISTS documents; DROP TABLE IF EXISTS confidential_patients;")
+            self._conn.executescript(_SCHEMA)
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _transaction(self, fn, *args):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                fn(*args)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _remove(self, doc_key):
+        """Removes a document and returns its category ('' if it was not indexed)."""
+        row = self._conn.execute("SELECT tokens, category FROM documents WHERE doc_key = ?", (doc_key,)).fetchone()
+        if row is None:
+            return ""
+        self._conn.executemany("DELETE FROM terms WHERE token = ? AND doc_key = ?", [(token, doc_key) for token in json.loads(row[0])])
+        self._conn.execute("DELETE FROM documents WHERE doc_key = ?", (doc_key,))
+        return row[1]
+
+    def _put(self, collection, doc_id, patient_id, text, category=None):
+        doc_key = f"{collection}/{doc_id}"
+        previous_category = self._remove(doc_key)
+        tokens = tokenize(text)
+        if not tokens:
+            return
+        self._conn.execute(
+            "INSERT INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (doc_key, collection, doc_id, patient_id, str(text)[:MAX_STORED_TEXT], int(collection in PRIVATE_COLLECTIONS),
+             previous_category if category is None else category, json.dumps(tokens)),
+        )
+        self._conn.executemany("INSERT INTO terms VALUES (?, ?)", [(token, doc_key) for token in tokens])
+
+    def _put_many(self, entries):
+        for entry in entries:
+            self._put(*entry)
+
+    def put_many(self, entries):
+        """
+        Indexes (or re-indexes) [(collection, doc_id, patient_id, text[, category]), ...] in one
+        transaction. Without a category, a re-indexed document keeps the one it had.
+        """
+        self._transaction(self._put_many, entries)
+
+    def put(self, collection, doc_id, patient_id, text, category=None):
+        self.put_many([(collection, doc_id, patient_id, text, category)])
+
+    def set_category(self, collection, doc_id, category):
+        with self._lock:
+            self._conn.execute("UPDATE documents SET category = ? WHERE doc_key = ?", (category or "", f"{collection}/{doc_id}"))
+
+    def _set_confidential(self, patient_ids, confidential):
+        if confidential:
+            self._conn.executemany("INSERT OR IGNORE INTO confidential_patients VALUES (?)", [(pid,) for pid in patient_ids])
+        else:
+            self._conn.executemany("DELETE FROM confidential_patients WHERE patient_id = ?", [(pid,) for pid in patient_ids])
+
+    def set_confidential(self, patient_ids, confidential):
+        """Marks patients as confidential (or not), hiding their records from searches across patients."""
+        self._transaction(self._set_confidential, list(patient_ids), confidential)
+
+    def remove(self, collection, doc_id):
+        self._transaction(self._remove, f"{collection}/{doc_id}")
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM terms")
+            self._conn.execute("DELETE FROM documents")
+            self._conn.execute("DELETE FROM confidential_patients")
+
+    def search(self, query, collections=None, patient_id=None, include_private=False, limit=DEFAULT_LIMIT):
+        """
+        Returns [{"collection", "doc_id", "patient_id", "text", "score"}, ...] for documents containing
+        every query term as a token prefix, best first. Private documents are only included when
+        the search is scoped to one patient with include_private=True; Red records and confidential
+        patients' records (other than their name) only when it is scoped to one patient.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        matches = " UNION ALL ".join(
+            "SELECT doc_key, MAX(token = ?) AS exact FROM terms WHERE token >= ? AND token < ? GROUP BY doc_key" for _ in terms
+        )
+        params = [value for term in terms for value in (term, term, term + _PREFIX_END)]
+        filters = []
+        if patient_id is not None:
+            filters.append("d.patient_id = ?")
+            params.append(patient_id)
+        if patient_id is None or not include_private:
+            filters.append("d.private = 0")
+        if patient_id is None:
+            filters.append("d.category != ?")
+            params.append(RESTRICTED_CATEGORY)
+            filters.append("(d.collection = 'patients' OR d.patient_id NOT IN (SELECT patient_id FROM confidential_patients))")
+        if collections:
+            filters.append(f"d.collection IN ({', '.join('?' for _ in collections)})")
+            params.extend(collections)
+        sql = (
+            f"SELECT d.collection, d.doc_id, d.patient_id, d.text, COUNT(*) + SUM(m.exact) AS score"
+            f" FROM ({matches}) AS m JOIN documents AS d ON d.doc_key = m.doc_key"
+            f"{' WHERE ' + ' AND '.join(filters) if filters else ''}"
+            f" GROUP BY m.doc_key HAVING COUNT(*) = ? ORDER BY score DESC, d.text LIMIT ?"
+        )
+        params.extend([len(terms), limit])
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [{"collection": c, "doc_id": d, "patient_id": p, "text": t, "score": s} for c, d, p, t, s in rows]
+
+    def names(self, patient_ids):
+        """Returns {patient_id: indexed name} for the given patients."""
+        patient_ids = list(dict.fromkeys(patient_ids))
+        if not patient_ids:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT doc_id, text FROM documents WHERE collection = 'patients' AND doc_id IN ({', '.join('?' for _ in patient_ids)})",
+                patient_ids,
+            ).fetchall()
+        return dict(rows)
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Returns the process-wide index at the configured path."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SearchIndex(search_index_path())
+        return _index
+
+
+# --- Incremental updates (called by the write paths) ---
+def index_document(collection, doc_id, patient_id, fields):
+    """Re-indexes a written document if the write touched its indexed field or category; other updates are ignored."""
+    field = INDEXED_FIELDS.get(collection)
+    if field is None:
+        return
+    if field in fields:
+        get_index().put(collection, doc_id, patient_id, fields[field], fields.get("category"))
+    elif "category" in fields:
+        get_index().set_category(collection, doc_id, fields["category"])
+
+
+def index_patient(patient_id, fields):
+    index_document("patients", patient_id, patient_id, fields)
+    if "confidential" in fields:
+        get_index().set_confidential([patient_id], bool(fields["confidential"]))
+
+
+# --- Queries ---
+def search(query, collections=None, patient_id=None, include_private=False, limit=DEFAULT_LIMIT):
+    return get_index().search(query, collections, patient_id, include_private, limit)
+
+
+def search_patients(query, limit=DEFAULT_LIMIT):
+    """
+    Doctor-facing search over names, conditions and medications (never notes, Red records or a
+    confidential patient's records). Returns [{"patient_id", "name", "matches": [hit, ...]}, ...]
+    grouped by patient, best patient first.
+    """
+    index = get_index()
+    by_patient = {}
+    for hit in index.search(query, collections=("patients", "allergies_and_conditions", "prescriptions"), limit=limit * 10):
+        by_patient.setdefault(hit["patient_id"], []).append(hit)
+    patient_ids = list(by_patient)[:limit]
+    names = index.names(patient_ids)
+    return [{"patient_id": pid, "name": names.get(pid, "N/A"), "matches": by_patient[pid]} for pid in patient_ids]
+
+
+# --- Rebuild ---
+def rebuild(db, index=None):
+    """Re-creates the index from the source collections (one streamed pass each). Returns the document count."""
+    index = index or get_index()
+    started = time.perf_counter()
+    index.clear()
+    total = 0
+    for collection, field in INDEXED_FIELDS.items():
+        query = db.collection(collection)
+        query = query.select([field, "confidential"]) if collection == "patients" else query.select(["patient_id", field, "category"])
+        entries, confidential = [], []
+        for doc in query.stream():
+            data = doc.to_dict() or {}
+            if data.get("confidential"):
+                confidential.append(doc.id)
+            if field in data:
+                entries.append((collection, doc.id, doc.id if collection == "patients" else data.get("patient_id", ""), data[field], data.get("category", "")))
+        index.put_many(entries)
+        index.set_confidential(confidential, True)
+        total += len(entries)
+        print(f"Indexed {len(entries)} {collection}")
+    print(f"Indexed {total} documents in {time.perf_counter() - started:.1f}s")
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the local full-text search index.")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index from Firestore (or the configured store).")
+    parser.add_argument("--query", help="Run a search and print the hits.")
+    parser.add_argument("--patient", help="Scope --query to one patient, including their private notes.")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        from firebase_config import get_firestore_client
+        rebuild(get_firestore_client())
+    if args.query:
+        started = time.perf_counter()
+        hits = search(args.query, patient_id=args.patient, include_private=bool(args.patient))
+        for hit in hits:
+            print(f"{hit['score']:>3}  {hit['patient_id']:<16} {hit['collection']:<26} {hit['text'][:80]}")
+        print(f"{len(hits)} hits in {(time.perf_counter() - started) * 1000:.1f} ms")
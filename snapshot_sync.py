@@ -0,0 +1,244 @@
+# snapshot_sync.py
+"""
+Listener-based sync layer that keeps viewed patients' records warm in memory.
+
+While at least one Streamlit session is viewing a patient, `on_snapshot` listeners on the
+patient document and its prescriptions / allergies_and_conditions / scans queries apply
+incremental changes to a local PatientRecordStore. `patient_repository` reads from that store
+instead of querying Firestore. Listeners are reference-counted by session and released when no
+session is viewing the patient any more (session switched patient, went idle, or ended).
+"""
+import datetime
+import threading
+import time
+
+from google.cloud.firestore_v1.base_query import FieldFilter
+from google.cloud.firestore_v1.transforms import ArrayRemove, ArrayUnion, DELETE_FIELD, SERVER_TIMESTAMP
+
+RECORD_COLLECTIONS = ("prescriptions", "allergies_and_conditions", "scans")
+READY_TIMEOUT_SECONDS = 5
+# Streamlit does not notify on session end; sessions not seen for this long release their listeners.
+SESSION_IDLE_SECONDS = 900
+
+
+_change_callbacks = []
+
+
+def add_change_callback(callback):
+    """Registers callback(collection, patient_id), called when a listener receives a remote change."""
+    _change_callbacks.append(callback)
+
+
+def current_session_id():
+    """Returns the Streamlit session ID of the running script, or None outside Streamlit."""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        return ctx.session_id if ctx else None
+    except Exception:
+        return None
+
+
+def _session_is_active(session_id):
+    try:
+        from streamlit import runtime
+        return not runtime.exists() or runtime.get_instance().is_active_session(session_id)
+    except Exception:
+        return True
+
+
+def _apply_fields(target, fields):
+    """Applies an update dict, including Firestore transforms, to a local document copy."""
+    for key, value in fields.items():
+        if value is DELETE_FIELD:
+            target.pop(key, None)
+        elif value is SERVER_TIMESTAMP:
+            target[key] = datetime.datetime.now(datetime.timezone.utc)
+        elif isinstance(value, ArrayUnion):
+            current = list(target.get(key) or [])
+            target[key] = current + [v for v in value.values if v not in current]
+        elif isinstance(value, ArrayRemove):
+            target[key] = [v for v in target.get(key) or [] if v not in value.values]
+        else:
+            target[key] = value
+
+
+class PatientRecordStore:
+    """In-memory copy of one patient's document and record collections, fed by snapshot listeners."""
+
+    def __init__(self, db, patient_id):
+        self.db = db
+        self.patient_id = patient_id
+        self.patient = None
+        self.records = {collection: {} for collection in RECORD_COLLECTIONS}
+        self._lock = threading.Lock()
+        self._pending = set(RECORD_COLLECTIONS) | {"patient"}
+        self._ready = threading.Event()
+        self._watches = []
+
+    def start(self):
+        self._watches.append(self.db.collection("patients").document(self.patient_id).on_snapshot(self._on_patient))
+        for collection in RECORD_COLLECTIONS:
+            query = self.db.collection(collection).where(filter=FieldFilter("patient_id", "==", self.patient_id))
+            self._watches.append(query.on_snapshot(lambda docs, changes, read_time, c=collection: self._on_records(c, changes)))
+        return self
+
+    def stop(self):
+        for watch in self._watches:
+            try:
+                watch.unsubscribe()
+            except Exception:
+                pass
+        self._watches = []
+
+    # --- Listener callbacks (run on the listener thread) ---
+    def _on_patient(self, doc_snapshots, changes, read_time):
+        with self._lock:
+            doc = doc_snapshots[0] if doc_snapshots else None
+            self.patient = doc.to_dict() if doc is not None and doc.exists else None
+            self._mark_loaded("patient")
+
+    def _on_records(self, collection, changes):
+        with self._lock:
+            docs = self.records[collection]
+            for change in changes:
+                if change.type.name == "REMOVED":
+                    docs.pop(change.document.id, None)
+                else:
+                    docs[change.document.id] = {"id": change.document.id, **change.document.to_dict()}
+            initial = collection in self._pending
+            self._mark_loaded(collection)
+        if changes and not initial:
+            for callback in _change_callbacks:
+                callback(collection, self.patient_id)
+
+    def _mark_loaded(self, name):
+        self._pending.discard(name)
+        if not self._pending:
+            self._ready.set()
+
+    # --- Local writes (applied optimistically until the listener confirms them) ---
+    def apply_record_write(self, collection, doc_id, fields, replace=False):
+        with self._lock:
+            # Records handed out to readers are never mutated in place
+            doc = {"id": doc_id} if replace else dict(self.records[collection].get(doc_id) or {"id": doc_id})
+            _apply_fields(doc, fields)
+            self.records[collection][doc_id] = doc
+
+    def apply_patient_update(self, fields):
+        with self._lock:
+            if self.patient is not None:
+                self.patient = dict(self.patient)
+                _apply_fields(self.patient, fields)
+
+    # --- Reads ---
+    def wait_ready(self, timeout=READY_TIMEOUT_SECONDS):
+        return self._ready.wait(timeout)
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def get_patient(self):
+        with self._lock:
+            return self.patient
+
+    def get_records(self, collection):
+        with self._lock:
+            return list(self.records[collection].values())
+
+
+class ListenerRegistry:
+    """Reference-counts record stores by the sessions viewing each patient."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stores = {}          # patient_id -> PatientRecordStore
+        self._viewers = {}         # patient_id -> set(session_id)
+        self._session_patient = {}  # session_id -> patient_id
+        self._last_seen = {}       # session_id -> monotonic time
+
+    def acquire(self, db, patient_id, session_id):
+        """Registers `session_id` as viewing `patient_id` and returns the patient's live store."""
+        to_stop = []
+        with self._lock:
+            previous = self._session_patient.get(session_id)
+            if previous is not None and previous != patient_id:
+                to_stop += self._release_locked(session_id)
+            self._session_patient[session_id] = patient_id
+            self._last_seen[session_id] = time.monotonic()
+            self._viewers.setdefault(patient_id, set()).add(session_id)
+            store = self._stores.get(patient_id)
+            if store is None:
+                store = self._stores[patient_id] = PatientRecordStore(db, patient_id)
+                started = False
+            else:
+                started = True
+            to_stop += self._reap_locked()
+        for stale in to_stop:
+            stale.stop()
+        if not started:
+            store.start()
+        return store
+
+    def release(self, session_id):
+        """Stops viewing; listeners are shut down when the last viewer of a patient leaves."""
+        with self._lock:
+            to_stop = self._release_locked(session_id)
+        for store in to_stop:
+            store.stop()
+
+    def _release_locked(self, session_id):
+        patient_id = self._session_patient.pop(session_id, None)
+        self._last_seen.pop(session_id, None)
+        if patient_id is None:
+            return []
+        viewers = self._viewers.get(patient_id, set())
+        viewers.discard(session_id)
+        if viewers:
+            return []
+        self._viewers.pop(patient_id, None)
+        store = self._stores.pop(patient_id, None)
+        return [store] if store else []
+
+    def _reap_locked(self):
+        now = time.monotonic()
+        stale = [sid for sid, seen in self._last_seen.items() if now - seen > SESSION_IDLE_SECONDS or not _session_is_active(sid)]
+        stopped = []
+        for session_id in stale:
+            stopped += self._release_locked(session_id)
+        return stopped
+
+    def get(self, patient_id):
+        """Returns the live store for a patient if one is running and fully loaded."""
+        with self._lock:
+            store = self._stores.get(patient_id)
+        return store if store is not None and store.ready else None
+
+
+registry = ListenerRegistry()
+
+
+def watch_patient(db, patient_id, wait=True):
+    """
+    Called by a page each run for the patient it is showing. Starts (or reuses) the listeners for
+    this patient and, on the first run, waits briefly for the initial snapshot to arrive.
+    """
+    session_id = current_session_id()
+    if session_id is None or not hasattr(db.collection("patients").document(patient_id), "on_snapshot"):
+        return None
+    store = registry.acquire(db, patient_id, session_id)
+    if wait:
+        store.wait_ready()
+    return store
+
+
+def unwatch_patient():
+    """Releases the current session's listeners (e.g. on logout or when leaving a patient)."""
+    session_id = current_session_id()
+    if session_id is not None:
+        registry.release(session_id)
+
+
+def get_live_store(patient_id):
+    return registry.get(patient_id)
@@ -0,0 +1,622 @@
+# sqlite_store.py
+"""
+Local SQLite implementation of the part of the Firestore client API that MedTree uses.
+
+Selected with MEDTREE_STORAGE=sqlite (see `datastore`). Pages, the Flask backends and the offline
+jobs run unchanged against it: `collection` / `document` / `collection_group`, `where` (FieldFilter
+or positional), `order_by`, `limit`, `select`, `start_after`, `count()`, `stream` / `get`,
+`get_all`, batches, transactions (through `datastore.transactional`) and the SERVER_TIMESTAMP,
+ArrayUnion, ArrayRemove, Increment and DELETE_FIELD transforms. Snapshot listeners are not
+supported: references have no `on_snapshot`, which `snapshot_sync` checks for before falling back
+to cached reads.
+
+Every document, in any collection or subcollection, is one row of a single `documents` table with
+its fields stored as JSON. Equality and `in` filters on the fields in INDEXED_FIELDS are answered
+from expression indexes; all other filters, ordering and cursors are applied in Python to the rows
+that the indexed part of the query returns.
+"""
+import base64
+import contextlib
+import datetime
+import json
+import random
+import re
+import sqlite3
+import string
+import threading
+
+from google.api_core.exceptions import AlreadyExists, NotFound
+from google.cloud.firestore_v1.transforms import ArrayRemove, ArrayUnion, DELETE_FIELD, Increment, SERVER_TIMESTAMP
+
+from firestore_metrics import register_types
+
+DEFAULT_PATH = "medtree_local.sqlite3"
+# Fields with an expression index; equality / `in` filters on them are resolved in SQL.
+INDEXED_FIELDS = ("patient_id", "creator_id", "relative_to_id", "category")
+AUTO_ID_LENGTH = 20
+_SIMPLE_FIELD = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    path TEXT PRIMARY KEY,
+    collection_path TEXT NOT NULL,
+    collection_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    create_time TEXT NOT NULL,
+    update_time TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_collection ON documents(collection_path);
+CREATE INDEX IF NOT EXISTS idx_documents_group ON documents(collection_id);
+"""
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _auto_id():
+    alphabet = string.ascii_letters + string.digits
+    return "".join(random.SystemRandom().choice(alphabet) for _ in range(AUTO_ID_LENGTH))
+
+
+# --- Value encoding ---
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, DocumentReference):
+        return {"__ref__": value.path}
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, dict):
+        return {key: _encode(v) for key, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    return value
+
+
+def _decode(value, client):
+    if isinstance(value, dict):
+        if len(value) == 1:
+            if "__datetime__" in value:
+                return datetime.datetime.fromisoformat(value["__datetime__"])
+            if "__ref__" in value:
+                return client.document(value["__ref__"])
+            if "__bytes__" in value:
+                return base64.b64decode(value["__bytes__"])
+        return {key: _decode(v, client) for key, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v, client) for v in value]
+    return value
+
+
+# --- Transforms ---
+def _assign(target, key, value, now):
+    if value is DELETE_FIELD:
+        target.pop(key, None)
+    elif value is SERVER_TIMESTAMP:
+        target[key] = now
+    elif isinstance(value, ArrayUnion):
+        current = list(target.get(key) or [])
+        target[key] = current + [v for v in value.values if v not in current]
+    elif isinstance(value, ArrayRemove):
+        target[key] = [v for v in target.get(key) or [] if v not in value.values]
+    elif isinstance(value, Increment):
+        current = target.get(key)
+        target[key] = (current if isinstance(current, (int, float)) else 0) + value.value
+    elif isinstance(value, dict):
+        target[key] = _merge({}, value, now)
+    else:
+        target[key] = value
+
+
+def _merge(target, data, now):
+    """set(..., merge=True) semantics: nested maps are merged, everything else replaced."""
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            target[key] = _merge(dict(target[key]), value, now)
+        else:
+            _assign(target, key, value, now)
+    return target
+
+
+def _update(target, fields, now):
+    """update() semantics: dotted keys address nested fields, map values replace the field."""
+    for key, value in fields.items():
+        parts = key.split(".")
+        node = target
+        for part in parts[:-1]:
+            child = node.get(part)
+            node[part] = child = dict(child) if isinstance(child, dict) else {}
+            node = child
+        _assign(node, parts[-1], value, now)
+    return target
+
+
+_MISSING = object()
+
+
+def _lookup(data, field_path):
+    node = data
+    for part in field_path.split("."):
+        if not isinstance(node, dict) or part not in node:
+            return _MISSING
+        node = node[part]
+    return node
+
+
+# --- Ordering (Firestore's cross-type order: null < bool < number < timestamp < string < bytes < reference < array < map) ---
+def _order_key(value):
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return (3, value.timestamp())
+    if isinstance(value, str):
+        return (4, value)
+    if isinstance(value, bytes):
+        return (5, value)
+    if isinstance(value, DocumentReference):
+        return (6, value.path)
+    if isinstance(value, list):
+        return (7, tuple(_order_key(v) for v in value))
+    if isinstance(value, dict):
+        return (8, tuple(sorted((k, _order_key(v)) for k, v in value.items())))
+    return (9, str(value))
+
+
+def _compare(a, b):
+    a, b = _order_key(a), _order_key(b)
+    return (a > b) - (a < b)
+
+
+def _matches(data, field_path, op, value):
+    actual = _lookup(data, field_path)
+    if actual is _MISSING:
+        return False
+    if op == "==":
+        return _compare(actual, value) == 0
+    if op == "!=":
+        return actual is not None and _compare(actual, value) != 0
+    if op in ("<", "<=", ">", ">="):
+        if _order_key(actual)[0] != _order_key(value)[0]:
+            return False
+        c = _compare(actual, value)
+        return {"<": c < 0, "<=": c <= 0, ">": c > 0, ">=": c >= 0}[op]
+    if op == "in":
+        return any(_compare(actual, v) == 0 for v in value)
+    if op == "not-in":
+        return actual is not None and all(_compare(actual, v) != 0 for v in value)
+    if op == "array_contains":
+        return isinstance(actual, list) and any(_compare(a, value) == 0 for a in actual)
+    if op == "array_contains_any":
+        return isinstance(actual, list) and any(_compare(a, v) == 0 for a in actual for v in value)
+    raise ValueError(f"Unsupported operator: {op}")
+
+
+def _sql_scalar(value):
+    return value is None or isinstance(value, (str, int, float, bool))
+
+
+# --- Snapshots ---
+class DocumentSnapshot:
+    def __init__(self, reference, data, create_time=None, update_time=None, field_paths=None):
+        self.reference = reference
+        self._data = data
+        self.create_time = create_time
+        self.update_time = update_time
+        self._field_paths = field_paths
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        if self._data is None:
+            return None
+        data = _decode(self._data, self.reference._client)
+        if self._field_paths is not None:
+            data = {key: value for key, value in data.items() if key in self._field_paths}
+        return data
+
+    def get(self, field_path):
+        value = _lookup(self.to_dict() or {}, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return value
+
+
+class AggregationResult:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+
+class WriteResult:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+# --- References and queries ---
+class Query:
+    ASCENDING = "ASCENDING"
+    DESCENDING = "DESCENDING"
+
+    def __init__(self, parent, all_descendants=False):
+        self._client = parent._client
+        self._parent = parent
+        self._all_descendants = all_descendants
+        self._filters = []
+        self._orders = []
+        self._limit = None
+        self._projection = None
+        self._cursor = None
+
+    def _copy(self, **changes):
+        query = Query.__new__(Query)
+        query.__dict__.update(self.__dict__)
+        query._filters = list(self._filters)
+        query._orders = list(self._orders)
+        query.__dict__.update(changes)
+        return query
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        query = self._copy()
+        query._filters.append((field_path, op_string, value))
+        return query
+
+    def order_by(self, field_path, direction=ASCENDING):
+        query = self._copy()
+        query._orders.append((field_path, str(direction).upper().endswith("DESCENDING")))
+        return query
+
+    def limit(self, count):
+        return self._copy(_limit=count)
+
+    def select(self, field_paths):
+        return self._copy(_projection=set(field_paths))
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(_cursor=(document_fields_or_snapshot, False))
+
+    def start_at(self, document_fields_or_snapshot):
+        return self._copy(_cursor=(document_fields_or_snapshot, True))
+
+    def count(self, alias=None):
+        return AggregationQuery(self, alias or "field_1")
+
+    # --- Execution ---
+    def _candidate_rows(self):
+        if self._all_descendants:
+            clauses, params = ["collection_id = ?"], [self._parent.id]
+        else:
+            clauses, params = ["collection_path = ?"], [self._parent._path]
+        for field_path, op, value in self._filters:
+            if field_path not in INDEXED_FIELDS:
+                continue
+            column = f"json_extract(data, '$.{field_path}')"
+            if op == "==" and _sql_scalar(value) and value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+            elif op == "in" and value and all(_sql_scalar(v) and v is not None for v in value):
+                clauses.append(f"{column} IN ({', '.join('?' * len(value))})")
+                params.extend(value)
+        return self._client._select(f"SELECT path, data, create_time, update_time FROM documents WHERE {' AND '.join(clauses)}", params)
+
+    def _cursor_values(self, cursor):
+        if isinstance(cursor, DocumentSnapshot):
+            data = _decode(cursor._data or {}, self._client)
+            return [_lookup(data, f) for f, _ in self._orders], cursor.reference.path
+        if isinstance(cursor, dict):
+            return [cursor.get(f) for f, _ in self._orders], None
+        return list(cursor), None
+
+    def _results(self):
+        docs = []
+        for path, raw, create_time, update_time in self._candidate_rows():
+            data = json.loads(raw)
+            decoded = _decode(data, self._client)
+            if all(_matches(decoded, f, op, v) for f, op, v in self._filters):
+                docs.append((path, data, decoded, create_time, update_time))
+        # Documents without an order_by field are excluded, as in Firestore
+        docs = [d for d in docs if all(_lookup(d[2], f) is not _MISSING for f, _ in self._orders)]
+        docs.sort(key=lambda d: d[0])
+        for field_path, descending in reversed(self._orders):
+            docs.sort(key=lambda d: _order_key(_lookup(d[2], field_path)), reverse=descending)
+
+        if self._cursor is not None:
+            cursor, inclusive = self._cursor
+            values, cursor_path = self._cursor_values(cursor)
+
+            def position(doc):
+                for (field_path, descending), value in zip(self._orders, values):
+                    c = _compare(_lookup(doc[2], field_path), value)
+                    if c:
+                        return -c if descending else c
+                if cursor_path is not None:
+                    return (doc[0] > cursor_path) - (doc[0] < cursor_path)
+                return 0
+            docs = [d for d in docs if position(d) > 0 or (inclusive and position(d) == 0)]
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        return [DocumentSnapshot(self._client.document(path), data, _parse_time(ct), _parse_time(ut), self._projection)
+                for path, data, _, ct, ut in docs]
+
+    def stream(self, transaction=None, **kwargs):
+        return iter(self._results())
+
+    def get(self, transaction=None, **kwargs):
+        return self._results()
+
+
+class AggregationQuery:
+    def __init__(self, query, alias):
+        self._nested_query = query
+        self._alias = alias
+
+    def get(self, transaction=None, **kwargs):
+        return [[AggregationResult(self._alias, len(self._nested_query._results()))]]
+
+    def stream(self, transaction=None, **kwargs):
+        return iter(self.get())
+
+
+class CollectionReference(Query):
+    def __init__(self, client, path):
+        self._client = client
+        self._path = path
+        self.id = path.rsplit("/", 1)[-1]
+        super().__init__(self)
+
+    @property
+    def parent(self):
+        if "/" not in self._path:
+            return None
+        return DocumentReference(self._client, self._path.rsplit("/", 1)[0])
+
+    def document(self, document_id=None):
+        return DocumentReference(self._client, f"{self._path}/{document_id or _auto_id()}")
+
+    def add(self, document_data, document_id=None):
+        ref = self.document(document_id)
+        ref.create(document_data)
+        return _now(), ref
+
+    def list_documents(self, page_size=None):
+        rows = self._client._select("SELECT path FROM documents WHERE collection_path = ?", [self._path])
+        return [self._client.document(path) for (path,) in rows]
+
+
+class DocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def __eq__(self, other):
+        return isinstance(other, DocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __repr__(self):
+        return f"DocumentReference({self.path!r})"
+
+    @property
+    def parent(self):
+        return CollectionReference(self._client, self.path.rsplit("/", 1)[0])
+
+    def collection(self, collection_id):
+        return CollectionReference(self._client, f"{self.path}/{collection_id}")
+
+    def get(self, field_paths=None, transaction=None, **kwargs):
+        return self._client._get(self, field_paths)
+
+    def set(self, document_data, merge=False):
+        return self._client._write([("set", self, document_data, merge)])[0]
+
+    def create(self, document_data):
+        return self._client._write([("create", self, document_data, False)])[0]
+
+    def update(self, field_updates, option=None):
+        return self._client._write([("update", self, field_updates, False)])[0]
+
+    def delete(self, option=None):
+        return self._client._write([("delete", self, None, False)])[0]
+
+
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, reference, document_data, merge=False):
+        self._ops.append(("set", reference, document_data, merge))
+        return self
+
+    def create(self, reference, document_data):
+        self._ops.append(("create", reference, document_data, False))
+        return self
+
+    def update(self, reference, field_updates, option=None):
+        self._ops.append(("update", reference, field_updates, False))
+        return self
+
+    def delete(self, reference, option=None):
+        self._ops.append(("delete", reference, None, False))
+        return self
+
+    def commit(self, **kwargs):
+        ops, self._ops = self._ops, []
+        return self._client._write(ops)
+
+    def __len__(self):
+        return len(self._ops)
+
+
+class Transaction(WriteBatch):
+    """Reads see committed data; writes are buffered and committed atomically by `run_local`."""
+
+    is_local = True
+
+    def get(self, ref_or_query, **kwargs):
+        if isinstance(ref_or_query, DocumentReference):
+            return ref_or_query.get()
+        return ref_or_query.stream()
+
+    def get_all(self, references, **kwargs):
+        return self._client.get_all(references)
+
+    def run_local(self, fn):
+        """Runs fn() holding the store's write lock, then commits the buffered writes (or discards them on error)."""
+        with self._client._transaction():
+            try:
+                result = fn()
+            except Exception:
+                self._ops = []
+                raise
+            self.commit()
+            return result
+
+
+def _parse_time(value):
+    return datetime.datetime.fromisoformat(value) if value else None
+
+
+class SQLiteClient:
+    """Drop-in replacement for `firestore.Client` backed by one SQLite file (":memory:" for tests)."""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.RLock()
+        self._depth = 0
+        with self._lock:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            for field in INDEXED_FIELDS:
+                assert _SIMPLE_FIELD.match(field)
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_documents_{field} ON documents(collection_path, json_extract(data, '$.{field}'))")
+
+    # --- Public API ---
+    def collection(self, collection_path):
+        return CollectionReference(self, collection_path)
+
+    def document(self, document_path):
+        return DocumentReference(self, document_path)
+
+    def collection_group(self, collection_id):
+        return Query(_GroupParent(self, collection_id), all_descendants=True)
+
+    def get_all(self, references, field_paths=None, transaction=None, **kwargs):
+        references = list(references)
+        if not references:
+            return iter([])
+        by_path = {}
+        paths = [ref.path for ref in references]
+        for start in range(0, len(paths), 500):
+            chunk = paths[start:start + 500]
+            rows = self._select(f"SELECT path, data, create_time, update_time FROM documents WHERE path IN ({', '.join('?' * len(chunk))})", chunk)
+            by_path.update({row[0]: row for row in rows})
+        projection = set(field_paths) if field_paths is not None else None
+        snapshots = []
+        for ref in references:
+            row = by_path.get(ref.path)
+            if row is None:
+                snapshots.append(DocumentSnapshot(ref, None))
+            else:
+                snapshots.append(DocumentSnapshot(ref, json.loads(row[1]), _parse_time(row[2]), _parse_time(row[3]), projection))
+        return iter(snapshots)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def transaction(self, **kwargs):
+        return Transaction(self)
+
+    def close(self):
+        self._conn.close()
+
+    # --- Storage ---
+    def _select(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _get(self, ref, field_paths=None):
+        rows = self._select("SELECT data, create_time, update_time FROM documents WHERE path = ?", [ref.path])
+        if not rows:
+            return DocumentSnapshot(ref, None)
+        data, create_time, update_time = rows[0]
+        return DocumentSnapshot(ref, json.loads(data), _parse_time(create_time), _parse_time(update_time), set(field_paths) if field_paths is not None else None)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._lock:
+            outermost = self._depth == 0
+            if outermost:
+                self._conn.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield
+            except BaseException:
+                self._depth -= 1
+                if outermost:
+                    self._conn.execute("ROLLBACK")
+                raise
+            self._depth -= 1
+            if outermost:
+                self._conn.execute("COMMIT")
+
+    def _write(self, ops):
+        """Applies [(kind, reference, data, merge)] atomically. Returns one WriteResult per op."""
+        now = _now()
+        stamp = now.isoformat()
+        results = []
+        with self._transaction():
+            for kind, ref, data, merge in ops:
+                row = self._conn.execute("SELECT data, create_time FROM documents WHERE path = ?", [ref.path]).fetchone()
+                if kind == "delete":
+                    self._conn.execute("DELETE FROM documents WHERE path = ?", [ref.path])
+                    results.append(WriteResult(now))
+                    continue
+                if kind == "create" and row is not None:
+                    raise AlreadyExists(f"Document already exists: {ref.path}")
+                if kind == "update" and row is None:
+                    raise NotFound(f"No document to update: {ref.path}")
+                current = _decode(json.loads(row[0]), self) if row is not None else {}
+                if kind == "update":
+                    new_data = _update(current, data, now)
+                elif merge:
+                    new_data = _merge(current, data, now)
+                else:
+                    new_data = _merge({}, data, now)
+                collection_path = ref.path.rsplit("/", 1)[0]
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO documents (path, collection_path, collection_id, data, create_time, update_time) VALUES (?, ?, ?, ?, ?, ?)",
+                    [ref.path, collection_path, collection_path.rsplit("/", 1)[-1], json.dumps(_encode(new_data)), row[1] if row else stamp, stamp],
+                )
+                results.append(WriteResult(now))
+        return results
+
+
+class _GroupParent:
+    """Stands in for the parent of a collection-group query."""
+
+    def __init__(self, client, collection_id):
+        self._client = client
+        self.id = collection_id
+
+
+register_types(query=(Query,), collection=(CollectionReference,), document=(DocumentReference,), aggregation=(AggregationQuery,))
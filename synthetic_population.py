@@ -0,0 +1,335 @@
+# synthetic_population.py
+"""
+Deterministic synthetic patient populations for benchmarks and load tests.
+
+    python synthetic_population.py --patients 100000 --ndjson population.ndjson   # bulk_load.py input
+    python synthetic_population.py --patients 100000 --sqlite                      # straight into the local store
+
+The population is generated family by family as a stream, so memory stays bounded by the size of
+one family however many patients are requested. Each family is drawn from its own RNG seeded with
+(seed, family index): the same seed always yields the same documents, byte for byte.
+
+What is generated, shaped like the app's own writes:
+    patients                 profile fields as created on the doctor dashboard, password "synthetic"
+    family_groups/members    three generations (grandparents, their children and spouses,
+                             grandchildren) linked through `relationship` / `relative_to_id` chains
+    allergies_and_conditions conditions from the condition vocabulary, written with the free-text
+                             synonyms people actually type; heritable conditions cluster in families
+    prescriptions            medications for the patient's conditions
+    scans                    metadata only (no blobs)
+    mental_health_notes      timestamped diary notes
+    maternity_assessments    for women of reproductive age, with model features and predictions
+    patient_snapshots        complete snapshots, so dashboards read them without a backfill
+    doctors                  DOC-S0001.. with password "synthetic"
+
+Record counts per patient follow a Pareto distribution (most patients have a handful of records,
+a few have hundreds) and categories are skewed towards Green.
+"""
+import argparse
+import datetime
+import json
+import random
+import sys
+import time
+
+from condition_vocabulary import VOCABULARY, maternity_history_flags, normalize
+from patient_snapshot import SNAPSHOT_COLLECTION, SUMMARY_FIELDS, profile_of, summarize
+
+DEFAULT_SEED = 42
+# Fixed reference date so output does not depend on when the generator runs
+DEFAULT_AS_OF = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+PASSWORD = "synthetic"
+
+CATEGORIES = ("Green", "Yellow", "Red")
+CATEGORY_WEIGHTS = (0.7, 0.2, 0.1)
+BLOOD_GROUPS = ("O+", "A+", "B+", "AB+", "O-", "A-", "B-", "AB-")
+BLOOD_GROUP_WEIGHTS = (0.37, 0.28, 0.2, 0.05, 0.04, 0.03, 0.02, 0.01)
+ETHNICITIES = ("Asian", "Caucasian", "African", "Hispanic", "Other")
+SURNAMES = ("Sharma", "Patel", "Khan", "Singh", "Smith", "Garcia", "Okafor", "Nguyen", "Kim", "Silva", "Mensah", "Rossi", "Cohen", "Ivanova", "Haddad", "Tanaka", "Reddy", "Das", "Iyer", "Murphy")
+FIRST_NAMES = {
+    "Male": ("Arjun", "Rahul", "Omar", "James", "Carlos", "Kwame", "Minh", "Jin", "Lucas", "Marco", "David", "Ivan", "Yusuf", "Kenji", "Vikram", "Sean"),
+    "Female": ("Priya", "Ananya", "Aisha", "Emma", "Sofia", "Ama", "Linh", "Mina", "Ana", "Giulia", "Sarah", "Olga", "Layla", "Yuki", "Meera", "Niamh"),
+}
+
+# (code, prevalence among founders, heritable)
+CONDITIONS = (
+    ("I10", 0.25, True), ("E11", 0.12, True), ("E78", 0.15, True), ("J45", 0.08, True), ("E66", 0.15, True),
+    ("F41", 0.08, False), ("F32", 0.07, False), ("E03.9", 0.05, True), ("G43", 0.06, True), ("I25", 0.05, True),
+    ("M19", 0.08, False), ("D64.9", 0.06, False), ("D50", 0.04, False), ("E28.2", 0.04, True), ("N18", 0.02, True),
+    ("C50", 0.01, True), ("D57", 0.005, True), ("D56", 0.005, True), ("E84", 0.002, True), ("G40", 0.01, True),
+    ("J30.1", 0.12, True), ("Z91.010", 0.02, True), ("Z88.0", 0.04, False), ("T78.40", 0.05, False), ("Z91.011", 0.03, False),
+)
+PREGNANCY_CONDITIONS = (("O24.4", 0.07), ("O14", 0.05), ("O60", 0.08))
+HERITABLE = {code for code, _, heritable in CONDITIONS if heritable}
+INHERITANCE_PROBABILITY = 0.35
+MEDICATIONS = {
+    "I10": ("Amlodipine", "Lisinopril", "Losartan"), "E11": ("Metformin", "Glipizide", "Sitagliptin"),
+    "E78": ("Atorvastatin", "Rosuvastatin"), "J45": ("Salbutamol inhaler", "Budesonide inhaler"),
+    "E03.9": ("Levothyroxine",), "G43": ("Sumatriptan", "Propranolol"), "I25": ("Aspirin", "Clopidogrel"),
+    "F41": ("Sertraline", "Buspirone"), "F32": ("Fluoxetine", "Escitalopram"), "D64.9": ("Ferrous sulfate",),
+    "D50": ("Ferrous sulfate", "Folic acid"), "J30.1": ("Cetirizine", "Loratadine"), "M19": ("Paracetamol", "Ibuprofen"),
+    "O24.4": ("Insulin",), "O14": ("Labetalol", "Aspirin"), "E28.2": ("Metformin",), "G40": ("Levetiracetam", "Valproate"),
+}
+TIMINGS = (["Morning"], ["Night"], ["Morning", "Night"], ["Morning", "Afternoon", "Night"])
+DURATIONS = ("7 days", "14 days", "1 month", "3 months", "6 months", "Ongoing")
+BODY_PARTS = ("Chest", "Abdomen", "Head", "Knee", "Spine", "Pelvis", "Hand", "Shoulder")
+NOTE_FRAGMENTS = (
+    "Slept badly last night.", "Feeling calmer today.", "Work was stressful.", "Went for a long walk.",
+    "Anxious before the appointment.", "Good day with family.", "Low energy all afternoon.",
+    "Started the breathing exercises again.", "Mood has been steady this week.", "Could not focus much.",
+)
+
+RECORDS_SHAPE = 1.3     # Pareto shape for extra records per patient; smaller means a heavier tail
+MAX_EXTRA_RECORDS = 300
+NOTES_SHAPE = 1.1
+MAX_NOTES = 500
+
+
+# --- Helpers ---
+def _family_rng(seed, family_index):
+    # String seeds are hashed with SHA-512, so this is stable across runs and platforms
+    return random.Random(f"{seed}:{family_index}")
+
+
+def _heavy_tail(rng, shape, cap, scale=1.0):
+    return min(cap, int((rng.paretovariate(shape) - 1) * scale))
+
+
+def _synonym(rng, code):
+    label, synonyms = VOCABULARY[code]
+    return rng.choice((label,) + tuple(s.capitalize() for s in synonyms[:4]))
+
+
+def _timestamp(rng, as_of, years_back):
+    return as_of - datetime.timedelta(seconds=rng.randrange(int(years_back * 365 * 86400)))
+
+
+def _category(rng):
+    return rng.choices(CATEGORIES, CATEGORY_WEIGHTS)[0]
+
+
+class Person:
+    __slots__ = ("patient_id", "name", "gender", "birth_year", "conditions", "parents", "relationship", "relative_to_id")
+
+    def __init__(self, patient_id, name, gender, birth_year, relationship, relative_to_id, parents=()):
+        self.patient_id, self.name, self.gender, self.birth_year = patient_id, name, gender, birth_year
+        self.relationship, self.relative_to_id, self.parents = relationship, relative_to_id, parents
+        self.conditions = set()
+
+
+# --- Families ---
+def _family_members(rng, family_index, as_of, max_members):
+    """Draws a three-generation family; returns (surname, creator, people)."""
+    surname = rng.choice(SURNAMES)
+    people = []
+
+    def person(gender, birth_year, relationship, relative_to, parents=()):
+        patient_id = f"PAT-S{family_index:07d}{len(people):02d}"
+        relative_to_id = relative_to.patient_id if relative_to else patient_id
+        member = Person(patient_id, f"{rng.choice(FIRST_NAMES[gender])} {surname}", gender, birth_year, relationship, relative_to_id, parents)
+        people.append(member)
+        return member
+
+    grandparent_year = as_of.year - rng.randint(60, 85)
+    parent_year = grandparent_year + rng.randint(22, 35)
+    # The group creator is a member of the middle generation, as in the app where adults create groups
+    creator = person(rng.choice(("Male", "Female")), parent_year, "Self", None)
+    grandfather = person("Male", grandparent_year, "Father", creator)
+    grandmother = person("Female", grandparent_year + rng.randint(-3, 3), "Mother", creator)
+    creator.parents = (grandfather, grandmother)
+    parents = [creator]
+    for _ in range(rng.choices((0, 1, 2, 3), (0.2, 0.4, 0.3, 0.1))[0]):
+        if len(people) >= max_members:
+            break
+        gender = rng.choice(("Male", "Female"))
+        parents.append(person(gender, parent_year + rng.randint(-6, 6), "Brother" if gender == "Male" else "Sister", creator, (grandfather, grandmother)))
+
+    for parent in parents:
+        if len(people) >= max_members:
+            break
+        spouse = None
+        if rng.random() < 0.75:
+            spouse_gender = "Female" if parent.gender == "Male" else "Male"
+            spouse = person(spouse_gender, parent.birth_year + rng.randint(-4, 4), "Wife" if spouse_gender == "Female" else "Husband", parent)
+        for _ in range(rng.choices((0, 1, 2, 3, 4), (0.2, 0.3, 0.3, 0.15, 0.05))[0]):
+            if len(people) >= max_members:
+                break
+            gender = rng.choice(("Male", "Female"))
+            birth_year = min(as_of.year - 1, max(parent.birth_year, spouse.birth_year if spouse else 0) + rng.randint(22, 38))
+            person(gender, birth_year, "Son" if gender == "Male" else "Daughter", parent, (parent, spouse) if spouse else (parent,))
+
+    # Oldest first, so parents' conditions exist before their children inherit them
+    for member in sorted(people[:max_members], key=lambda p: p.birth_year):
+        for parent in member.parents:
+            member.conditions.update(code for code in sorted(parent.conditions) if code in HERITABLE and rng.random() < INHERITANCE_PROBABILITY)
+        age_factor = min(1.5, max(0.2, (as_of.year - member.birth_year) / 50))
+        member.conditions.update(code for code, prevalence, _ in CONDITIONS if rng.random() < prevalence * age_factor)
+    return surname, creator, people[:max_members]
+
+
+# --- Documents ---
+def _patient_documents(rng, member, group_id, ethnicity, as_of, records_scale, doctors):
+    """Yields (path, data) for one patient, their records, notes, assessments and snapshot."""
+    age = as_of.year - member.birth_year
+    patient = {
+        "Name": member.name,
+        "DOB": f"{member.birth_year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "Phno": f"9{rng.randrange(10 ** 9):09d}",
+        "Gender": member.gender,
+        "BloodGroup": rng.choices(BLOOD_GROUPS, BLOOD_GROUP_WEIGHTS)[0],
+        "Ethnicity": ethnicity,
+        "password": PASSWORD,
+        "confidential": rng.random() < 0.05,
+        "family_groups": [group_id],
+    }
+    pid = member.patient_id
+    yield f"patients/{pid}", patient
+
+    records = {collection: {} for collection in SUMMARY_FIELDS}
+    conditions = sorted(member.conditions)
+    is_mother = member.gender == "Female" and 18 <= age <= 45
+    if is_mother:
+        conditions += [code for code, prevalence in PREGNANCY_CONDITIONS if rng.random() < prevalence]
+    years_back = max(1, min(age, 15))
+    extra = _heavy_tail(rng, RECORDS_SHAPE, MAX_EXTRA_RECORDS, records_scale)
+
+    for i, code in enumerate(conditions + [rng.choice(CONDITIONS)[0] for _ in range(extra // 3)]):
+        description = _synonym(rng, code)
+        records["allergies_and_conditions"][f"{pid}-C{i:03d}"] = {
+            "patient_id": pid, "description": description, "condition_code": normalize(description),
+            "category": _category(rng), "timestamp": _timestamp(rng, as_of, years_back),
+        }
+    treatable = [code for code in conditions if code in MEDICATIONS] or ["J30.1"]
+    for i in range(len(treatable) + extra // 2):
+        code = treatable[i] if i < len(treatable) else rng.choice(treatable)
+        condition = _synonym(rng, code)
+        records["prescriptions"][f"{pid}-P{i:03d}"] = {
+            "patient_id": pid, "medication_name": rng.choice(MEDICATIONS.get(code, ("Cetirizine",))), "condition": condition,
+            "condition_code": normalize(condition), "duration": rng.choice(DURATIONS), "timing": rng.choice(TIMINGS),
+            "category": _category(rng), "timestamp": _timestamp(rng, as_of, years_back),
+        }
+    for i in range(extra // 6 + (rng.random() < 0.3)):
+        records["scans"][f"{pid}-S{i:03d}"] = {
+            "patient_id": pid, "body_part": rng.choice(BODY_PARTS), "file_url": f"synthetic://scans/{pid}/scan_{i:03d}.png",
+            "category": _category(rng), "timestamp": _timestamp(rng, as_of, years_back),
+        }
+    for collection, docs in records.items():
+        for doc_id, data in docs.items():
+            yield f"{collection}/{doc_id}", data
+
+    if age >= 12:
+        for i in range(_heavy_tail(rng, NOTES_SHAPE, MAX_NOTES)):
+            note = " ".join(rng.sample(NOTE_FRAGMENTS, rng.randint(1, 4)))
+            yield f"mental_health_notes/{pid}-N{i:04d}", {"patient_id": pid, "note": note, "timestamp": _timestamp(rng, as_of, 3)}
+
+    if is_mother and rng.random() < 0.4:
+        descriptions = [r["description"] for r in records["allergies_and_conditions"].values()]
+        history = maternity_history_flags(descriptions)
+        for i in range(rng.randint(1, 3)):
+            assessment_data = {
+                "age": age, "bmi": round(rng.gauss(25, 4), 1), "blood_pressure": int(rng.gauss(118, 14)),
+                "hemoglobin": round(rng.gauss(12, 1.3), 1), "glucose": int(rng.gauss(95, 18)), "parity": rng.choices((0, 1, 2, 3), (0.4, 0.35, 0.18, 0.07))[0],
+                "education": rng.choice(("Primary", "Secondary", "Graduate", "Postgraduate")), "smoking": rng.choices(("No", "Yes"), (0.9, 0.1))[0],
+                "income": rng.choice(("Low", "Middle", "High")), **history,
+            }
+            predictions = {
+                "risk_gdm": int(assessment_data["glucose"] > 110 or history["history_gdm"] == "Yes"),
+                "risk_preeclampsia": int(assessment_data["blood_pressure"] > 135 or history["history_preeclampsia"] == "Yes"),
+                "risk_anemia": int(assessment_data["hemoglobin"] < 11 or history["history_anemia"] == "Yes"),
+                "risk_preterm_labor": int(history["history_preterm"] == "Yes" or assessment_data["smoking"] == "Yes"),
+            }
+            yield f"maternity_assessments/{pid}-M{i:02d}", {
+                "patient_id": pid, "assessment_date": _timestamp(rng, as_of, 2), "predictions": predictions,
+                "explanations": {}, "assessed_by": rng.choice(doctors), "assessment_data": assessment_data,
+            }
+
+    snapshot = {"profile": profile_of(patient), "complete": True, "updated_at": as_of}
+    for collection, docs in records.items():
+        snapshot[collection] = {doc_id: summarize(collection, data) for doc_id, data in docs.items()}
+    yield f"{SNAPSHOT_COLLECTION}/{pid}", snapshot
+
+
+def generate(patients, seed=DEFAULT_SEED, as_of=DEFAULT_AS_OF, records_scale=1.0, doctors=20):
+    """Yields (document path, data) for a population of exactly `patients` patients."""
+    doctor_names = []
+    for i in range(1, doctors + 1):
+        rng = _family_rng(seed, f"doctor-{i}")
+        name = f"Dr. {rng.choice(FIRST_NAMES[rng.choice(('Male', 'Female'))])} {rng.choice(SURNAMES)}"
+        doctor_names.append(name)
+        yield f"doctors/DOC-S{i:04d}", {"name": name, "password": PASSWORD}
+
+    remaining, family_index = patients, 0
+    while remaining > 0:
+        rng = _family_rng(seed, family_index)
+        surname, creator, people = _family_members(rng, family_index, as_of, remaining)
+        group_id = f"FAM-S{family_index:07d}"
+        created_at = _timestamp(rng, as_of, 5)
+        yield f"family_groups/{group_id}", {"group_name": f"{surname} Family", "creator_id": creator.patient_id, "created_at": created_at}
+        ethnicity = rng.choice(ETHNICITIES)
+        for member in people:
+            yield f"family_groups/{group_id}/members/{member.patient_id}", {
+                "name": member.name, "relationship": member.relationship, "relative_to_id": member.relative_to_id, "added_at": created_at,
+            }
+            yield from _patient_documents(rng, member, group_id, ethnicity, as_of, records_scale, doctor_names or ["Unknown Doctor"])
+        remaining -= len(people)
+        family_index += 1
+
+
+# --- Output ---
+def _json_default(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def write_ndjson(documents, out):
+    """Writes documents in bulk_load.py's NDJSON format (`_path` plus fields)."""
+    count = 0
+    for path, data in documents:
+        out.write(json.dumps({"_path": path, **data}, default=_json_default, separators=(",", ":")))
+        out.write("\n")
+        count += 1
+    return count
+
+
+def write_store(documents, db, workers=4):
+    """Writes documents into a store (e.g. the local SQLite store) in parallel batches."""
+    from bulk_load import BatchedLoader
+    loader = BatchedLoader(db, workers)
+    count = 0
+    for path, data in documents:
+        loader.set(path, data)
+        count += 1
+    loader.close()
+    if loader.failed:
+        raise RuntimeError(f"{len(loader.failed)} documents failed to write, e.g. {loader.failed[0]}")
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic patient population.")
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--seed", default=DEFAULT_SEED)
+    parser.add_argument("--as-of", default=DEFAULT_AS_OF.date().isoformat(), help="Reference date; record timestamps fall before it.")
+    parser.add_argument("--records-scale", type=float, default=1.0, help="Multiplier for per-patient record and scan counts.")
+    parser.add_argument("--doctors", type=int, default=20)
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument("--ndjson", help="Write bulk_load.py input to this file ('-' for stdout).")
+    output.add_argument("--sqlite", nargs="?", const="", help="Write into the local SQLite store (default: the configured path).")
+    args = parser.parse_args()
+
+    as_of = datetime.datetime.fromisoformat(args.as_of).replace(tzinfo=datetime.timezone.utc)
+    documents = generate(args.patients, seed=args.seed, as_of=as_of, records_scale=args.records_scale, doctors=args.doctors)
+    started = time.perf_counter()
+    if args.ndjson is not None:
+        if args.ndjson == "-":
+            count = write_ndjson(documents, sys.stdout)
+        else:
+            with open(args.ndjson, "w", encoding="utf-8") as out:
+                count = write_ndjson(documents, out)
+    else:
+        from datastore import sqlite_path
+        from sqlite_store import SQLiteClient
+        count = write_store(documents, SQLiteClient(args.sqlite or sqlite_path()))
+    elapsed = time.perf_counter() - started
+    print(f"Generated {count:,} documents for {args.patients:,} patients in {elapsed:.1f}s", file=sys.stderr)
@@ -0,0 +1,45 @@
+import pytest
+
+from condition_vocabulary import maternity_history_flags, normalize, normalize_all
+
+
+@pytest.mark.parametrize("text, code", [
+    ("Diabetes", "E11"),
+    ("Type 2 diabetes", "E11"),
+    ("diabetes type 1", "E10"),
+    ("Diabetes mellitus type 1", "E10"),
+    ("H/O GDM", "O24.4"),
+    ("pre-eclampsia in 2021", "O14"),
+    ("hypertensoin", "I10"),
+    ("allergic to latex", "Z91.048"),
+])
+def test_normalize(text, code):
+    assert normalize(text) == code
+
+
+@pytest.mark.parametrize("text", [
+    "No history of GDM",
+    "denies preeclampsia",
+    "Mother had preeclampsia",
+    "Family history of diabetes",
+    "Sugar-free diet",
+    "Latex gloves rash",
+    "Dust on shelves",
+])
+def test_negated_relative_and_generic_mentions_are_not_coded(text):
+    assert normalize_all(text) == ()
+
+
+def test_negation_is_scoped_to_its_clause():
+    assert normalize_all("Type 2 diabetes, no hypertension") == ("E11",)
+    assert normalize_all("k/c/o HTN, DM") == ("I10", "E11")
+    assert normalize_all("Mother: diabetes. Patient: asthma") == ("J45",)
+
+
+def test_maternity_history_flags():
+    flags = maternity_history_flags(["No history of GDM", "Mother had preeclampsia"])
+    assert flags["history_gdm"] == "No"
+    assert flags["history_preeclampsia"] == "No"
+    flags = maternity_history_flags(["GDM in last pregnancy", "Anaemia"])
+    assert flags["history_gdm"] == "Yes" and flags["history_anemia"] == "Yes"
+    assert flags["history_preeclampsia"] == "No"
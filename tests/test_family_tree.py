@@ -0,0 +1,75 @@
+from family_tree import FamilyTree, parse_relationship
+
+
+def build(*members):
+    tree = FamilyTree()
+    for member_id, relationship, relative_to_id in members:
+        tree._add_member("g", member_id, relationship, relative_to_id)
+    return tree
+
+
+def degrees(tree, patient_id):
+    return {rid: kin.degree for rid, kin in tree.relatives(patient_id).items()}
+
+
+def test_parse_single_terms():
+    assert parse_relationship("Mother") == ("blood", 1, 0, False)
+    assert parse_relationship("half-sister") == ("blood", 1, 1, True)
+    assert parse_relationship("great grandmother") == ("blood", 3, 0, False)
+    assert parse_relationship("second cousin") == ("blood", 3, 3, False)
+    assert parse_relationship("Wife") == ("spouse",)
+    assert parse_relationship("Neighbour") is None
+
+
+def test_parse_possessive_chains():
+    assert parse_relationship("mother's sister") == ("blood", 2, 1, False)
+    assert parse_relationship("sister's son") == ("blood", 1, 2, False)
+    assert parse_relationship("father's half-brother") == ("blood", 2, 1, True)
+
+
+def test_parse_non_genetic():
+    assert parse_relationship("mother in law") == ("other",)
+    assert parse_relationship("step-father") == ("other",)
+    assert parse_relationship("brother's wife") == ("other",)
+    assert parse_relationship("son's mother") == ("other",)
+
+
+def test_child_in_laws_are_not_blood_relatives():
+    # C is P's son; M is C's mother and G her father, neither related to P by blood
+    tree = build(("C", "Son", "P"), ("M", "Mother", "C"), ("G", "Father", "M"))
+    assert degrees(tree, "P") == {"C": 1}
+    assert degrees(tree, "C") == {"P": 1, "M": 1, "G": 2}
+
+
+def test_spouse_is_not_a_blood_relative():
+    tree = build(("W", "Wife", "P"), ("C", "Son", "P"))
+    assert tree.spouses("P") == {"W"}
+    assert degrees(tree, "P") == {"C": 1}
+    assert degrees(tree, "W") == {}
+
+
+def test_sibling_spouse_and_their_parents_are_excluded():
+    tree = build(("B", "Brother", "P"), ("X", "Wife", "B"), ("Y", "Mother", "X"), ("N", "Son", "B"))
+    assert degrees(tree, "P") == {"B": 1, "N": 2}
+
+
+def test_half_siblings():
+    tree = build(("F", "Father", "P"), ("H", "Son", "F"), ("S", "Half-sister", "P"))
+    relatives = tree.relatives("P")
+    assert (relatives["H"].up, relatives["H"].down) == (1, 1)
+    assert relatives["S"].half and relatives["S"].degree == 2
+    # A half-sibling's mother is not the patient's parent
+    tree = build(("S", "Half-sister", "P"), ("M", "Mother", "S"))
+    assert "M" not in tree.relatives("P")
+
+
+def test_aunt_via_parent_and_cousin():
+    tree = build(("M", "Mother", "P"), ("A", "Sister", "M"), ("K", "Daughter", "A"))
+    assert degrees(tree, "P") == {"M": 1, "A": 2, "K": 3}
+    assert tree.relatives("P")["K"].label == "first cousin"
+
+
+def test_in_law_text_adds_no_edge():
+    tree = build(("L", "Mother in law", "P"))
+    assert degrees(tree, "P") == {}
+    assert degrees(tree, "L") == {}
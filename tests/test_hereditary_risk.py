@@ -0,0 +1,72 @@
+import hereditary_risk
+from family_tree import FamilyTree
+from hereditary_risk import UNSPECIFIED_RELATIVE_WEIGHT, score_conditions
+
+
+def weights_for(monkeypatch, members, patient_id="P"):
+    tree = FamilyTree()
+    for member_id, relationship, relative_to_id in members:
+        tree._add_member("g", member_id, relationship, relative_to_id)
+    monkeypatch.setattr(hereditary_risk, "get_family_tree", lambda db: tree)
+    return hereditary_risk._relative_weights(None, patient_id, ["g"])
+
+
+def test_spouse_and_in_laws_get_no_weight(monkeypatch):
+    weights = weights_for(monkeypatch, [
+        ("P", "Self", "P"),
+        ("W", "Wife", "P"),
+        ("C", "Son", "P"),
+        ("G", "Father", "W"),
+        ("L", "Mother in law", "P"),
+        ("M", "Mother", "C"),
+    ])
+    assert weights == {"C": (0.5, 1)}
+
+
+def test_blood_relatives_weighted_by_kinship(monkeypatch):
+    weights = weights_for(monkeypatch, [
+        ("F", "Father", "P"),
+        ("A", "Sister", "F"),
+        ("H", "Half-brother", "P"),
+        ("U", "Neighbour", "P"),
+    ])
+    assert weights["F"] == (0.5, 1)
+    assert weights["A"] == (0.25, 2)
+    assert weights["H"] == (0.25, 2)
+    # An unrecognized relationship falls back to the unspecified weight
+    assert weights["U"] == (UNSPECIFIED_RELATIVE_WEIGHT, None)
+
+
+def test_score_conditions_weights_closer_relatives_higher():
+    scores = score_conditions(
+        {"F": (0.5, 1), "A": (0.25, 2)},
+        {"F": ["Diabetes"], "A": ["Asthma", "Diabetes"]},
+    )
+    assert [s["condition"] for s in scores] == ["Diabetes", "Asthma"]
+    assert scores[0]["score"] == 1.0 and scores[0]["closest_degree"] == 1
+    assert scores[1]["relatives_affected"] == 1 and scores[1]["closest_degree"] == 2
+
+
+def test_fetch_overlapping_a_condition_change_is_not_cached(monkeypatch):
+    stored = {"F": ["Asthma"]}
+    calls = []
+
+    def fetch(db, patient_ids):
+        calls.append(list(patient_ids))
+        result = {rid: list(stored[rid]) for rid in patient_ids}
+        if len(calls) == 1:
+            # The relative's conditions change while the first fetch is in flight
+            stored["F"] = ["Asthma", "Diabetes"]
+            hereditary_risk.mark_conditions_changed("F")
+        return result, None, None
+
+    monkeypatch.setattr(hereditary_risk, "fetch_conditions_by_patient", fetch)
+    weights_for(monkeypatch, [("F", "Father", "R")], patient_id="R")
+    first = hereditary_risk.get_hereditary_risk(None, "R", ["g"])
+    second = hereditary_risk.get_hereditary_risk(None, "R", ["g"])
+    assert [s["condition"] for s in first] == ["Asthma"]
+    assert sorted(s["condition"] for s in second) == ["Asthma", "Diabetes"]
+    assert len(calls) == 2
+    # Nothing changed since, so the scores come from the cache
+    hereditary_risk.get_hereditary_risk(None, "R", ["g"])
+    assert len(calls) == 2
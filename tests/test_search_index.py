@@ -0,0 +1,44 @@
+from search_index import SearchIndex
+
+
+def make_index():
+    index = SearchIndex(":memory:")
+    index.put_many([
+        ("patients", "P1", "P1", "Asha Rao", ""),
+        ("patients", "P2", "P2", "Ravi Rao", ""),
+        ("allergies_and_conditions", "A1", "P1", "Asthma", "Green"),
+        ("allergies_and_conditions", "A2", "P1", "Asthma attack", "Red"),
+        ("allergies_and_conditions", "A3", "P2", "Asthma", "Yellow"),
+        ("mental_health_notes", "N1", "P1", "asthma worries", ""),
+    ])
+    return index
+
+
+def hit_ids(hits):
+    return sorted(hit["doc_id"] for hit in hits)
+
+
+def test_cross_patient_search_hides_red_and_private_records():
+    index = make_index()
+    assert hit_ids(index.search("asthma")) == ["A1", "A3"]
+
+
+def test_scoped_search_includes_own_red_and_private_records():
+    index = make_index()
+    assert hit_ids(index.search("asthma", patient_id="P1", include_private=True)) == ["A1", "A2", "N1"]
+
+
+def test_confidential_patients_only_match_by_name():
+    index = make_index()
+    index.set_confidential(["P2"], True)
+    assert hit_ids(index.search("asthma")) == ["A1"]
+    assert hit_ids(index.search("rao")) == ["P1", "P2"]
+    index.set_confidential(["P2"], False)
+    assert hit_ids(index.search("asthma")) == ["A1", "A3"]
+
+
+def test_category_is_kept_when_text_is_reindexed():
+    index = make_index()
+    index.set_category("allergies_and_conditions", "A1", "Red")
+    index.put("allergies_and_conditions", "A1", "P1", "Asthma, mild")
+    assert hit_ids(index.search("asthma")) == ["A3"]
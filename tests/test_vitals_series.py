@@ -0,0 +1,18 @@
+import pytest
+
+from vitals_series import parse_value
+
+
+@pytest.mark.parametrize("value, expected", [
+    (68, 68.0),
+    (36.6, 36.6),
+    ("68 kg", 68.0),
+    ("36,8", 36.8),
+    (" 120 ", 120.0),
+    ("n/a", None),
+    ("", None),
+    (None, None),
+    (True, None),
+])
+def test_parse_value(value, expected):
+    assert parse_value(value) == expected
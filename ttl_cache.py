@@ -0,0 +1,44 @@
+# ttl_cache.py
+import threading
+import time
+
+DEFAULT_TTL_SECONDS = 300
+MAX_CACHED_PATIENTS = 2048
+
+
+class TTLCache:
+    """A small thread-safe cache whose entries expire `ttl` seconds after they are stored."""
+
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS, max_entries=MAX_CACHED_PATIENTS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            if len(self._data) >= self.max_entries and key not in self._data:
+                # Evict the entry closest to expiry
+                del self._data[min(self._data, key=lambda k: self._data[k][0])]
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, predicate):
+        """Drops every key for which predicate(key) is true."""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,238 @@
+# vitals_series.py
+"""
+Append-only per-patient time series for vitals and lab values.
+
+    vitals_series/{patient_id}                               {"latest": {measure: {"value", "at"}}, "updated_at"}
+    vitals_series/{patient_id}/chunks/{measure}_{YYYY-MM}    {"measure", "period", "t": [timestamps], "v": [values]}
+    vitals_series/{patient_id}/rollups/{measure}_day_{YYYY}  {"measure", "resolution", "buckets": {"YYYY-MM-DD": {"n", "sum", "min", "max"}}}
+    vitals_series/{patient_id}/rollups/{measure}_week        {"measure", "resolution", "buckets": {"YYYY-Www": {...}}}
+
+Readings are stored columnar, one chunk document per measure and month, with timestamps and
+values in parallel sorted arrays; a range query reads only the chunks it overlaps, in one
+round trip. Each append updates the chunk, the day and week rollups and the latest value in one
+transaction, so charts over long ranges read precomputed buckets instead of raw points and the
+latest values of every measure cost a single (cached) document read.
+"""
+import datetime
+import re
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+from google.cloud import firestore
+
+from datastore import transactional
+from ttl_cache import TTLCache
+
+SERIES_COLLECTION = "vitals_series"
+# measure: (label, unit)
+MEASURES = {
+    "systolic_bp": ("Systolic blood pressure", "mmHg"),
+    "diastolic_bp": ("Diastolic blood pressure", "mmHg"),
+    "heart_rate": ("Heart rate", "bpm"),
+    "glucose": ("Blood glucose", "mg/dL"),
+    "hemoglobin": ("Hemoglobin", "g/dL"),
+    "weight_kg": ("Weight", "kg"),
+    "bmi": ("BMI", "kg/m²"),
+    "temperature_c": ("Temperature", "°C"),
+    "spo2": ("Oxygen saturation", "%"),
+}
+_NUMBER = re.compile(r"[-+]?\d+(?:[.,]\d+)?")
+# Firestore documents are limited to 1 MiB; a month of one measure stays far below it at this cap
+MAX_POINTS_PER_CHUNK = 10000
+RAW_MAX_DAYS = 31
+DAY_ROLLUP_MAX_DAYS = 730
+LATEST_TTL_SECONDS = 300
+
+_latest_cache = TTLCache(ttl=LATEST_TTL_SECONDS)
+
+
+# --- Keys ---
+def _utc(at):
+    if at is None:
+        return datetime.datetime.now(datetime.timezone.utc)
+    return at if at.tzinfo else at.replace(tzinfo=datetime.timezone.utc)
+
+
+def _series_ref(db, patient_id):
+    return db.collection(SERIES_COLLECTION).document(patient_id)
+
+
+def _chunk_id(measure, at):
+    return f"{measure}_{at:%Y-%m}"
+
+
+def _day_rollup_id(measure, year):
+    return f"{measure}_day_{year}"
+
+
+def _week_rollup_id(measure):
+    return f"{measure}_week"
+
+
+def _week_key(at):
+    year, week, _ = at.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def _months(start, end):
+    month = datetime.datetime(start.year, start.month, 1, tzinfo=datetime.timezone.utc)
+    while month <= end:
+        yield month
+        month = datetime.datetime(month.year + month.month // 12, month.month % 12 + 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _add_to_bucket(buckets, key, value):
+    bucket = buckets.get(key)
+    if bucket is None:
+        buckets[key] = {"n": 1, "sum": value, "min": value, "max": value}
+    else:
+        bucket["n"] += 1
+        bucket["sum"] += value
+        bucket["min"] = min(bucket["min"], value)
+        bucket["max"] = max(bucket["max"], value)
+
+
+# --- Writes ---
+@transactional
+def _append_in_transaction(transaction, db, patient_id, readings):
+    series_ref = _series_ref(db, patient_id)
+    chunks_ref, rollups_ref = series_ref.collection("chunks"), series_ref.collection("rollups")
+    by_chunk, by_rollup = defaultdict(list), defaultdict(list)
+    for measure, at, value in readings:
+        by_chunk[_chunk_id(measure, at)].append((at, value))
+        by_rollup[(_day_rollup_id(measure, at.year), measure, "day")].append((at.date().isoformat(), value))
+        by_rollup[(_week_rollup_id(measure), measure, "week")].append((_week_key(at), value))
+
+    refs = [series_ref] + [chunks_ref.document(c) for c in by_chunk] + [rollups_ref.document(r) for r, _, _ in by_rollup]
+    existing = {snap.reference.path: (snap.to_dict() if snap.exists else None) for snap in db.get_all(refs, transaction=transaction)}
+
+    for chunk_id, points in by_chunk.items():
+        ref = chunks_ref.document(chunk_id)
+        chunk = existing.get(ref.path) or {"measure": chunk_id.rsplit("_", 1)[0], "period": chunk_id.rsplit("_", 1)[1], "t": [], "v": []}
+        times, values = [_utc(t) for t in chunk["t"]], list(chunk["v"])
+        for at, value in sorted(points):
+            # Late readings are inserted in order, after any reading with the same timestamp
+            index = bisect_right(times, at)
+            times.insert(index, at)
+            values.insert(index, value)
+        if len(times) > MAX_POINTS_PER_CHUNK:
+            raise ValueError(f"{chunk_id} would exceed {MAX_POINTS_PER_CHUNK} readings")
+        transaction.set(ref, {**chunk, "t": times, "v": values, "count": len(times)})
+
+    for (rollup_id, measure, resolution), points in by_rollup.items():
+        ref = rollups_ref.document(rollup_id)
+        rollup = existing.get(ref.path) or {"measure": measure, "resolution": resolution, "buckets": {}}
+        buckets = dict(rollup["buckets"])
+        for key, value in points:
+            _add_to_bucket(buckets, key, value)
+        transaction.set(ref, {**rollup, "buckets": buckets})
+
+    latest = dict((existing.get(series_ref.path) or {}).get("latest", {}))
+    for measure, at, value in readings:
+        current = latest.get(measure)
+        if current is None or _utc(current["at"]) <= at:
+            latest[measure] = {"value": value, "at": at}
+    transaction.set(series_ref, {"latest": latest, "updated_at": firestore.SERVER_TIMESTAMP}, merge=True)
+
+
+def append(db, patient_id, readings):
+    """
+    Appends readings [(measure, at, value), ...] for one patient atomically. `at` may be None (now);
+    naive datetimes are taken as UTC. Readings may arrive out of order.
+    """
+    normalized = []
+    for measure, at, value in readings:
+        if measure not in MEASURES:
+            raise ValueError(f"Unknown measure {measure!r}; expected one of {', '.join(MEASURES)}")
+        if value is not None:
+            normalized.append((measure, _utc(at), float(value)))
+    if not normalized:
+        return 0
+    _append_in_transaction(db.transaction(), db, patient_id, normalized)
+    _latest_cache.invalidate(lambda key: key == patient_id)
+    return len(normalized)
+
+
+def record(db, patient_id, values, at=None):
+    """Appends one reading per measure in `values` ({measure: value}) taken at `at` (default now)."""
+    return append(db, patient_id, [(measure, at, value) for measure, value in values.items()])
+
+
+def parse_value(value):
+    """Returns a reading given as a number or text ("68 kg", "36,8") as a float, or None if it holds no number."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER.search(str(value))
+    return float(match.group().replace(",", ".")) if match else None
+
+
+# --- Reads ---
+def latest(db, patient_id):
+    """Returns {measure: {"value", "at"}} with the most recent reading of each measure (one cached read)."""
+    cached = _latest_cache.get(patient_id)
+    if cached is None:
+        doc = _series_ref(db, patient_id).get()
+        cached = (doc.to_dict() or {}).get("latest", {}) if doc.exists else {}
+        _latest_cache.set(patient_id, cached)
+    return cached
+
+
+def series(db, patient_id, measure, start, end=None):
+    """Returns {"t": [...], "v": [...]} of raw readings with start <= t <= end, from the overlapping month chunks."""
+    start, end = _utc(start), _utc(end)
+    chunks_ref = _series_ref(db, patient_id).collection("chunks")
+    refs = [chunks_ref.document(_chunk_id(measure, month)) for month in _months(start, end)]
+    times, values = [], []
+    chunks = sorted((snap.to_dict() for snap in db.get_all(refs) if snap.exists), key=lambda chunk: chunk["period"])
+    for chunk in chunks:
+        chunk_times = [_utc(t) for t in chunk["t"]]
+        lo, hi = bisect_left(chunk_times, start), bisect_right(chunk_times, end)
+        times.extend(chunk_times[lo:hi])
+        values.extend(chunk["v"][lo:hi])
+    return {"t": times, "v": values}
+
+
+def rollup(db, patient_id, measure, resolution, start, end=None):
+    """Returns [{"bucket", "mean", "min", "max", "n"}, ...] at "day" or "week" resolution for the range."""
+    start, end = _utc(start), _utc(end)
+    rollups_ref = _series_ref(db, patient_id).collection("rollups")
+    if resolution == "day":
+        refs = [rollups_ref.document(_day_rollup_id(measure, year)) for year in range(start.year, end.year + 1)]
+        first, last = start.date().isoformat(), end.date().isoformat()
+    elif resolution == "week":
+        refs = [rollups_ref.document(_week_rollup_id(measure))]
+        first, last = _week_key(start), _week_key(end)
+    else:
+        raise ValueError(f"Unknown resolution {resolution!r}")
+    buckets = {}
+    for snap in db.get_all(refs):
+        if snap.exists:
+            buckets.update(snap.to_dict()["buckets"])
+    return [{"bucket": key, "mean": b["sum"] / b["n"], "min": b["min"], "max": b["max"], "n": b["n"]}
+            for key, b in sorted(buckets.items()) if first <= key <= last]
+
+
+def chart_series(db, patient_id, measure, start, end=None):
+    """
+    Returns (resolution, rows) for charting a range: raw readings for up to a month, daily
+    rollups up to two years, weekly rollups beyond. Rows are {"at", "value"} (raw) or rollup rows.
+    """
+    start, end = _utc(start), _utc(end)
+    span_days = (end - start).days
+    if span_days <= RAW_MAX_DAYS:
+        raw = series(db, patient_id, measure, start, end)
+        return "raw", [{"at": t, "value": v} for t, v in zip(raw["t"], raw["v"])]
+    resolution = "day" if span_days <= DAY_ROLLUP_MAX_DAYS else "week"
+    return resolution, rollup(db, patient_id, measure, resolution, start, end)
+
+
+# --- Maternity model features ---
+MATERNITY_FEATURES = {"bmi": "bmi", "blood_pressure": "systolic_bp", "hemoglobin": "hemoglobin", "glucose": "glucose"}
+
+
+def maternity_features(db, patient_id):
+    """Returns the maternity model's vitals features that the patient has readings for, from the latest values."""
+    values = latest(db, patient_id)
+    return {feature: values[measure]["value"] for feature, measure in MATERNITY_FEATURES.items() if measure in values}